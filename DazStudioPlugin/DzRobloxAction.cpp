@@ -988,9 +988,10 @@ Do you want to switch to a compatible Tool mode now?"), QMessageBox::Yes, QMessa
 		bool bUseFallbackScriptFolder = true;
 		QStringList aOverrideFilenameList = (QStringList() << "blender_tools.py" << "NodeArrange.py" << 
 			"blender_dtu_to_roblox_blend.py" << "blender_dtu_to_avatar_autosetup.py" <<
-			"blender_dtu_to_r15_accessories.py" <<
+			"blender_dtu_to_r15_accessories.py" << "blender_roblox_worker.py" << "blender_batch_convert.py" << "blender_accessory_item_worker.py" <<
 			"roblox_tools.py" << "Daz_Cage_Att_Template.blend" <<
-			"game_readiness_tools.py" << "game_readiness_roblox_data.py" <<
+			"game_readiness_tools.py" << "vertex_index_store.py" << "image_buffer_tools.py" << "log_tools.py" << "pipeline_cache.py" << "texture_tools.py" <<
+			"game_readiness_roblox_data.bin" << "game_readiness_roblox_data_index.json" <<
 			"Genesis9facs50.blend"
 			);
 		if (bUseFallbackScriptFolder)
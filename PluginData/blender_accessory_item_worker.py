@@ -0,0 +1,119 @@
+"""Blender Accessory Item Worker
+
+This is a command-line script started by blender_dtu_to_r15_accessories.py (parallel_item_jobs) to
+process one layered accessory item in its own Blender process: cage fitting, hidden surface removal
+and decimation.  The item .blend file is written by process_layered_items_parallel() and contains the
+item, the cage template and the objects they depend on.
+
+The result file (.npz) contains:
+    outer_cage_coords       fitted vertex coordinates of the outer cage
+    kept_faces              original indices of the item faces kept by hidden surface removal
+    decimation_ratio        ratio of the item's Decimate modifier
+
+USAGE: blender.exe --background --factory-startup --python blender_accessory_item_worker.py -- <item blend> <object name> <result npz> <hidden surface removal 0|1>
+
+"""
+
+# replaced by a log file next to the item .blend file, items run concurrently
+logFilename = "blender_accessory_item_worker.log"
+
+## Do not modify below
+def _print_usage():
+    print("\nUSAGE: blender.exe --background --factory-startup --python blender_accessory_item_worker.py -- <item blend> <object name> <result npz> <hidden surface removal 0|1>\n")
+
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+import sys
+import os
+try:
+    import bpy
+    import numpy as np
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import log_tools
+    import blender_tools
+    import game_readiness_tools
+    import blender_dtu_to_r15_accessories
+except:
+    sys.path.append(script_dir)
+    import log_tools
+    import blender_tools
+    import game_readiness_tools
+    import blender_dtu_to_r15_accessories
+blender_tools.logFilename = logFilename
+log_tools.default_log_filename = logFilename
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage, logFilename)
+
+# one log file per item: <item blend>_worker.log
+def set_item_log_filename(item_blend_path):
+    global logFilename
+    logFilename = os.path.splitext(item_blend_path)[0] + "_worker.log"
+    blender_tools.logFilename = logFilename
+    log_tools.default_log_filename = logFilename
+
+
+# append all objects of the item .blend file to the scene, returns {original name: object}
+def load_item_blend(item_blend_path):
+    with bpy.data.libraries.load(item_blend_path, link=False) as (data_from, data_to):
+        object_names = list(data_from.objects)
+        data_to.objects = object_names
+    loaded_objects = {}
+    for obj_name, obj in zip(object_names, data_to.objects):
+        if obj is None:
+            continue
+        bpy.context.scene.collection.objects.link(obj)
+        loaded_objects[obj_name] = obj
+    return loaded_objects
+
+def _main(argv):
+    try:
+        item_blend_path, obj_name, result_path, hidden_surface_removal = argv[:4]
+    except ValueError:
+        _print_usage()
+        exit(1)
+        return
+    set_item_log_filename(item_blend_path)
+    _add_to_log("Starting script (accessory item)...\nDEBUG: sys.argv=" + str(sys.argv))
+    hidden_surface_removal = hidden_surface_removal not in ("", "0")
+
+    blender_tools.delete_all_items()
+    loaded_objects = load_item_blend(item_blend_path)
+    obj = loaded_objects.get(obj_name)
+    if obj is None or "Template_InnerCage" not in bpy.data.objects:
+        _add_to_log("ERROR: main(): item or cage template not found in: " + item_blend_path)
+        exit(1)
+        return
+    # the item keeps its name, cages are named after it
+    obj.name = obj_name
+
+    # original index of every face, to find the faces kept by hidden surface removal
+    mesh = obj.data
+    face_index_attribute = mesh.attributes.new("item_face_index", 'INT', 'FACE')
+    face_index_attribute.data.foreach_set("value", np.arange(len(mesh.polygons), dtype=np.int32))
+
+    inner_cage, outer_cage, decimation_ratio = blender_dtu_to_r15_accessories.process_layered_item(obj, hidden_surface_removal)
+
+    kept_faces = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.attributes["item_face_index"].data.foreach_get("value", kept_faces)
+    mesh.attributes.remove(mesh.attributes["item_face_index"])
+
+    # write to a temporary file first, the parent process only reads complete results
+    temp_path = result_path[:-4] + ".tmp.npz"
+    np.savez(temp_path,
+             outer_cage_coords=game_readiness_tools.get_vertex_coordinates_array(outer_cage.data),
+             kept_faces=kept_faces,
+             decimation_ratio=np.array(decimation_ratio))
+    os.replace(temp_path, result_path)
+    _add_to_log(f"DEBUG: main(): {obj_name}: kept {len(kept_faces)} faces, decimation ratio: {decimation_ratio:.4f}")
+
+
+# Execute main()
+if __name__=='__main__':
+    _main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    _add_to_log("Script completed.\n")
+    exit(0)
@@ -0,0 +1,315 @@
+"""Batch Convert DTU/FBX Exports to Roblox
+
+This is a command-line script (standard Python, not run inside Blender) that finds
+every exported .fbx/.dtu pair in a folder or manifest and runs the Roblox conversion
+scripts for each one with a pool of Blender processes.
+
+- The conversions of one export run in order (R15, S1, accessories) and stop at the
+  first failure, same as DzRobloxAction with the "ALL" asset type.  Different exports
+  run in parallel.
+- By default the scripts are chosen from the "Asset Type" of the DTU file, this can
+  be overridden with --scripts or per item in the manifest.
+- Each Blender run has a timeout and is retried on failure.
+- With --persistent, each pool slot keeps one blender_roblox_worker.py process
+  running instead of starting Blender for every conversion.
+- A summary JSON with outputs, durations and failures is written at the end.
+
+Manifest format (JSON):
+    [ "C:/Exports/Amelia/Amelia.fbx",
+      {"fbx": "C:/Exports/Victoria/Victoria.fbx", "scripts": ["r15", "accessories"]} ]
+
+USAGE: python blender_batch_convert.py --blender <blender executable> [--jobs N] [--timeout <seconds>]
+           [--retries N] [--scripts r15,s1,accessories] [--persistent] [--summary <json file>] <folder or manifest>
+
+EXAMPLE:
+
+    python blender_batch_convert.py --blender C:/Blender3.6/blender.exe --jobs 4 C:/Users/dbui/Documents/DazToRoblox
+
+"""
+
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(script_dir)
+import blender_roblox_worker
+import log_tools
+
+logFilename = "blender_batch_convert.log"
+
+PYTHON_EXCEPTION_EXIT_CODE = 11
+
+script_filenames = {
+    "r15": "blender_dtu_to_roblox_blend.py",
+    "s1": "blender_dtu_to_avatar_autosetup.py",
+    "accessories": "blender_dtu_to_r15_accessories.py",
+}
+script_order = ["r15", "s1", "accessories"]
+
+log_lock = threading.Lock()
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage, logFilename)
+
+
+def read_dtu(dtu_path):
+    try:
+        with open(dtu_path, "r") as file:
+            return json.load(file)
+    except Exception as e:
+        _add_to_log("ERROR: read_dtu(): unable to read " + dtu_path + ": " + str(e))
+        return {}
+
+# same script selection as DzRobloxAction for the DTU "Asset Type"
+def get_scripts_for_asset_type(asset_type):
+    if asset_type is None or asset_type == "ALL":
+        return list(script_order)
+    if "R15" in asset_type:
+        return ["r15"]
+    if "S1" in asset_type:
+        return ["s1"]
+    if "layered" in asset_type or "rigid" in asset_type:
+        return ["accessories"]
+    return list(script_order)
+
+# every .fbx with a .dtu of the same name, intermediate and output files have no .dtu
+def discover_exports(folder):
+    fbx_list = []
+    for root, dirs, files in os.walk(folder):
+        for file_name in sorted(files):
+            if file_name.lower().endswith(".fbx"):
+                fbx_path = os.path.join(root, file_name).replace("\\","/")
+                if os.path.exists(fbx_path[:-4] + ".dtu"):
+                    fbx_list.append({"fbx": fbx_path})
+    return fbx_list
+
+def read_manifest(manifest_path):
+    with open(manifest_path, "r") as file:
+        manifest = json.load(file)
+    base_folder = os.path.dirname(os.path.abspath(manifest_path))
+    item_list = []
+    for item in manifest:
+        if isinstance(item, str):
+            item = {"fbx": item}
+        item["fbx"] = os.path.join(base_folder, item["fbx"]).replace("\\","/")
+        item_list.append(item)
+    return item_list
+
+
+# files in folder starting with name_prefix, created or modified since start_time
+def find_new_files(folder, name_prefix, start_time):
+    new_files = []
+    if not folder or not os.path.isdir(folder):
+        return new_files
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.startswith(name_prefix):
+            continue
+        file_path = os.path.join(folder, file_name).replace("\\","/")
+        if os.path.isfile(file_path) and os.path.getmtime(file_path) >= start_time - 1.0:
+            new_files.append(file_path)
+    return new_files
+
+
+class BlenderRunner:
+    def __init__(self, blender_path, timeout=None, persistent=False, queue_folder=None):
+        self.blender_path = blender_path
+        self.timeout = timeout
+        self.persistent = persistent
+        self.queue_folder = queue_folder
+        self.worker_process = None
+
+    # run one conversion, returns (status, exit_code, error)
+    def run(self, script, fbx_path, log_path):
+        if self.persistent:
+            return self.run_in_worker(script, fbx_path, log_path)
+        command = [self.blender_path, "--background", "--python-exit-code", str(PYTHON_EXCEPTION_EXIT_CODE),
+                   "--python", os.path.join(script_dir, script_filenames[script]), fbx_path]
+        with open(log_path, "a") as log_file:
+            try:
+                process = subprocess.run(command, cwd=os.path.dirname(fbx_path), stdout=log_file,
+                                         stderr=subprocess.STDOUT, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                return "timeout", None, f"timed out after {self.timeout} seconds"
+            except OSError as e:
+                return "failed", None, str(e)
+        if process.returncode != 0:
+            return "failed", process.returncode, f"blender exit code {process.returncode}"
+        return "completed", 0, None
+
+    # the worker's own output goes to <queue folder>/worker.log, each job's output to the job's log_path
+    def start_worker(self):
+        os.makedirs(self.queue_folder, exist_ok=True)
+        shutdown_path = os.path.join(self.queue_folder, blender_roblox_worker.SHUTDOWN_FILENAME)
+        if os.path.exists(shutdown_path):
+            os.remove(shutdown_path)
+        # jobs left by a killed or crashed worker would run again before the next job
+        for file_name in os.listdir(self.queue_folder):
+            if file_name.endswith(blender_roblox_worker.JOB_POSTFIX) or file_name.endswith(blender_roblox_worker.RUNNING_POSTFIX):
+                os.remove(os.path.join(self.queue_folder, file_name))
+        command = [self.blender_path, "--background", "--python",
+                   os.path.join(script_dir, "blender_roblox_worker.py"), "--", self.queue_folder]
+        self.worker_log = open(os.path.join(self.queue_folder, "worker.log"), "a")
+        self.worker_process = subprocess.Popen(command, cwd=self.queue_folder, stdout=self.worker_log,
+                                               stderr=subprocess.STDOUT)
+
+    def stop_worker(self, force=False):
+        if self.worker_process is None:
+            return
+        if force:
+            self.worker_process.kill()
+        else:
+            blender_roblox_worker.request_shutdown(self.queue_folder)
+        try:
+            self.worker_process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.worker_process.kill()
+            self.worker_process.wait()
+        self.worker_log.close()
+        self.worker_process = None
+
+    # remove the queue files of job_id, the worker must not be running it anymore
+    def remove_job_files(self, job_id):
+        for postfix in [blender_roblox_worker.JOB_POSTFIX, blender_roblox_worker.RUNNING_POSTFIX,
+                        blender_roblox_worker.RESULT_POSTFIX]:
+            job_file_path = os.path.join(self.queue_folder, job_id + postfix)
+            if os.path.exists(job_file_path):
+                os.remove(job_file_path)
+
+    def run_in_worker(self, script, fbx_path, log_path):
+        if self.worker_process is None or self.worker_process.poll() is not None:
+            self.worker_process = None
+            self.start_worker()
+        job_id = blender_roblox_worker.submit_job(self.queue_folder, script, fbx_path,
+                                                  working_directory=os.path.dirname(fbx_path), log_path=log_path)
+        start_time = time.time()
+        result = None
+        while result is None:
+            result = blender_roblox_worker.wait_for_result(self.queue_folder, job_id, timeout=1.0)
+            if result is not None:
+                break
+            if self.worker_process.poll() is not None:
+                # worker crashed, it is restarted for the next job
+                self.worker_process = None
+                self.worker_log.close()
+                self.remove_job_files(job_id)
+                return "failed", None, "worker process exited"
+            if self.timeout is not None and time.time() - start_time > self.timeout:
+                self.stop_worker(force=True)
+                self.remove_job_files(job_id)
+                return "timeout", None, f"timed out after {self.timeout} seconds"
+        os.remove(os.path.join(self.queue_folder, job_id + blender_roblox_worker.RESULT_POSTFIX))
+        return result["status"], result.get("exit_code"), result.get("error")
+
+
+runner_slots = threading.local()
+
+def get_runner(settings):
+    runner = getattr(runner_slots, "runner", None)
+    if runner is None:
+        queue_folder = None
+        if settings["persistent"]:
+            queue_folder = os.path.join(settings["work_folder"], f"queue_{threading.get_ident()}")
+        runner = BlenderRunner(settings["blender"], settings["timeout"], settings["persistent"], queue_folder)
+        runner_slots.runner = runner
+        with log_lock:
+            settings["runners"].append(runner)
+    return runner
+
+# run all conversions of one export, in order, stopping at the first failure
+def convert_export(item, settings):
+    fbx_path = item["fbx"]
+    dtu_dict = read_dtu(fbx_path[:-4] + ".dtu")
+    scripts = item.get("scripts") or settings["scripts"] or get_scripts_for_asset_type(dtu_dict.get("Asset Type"))
+    output_folder = dtu_dict.get("Output Folder", "").replace("\\","/")
+    runner = get_runner(settings)
+
+    job_results = []
+    for script in scripts:
+        log_path = fbx_path[:-4] + f"_{script}_batch.log"
+        job_result = {"fbx": fbx_path, "script": script, "status": None, "attempts": 0, "outputs": []}
+        start_time = time.time()
+        for attempt in range(settings["retries"] + 1):
+            job_result["attempts"] = attempt + 1
+            _add_to_log(f"DEBUG: convert_export(): {script} {fbx_path} (attempt {attempt + 1})")
+            status, exit_code, error = runner.run(script, fbx_path, log_path)
+            job_result.update({"status": status, "exit_code": exit_code, "error": error})
+            if status == "completed":
+                break
+            _add_to_log(f"ERROR: convert_export(): {script} {fbx_path}: {error}")
+        job_result["duration"] = time.time() - start_time
+        job_result["outputs"] = find_new_files(output_folder, os.path.basename(fbx_path)[:-4], start_time)
+        job_result["log"] = log_path
+        job_results.append(job_result)
+        if job_result["status"] != "completed":
+            break
+    return job_results
+
+
+def _main(argv):
+    parser = argparse.ArgumentParser(prog="blender_batch_convert.py")
+    parser.add_argument("input", help="folder to search for .fbx/.dtu pairs, or a JSON manifest")
+    parser.add_argument("--blender", required=True, help="blender executable")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="number of blender processes")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per conversion")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--scripts", default=None, help="comma separated: " + ",".join(script_order))
+    parser.add_argument("--persistent", action="store_true", help="use persistent blender_roblox_worker.py processes")
+    parser.add_argument("--summary", default=None, help="summary JSON file")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.input):
+        item_list = discover_exports(args.input)
+        summary_path = args.summary or os.path.join(args.input, "batch_convert_summary.json")
+    else:
+        item_list = read_manifest(args.input)
+        summary_path = args.summary or os.path.splitext(args.input)[0] + "_summary.json"
+
+    scripts = None
+    if args.scripts:
+        scripts = [script.strip() for script in args.scripts.split(",") if script.strip()]
+        for script in scripts:
+            if script not in script_filenames:
+                parser.error("unknown script: " + script)
+
+    work_folder = os.path.join(os.path.dirname(os.path.abspath(summary_path)), "batch_convert_queues")
+    settings = {"blender": args.blender, "timeout": args.timeout, "retries": args.retries, "scripts": scripts,
+                "persistent": args.persistent, "work_folder": work_folder, "runners": []}
+
+    _add_to_log(f"DEBUG: _main(): {len(item_list)} exports, {args.jobs} blender processes")
+    start_time = time.time()
+    job_results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for item_results in executor.map(lambda item: convert_export(item, settings), item_list):
+            job_results.extend(item_results)
+    for runner in settings["runners"]:
+        runner.stop_worker()
+    if args.persistent:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    failures = [job for job in job_results if job["status"] != "completed"]
+    summary = {
+        "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time)),
+        "duration": time.time() - start_time,
+        "exports": len(item_list),
+        "jobs": job_results,
+        "completed": len(job_results) - len(failures),
+        "failed": len(failures),
+    }
+    with open(summary_path, "w") as file:
+        json.dump(summary, file, indent=2)
+    _add_to_log(f"DEBUG: _main(): {summary['completed']} completed, {summary['failed']} failed in {summary['duration']:.1f}s, summary: {summary_path}")
+    return 1 if failures else 0
+
+
+# Execute main()
+if __name__=='__main__':
+    exit(_main(sys.argv[1:]))
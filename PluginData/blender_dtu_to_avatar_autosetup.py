@@ -16,6 +16,9 @@ EXAMPLE:
 
 """
 
+# save the pre-processing .blend file next to the fbx (debug option)
+save_intermediate_blend_files = False
+
 logFilename = "blender_dtu_to_roblox_S1.log"
 
 ## Do not modify below
@@ -37,17 +40,25 @@ except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
 try:
+    import log_tools
     import blender_tools
     blender_tools.logFilename = logFilename
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import vertex_index_store
 except:
     sys.path.append(script_dir)
+    import log_tools
     import blender_tools
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import vertex_index_store
+log_tools.default_log_filename = logFilename
+
+# vertex groups are read lazily from the binary store (see vertex_index_store.py)
+roblox_vertex_data = vertex_index_store.load_vertex_index_store(script_dir + "/game_readiness_roblox_data")
+geo_group_names = roblox_vertex_data.get_name_list("geo_group_names")
+decimation_group_names = roblox_vertex_data.get_name_list("decimation_group_names")
 
 decimation_lookup = {
                     "Skullcap_DecimationGroup": 0.905,
@@ -71,9 +82,7 @@ decimation_lookup = {
 
 
 def _add_to_log(sMessage):
-    print(str(sMessage))
-    with open(logFilename, "a") as file:
-        file.write(sMessage + "\n")
+    log_tools.log(sMessage, logFilename)
 
 def _main(argv):
     try:
@@ -90,6 +99,9 @@ def _main(argv):
         _add_to_log(f"ERROR: unable to parse token_id from '{line}'")
         token_id = 0
 
+    blender_tools.reset_stage_timings()
+    blender_tools.reset_image_cache_stats()
+    game_readiness_tools.clear_object_ray_casters()
     blender_tools.delete_all_items()
     blender_tools.switch_to_layout_mode()
 
@@ -99,9 +111,13 @@ def _main(argv):
         exit(1)
         return
 
+    blender_tools.cprofile_output_folder = os.path.dirname(fbxPath)
+    blender_tools.begin_stage("fbx_import")
     # load FBX
     _add_to_log("DEBUG: main(): loading fbx file: " + str(fbxPath))
     blender_tools.import_fbx(fbxPath)
+    blender_tools.end_stage("fbx_import")
+    blender_tools.begin_stage("process_dtu")
     blender_tools.fix_eyes()
     blender_tools.fix_scalp()
 
@@ -117,6 +133,8 @@ def _main(argv):
         bHasAnimation = False
 
 
+    blender_tools.end_stage("process_dtu")
+    blender_tools.begin_stage("pose")
     # clear all animation data
     # Iterate over all objects
     _add_to_log("DEBUG: main(): clearing animation data")
@@ -141,6 +159,7 @@ def _main(argv):
         pass
 
 
+    blender_tools.end_stage("pose")
     main_obj = None
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -153,6 +172,7 @@ def _main(argv):
         return
     bpy.context.view_layer.objects.active = main_obj
 
+    blender_tools.begin_stage("decimate_eyes_and_mouth")
     # decimate mouth
     bpy.ops.object.select_all(action='DESELECT')
     for obj in bpy.data.objects:
@@ -185,6 +205,8 @@ def _main(argv):
             bpy.ops.object.modifier_apply(modifier="Eyes")
             break
 
+    blender_tools.end_stage("decimate_eyes_and_mouth")
+    blender_tools.begin_stage("remove_extra_meshes")
     # remove moisture materials, extra meshes, extra materials
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -192,11 +214,12 @@ def _main(argv):
     game_readiness_tools.remove_extra_meshes(["genesis9.shape", "genesis9mouth.shape", "genesis9eyes.shape"])
     game_readiness_tools.remove_extra_materials(["body"])
 
-    # read from python data file (import vertex_indices_for_daztoroblox.py)
+    blender_tools.end_stage("remove_extra_meshes")
+    blender_tools.begin_stage("separation")
+    # read from vertex index store (game_readiness_roblox_data.bin)
     for group_name in geo_group_names + decimation_group_names:
         _add_to_log("DEBUG: creating vertex group: " + group_name)
-        # evaluate group_name to python variable name
-        vertex_index_buffer = globals()[group_name]
+        vertex_index_buffer = roblox_vertex_data.get_vertex_indices(group_name)
         game_readiness_tools.create_vertex_group(main_obj, group_name, vertex_index_buffer)
 
     # # add decimation modifier
@@ -215,9 +238,9 @@ def _main(argv):
     #     new_modifier.vertex_group = decimation_group_name
 
     # separate by vertex group
-    for group_name in geo_group_names:
-        _add_to_log("DEBUG: separating by vertex group: " + group_name)
-        game_readiness_tools.separate_by_vertexgroup(main_obj, group_name)
+    _add_to_log("DEBUG: separating by vertex groups: " + str(geo_group_names))
+    geo_names = {group_name: group_name.replace("_GeoGroup", "_Geo") for group_name in geo_group_names}
+    game_readiness_tools.separate_by_vertexgroups(main_obj, geo_names)
 
     # add eyes and mouth to head_geo
     # deselect all
@@ -237,6 +260,8 @@ def _main(argv):
         obj.select_set(True)
         bpy.ops.object.delete()
 
+    blender_tools.end_stage("separation")
+    blender_tools.begin_stage("decimation")
     # for each obj, select correct decimation group and add decimate modifier
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -312,17 +337,19 @@ def _main(argv):
     #     if obj.type == 'ARMATURE':
     #         bpy.data.objects.remove(obj)
 
+    blender_tools.end_stage("decimation")
     # prepare destination folder path
     blenderFilePath = fbxPath.replace(".fbx", ".blend")
     intermediate_folder_path = os.path.dirname(fbxPath)
 
+    blender_tools.begin_stage("image_cleanup")
     # remove missing or unused images
     _add_to_log("DEBUG: deleting missing or unused images...")
     for image in bpy.data.images:
         is_missing = False
         if image.filepath:
             imagePath = bpy.path.abspath(image.filepath)
-            if (not os.path.exists(imagePath)):
+            if (not blender_tools.texture_file_exists(imagePath)):
                 is_missing = True
 
         is_unused = False
@@ -340,6 +367,8 @@ def _main(argv):
     _add_to_log("DEBUG: main(): packing all images...")
     bpy.ops.file.pack_all()
 
+    blender_tools.end_stage("image_cleanup")
+    blender_tools.begin_stage("save_blend")
     # select all objects
     bpy.ops.object.select_all(action="SELECT")
     # set active object
@@ -347,8 +376,11 @@ def _main(argv):
 
     # switch to object mode before saving (pre-processing save)
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
+    if save_intermediate_blend_files:
+        bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
 
+    blender_tools.end_stage("save_blend")
+    blender_tools.begin_stage("scaling")
     # select all
     bpy.ops.object.select_all(action="SELECT")
     # apply using "All Transforms to Deltas"
@@ -371,9 +403,12 @@ def _main(argv):
     # NEW SCALING CODE
     bpy.context.scene.unit_settings.scale_length = 1/28
 
+    blender_tools.end_stage("scaling")
+    blender_tools.begin_stage("facs_animation")
     # copy facial animations
     roblox_tools.copy_facs50_animations(script_dir + "/Genesis9facs50.blend", "Genesis9_Geo")
 
+    blender_tools.end_stage("facs_animation")
     # mesh naming fix so Roblox Studio GLB importer works
     # rename mesh data to object name
     for obj in bpy.data.objects:
@@ -381,9 +416,12 @@ def _main(argv):
             mesh_data = obj.data
             mesh_data.name = obj.name
 
+    blender_tools.begin_stage("fbx_export")
     # save blender file to destination
     blender_output_file_path = fbx_output_file_path.replace(".fbx", ".blend")
     bpy.ops.wm.save_as_mainfile(filepath=blender_output_file_path)
+    # the GLB variant is exported from the same scene, after restoring what the FBX variant changes
+    export_state = blender_tools.snapshot_export_state()
 
     # Reset system scale to 1 and bake scaling for better compatibility
     bpy.context.scene.unit_settings.scale_length = 1
@@ -400,12 +438,9 @@ def _main(argv):
     if armature is None:
         _add_to_log("ERROR: main(): armature not found, unable to perform GLB scaling.")
     else:
-        # baking system scale for better compatibility
+        # baking system scale for better compatibility, undone by restore_export_state() before the GLB variant
         scale_factor = 1/28 # DB 2024-12-04, 1/28 scaling factor for metric to stud
-        bpy.ops.transform.resize(value=(scale_factor, scale_factor, scale_factor))
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        # Apply the scale work-around to animation keyframes
-        blender_tools.propagate_scale_to_animation(armature, scale_factor)
+        blender_tools.bake_armature_scale(armature, scale_factor, export_state)
 
     # export to fbx
     _add_to_log("DEBUG: saving Roblox FBX file to destination: " + fbx_output_file_path)
@@ -424,9 +459,12 @@ def _main(argv):
         _add_to_log("ERROR: unable to save Roblox FBX file: " + fbx_output_file_path)
         _add_to_log("EXCEPTION: " + str(e))
 
-    # Reload blender file
-    bpy.ops.wm.open_mainfile(filepath=blender_output_file_path)
+    blender_tools.end_stage("fbx_export")
+    blender_tools.begin_stage("restore_export_state")
+    blender_tools.restore_export_state(export_state)
 
+    blender_tools.end_stage("restore_export_state")
+    blender_tools.begin_stage("glb_scaling")
     # select armature
     bpy.ops.object.select_all(action="DESELECT")
     for obj in bpy.data.objects:
@@ -452,6 +490,8 @@ def _main(argv):
     for obj in bpy.data.objects:
         blender_tools.apply_mesh_modifiers(obj)
 
+    blender_tools.end_stage("glb_scaling")
+    blender_tools.begin_stage("glb_export")
     generate_final_glb = True
     if generate_final_glb:
         glb_output_file_path = fbx_output_file_path.replace(".fbx", ".glb")
@@ -487,6 +527,9 @@ def _main(argv):
             _add_to_log("EXCEPTION: " + str(e))
             raise e
 
+    blender_tools.end_stage("glb_export")
+    image_cache_stats = blender_tools.log_image_cache_stats()
+    blender_tools.write_stage_timings(fbx_output_file_path.replace(".fbx", "_timings.json"), {"image_cache": image_cache_stats})
     _add_to_log("DEBUG: main(): completed conversion for: " + str(fbxPath))
 
 
@@ -16,6 +16,15 @@ EXAMPLE:
 
 """
 do_experimental_remove_materials = True
+# save the pre-processing .blend file next to the fbx (debug option)
+save_intermediate_blend_files = False
+# number of Blender subprocesses for the per-item layered accessory stages (cages, hidden surface removal,
+# decimation), 0 or 1 processes the items one after the other in this process.  DAZTOROBLOX_ITEM_JOBS overrides it.
+parallel_item_jobs = 0
+# replace source textures larger than the DTU "Texture Size" with downscaled variants before loading them
+pre_resize_textures = True
+# share one material between DTU materials with identical properties
+deduplicate_materials = True
 
 
 logFilename = "blender_dtu_to_roblox_accessories.log"
@@ -41,22 +50,25 @@ except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
 try:
+    import log_tools
     import blender_tools
     blender_tools.logFilename = logFilename
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import pipeline_cache
+    import texture_tools
 except:
     sys.path.append(script_dir)
+    import log_tools
     import blender_tools
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import pipeline_cache
+    import texture_tools
+log_tools.default_log_filename = logFilename
 
 def _add_to_log(sMessage):
-    print(str(sMessage))
-    with open(logFilename, "a") as file:
-        file.write(sMessage + "\n")
+    log_tools.log(sMessage, logFilename)
 
 
 def _main(argv):
@@ -74,6 +86,10 @@ def _main(argv):
         _add_to_log(f"ERROR: unable to parse token_id from '{line}'")
         token_id = 0
 
+    blender_tools.reset_stage_timings()
+    blender_tools.reset_image_cache_stats()
+    game_readiness_tools.clear_object_ray_casters()
+    pipeline_cache.reset_cache_stats()
     blender_tools.delete_all_items()
     blender_tools.switch_to_layout_mode()
 
@@ -86,7 +102,11 @@ def _main(argv):
     # prepare intermediate folder paths
     blenderFilePath = fbxPath.replace(".fbx", ".blend")
     intermediate_folder_path = os.path.dirname(fbxPath)
+    # shared by all exports, kept outside of the intermediate folder which is cleaned before each export
+    pipeline_cache.set_default_cache_folder(os.path.dirname(intermediate_folder_path) + "/PipelineCache")
 
+    blender_tools.cprofile_output_folder = os.path.dirname(fbxPath)
+    blender_tools.begin_stage("fbx_import")
     # load FBX
     _add_to_log("DEBUG: main(): loading fbx file: " + str(fbxPath))
     blender_tools.import_fbx(fbxPath)
@@ -100,10 +120,21 @@ def _main(argv):
         ):
             game_readiness_tools.transfer_weights("Genesis9.Shape", obj.name)
 
-    blender_tools.center_all_viewports()
+    blender_tools.end_stage("fbx_import")
     jsonPath = fbxPath.replace(".fbx", ".dtu")
+    texture_variants = None
+    if pre_resize_textures:
+        blender_tools.begin_stage("prepare_textures")
+        with open(jsonPath, "r") as file:
+            texture_dtu_dict = json.load(file)
+        # shared by all exports, next to the pipeline cache
+        texture_variants = texture_tools.prepare_textures(texture_dtu_dict, texture_dtu_dict.get("Texture Size", 1024),
+                                                          os.path.dirname(intermediate_folder_path) + "/ResizedTextures")
+        blender_tools.end_stage("prepare_textures")
+    blender_tools.begin_stage("process_dtu")
+    blender_tools.center_all_viewports()
     _add_to_log("DEBUG: main(): loading json file: " + str(jsonPath))
-    dtu_dict = blender_tools.process_dtu(jsonPath)
+    dtu_dict = blender_tools.process_dtu(jsonPath, texture_variants=texture_variants, deduplicate_materials=deduplicate_materials)
 
     # global variables and settings from DTU
     roblox_asset_name = dtu_dict["Asset Name"]
@@ -136,6 +167,8 @@ def _main(argv):
     else:
         bHasAnimation = False
 
+    blender_tools.end_stage("process_dtu")
+    blender_tools.begin_stage("pose")
     # clear all animation data
     # Iterate over all objects
     _add_to_log("DEBUG: main(): clearing animation data")
@@ -151,6 +184,7 @@ def _main(argv):
 
     daz_generation = dtu_dict["Asset Id"]
 
+    blender_tools.end_stage("pose")
     main_obj = None
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -163,6 +197,7 @@ def _main(argv):
         return
     bpy.context.view_layer.objects.active = main_obj
 
+    blender_tools.begin_stage("inner_cage_template")
     top_collection = bpy.context.scene.collection
     # create new collection for cages
     cage_collection = bpy.data.collections.new(name="Unused Cages")
@@ -185,6 +220,8 @@ def _main(argv):
             game_readiness_tools.autofit_mesh(cage_template, main_obj, 0.9, 10, 25, 0, False)
             # game_readiness_tools.scale_by_face_normals(cage_template, 0.90)
 
+    blender_tools.end_stage("inner_cage_template")
+    blender_tools.begin_stage("remove_extra_meshes")
     figure_list = ["genesis9.shape", "genesis9mouth.shape", "genesis9eyes.shape"]
     for obj in bpy.data.objects:
         # if obj.type == 'MESH' and (
@@ -245,6 +282,8 @@ def _main(argv):
                         col.objects.unlink(obj)
                     debug_filter_collection.objects.link(obj)
         bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath.replace(".blend", "_debug.blend"))
+        blender_tools.end_stage("remove_extra_meshes")
+        blender_tools.write_stage_timings(blenderFilePath.replace(".blend", "_timings.json"), {"pipeline_cache": pipeline_cache.get_cache_stats()})
         exit()
 
     # delete objects
@@ -256,8 +295,12 @@ def _main(argv):
 
     if len(accessories_list) == 0:
         _add_to_log("DEBUG: main(): no accessories found.")
+        blender_tools.end_stage("remove_extra_meshes")
+        blender_tools.write_stage_timings(blenderFilePath.replace(".blend", "_timings.json"), {"pipeline_cache": pipeline_cache.get_cache_stats()})
         exit()
 
+    blender_tools.end_stage("remove_extra_meshes")
+    blender_tools.begin_stage("join_and_scalp_removal")
     if bake_single_outfit:
         # join all mesh objects together
         main_item = None
@@ -312,6 +355,8 @@ def _main(argv):
             bpy.ops.mesh.delete(type='VERT')
             bpy.ops.object.mode_set(mode='OBJECT')
 
+    blender_tools.end_stage("join_and_scalp_removal")
+    blender_tools.begin_stage("texture_atlas")
     # convert to texture atlas
     safe_material_names_list = []
     for obj in bpy.data.objects:
@@ -347,6 +392,8 @@ def _main(argv):
             atlas, atlas_material, _ = game_readiness_tools.convert_to_atlas(obj, intermediate_folder_path, roblox_texture_size, texture_bake_quality)
             safe_material_names_list.append(atlas_material.name.lower())
 
+    blender_tools.end_stage("texture_atlas")
+    blender_tools.begin_stage("remove_extra_materials")
     # Remove multilpe materials
     for obj in bpy.data.objects:
         if obj.type != 'MESH'or (
@@ -388,8 +435,10 @@ def _main(argv):
         _add_to_log("DEBUG: safe_material_names_list=" + str(safe_material_names_list))
         game_readiness_tools.remove_extra_materials(safe_material_names_list + ["cage_material", "attachment_material"])
 
+    blender_tools.end_stage("remove_extra_materials")
     if "layered" in roblox_asset_type or "ALL" in roblox_asset_type:
         # for each obj, make list of vertex group names
+        item_list = []
         for obj in bpy.data.objects:
             if obj.type == 'MESH'and (
                 "_outercage" not in obj.name.lower() and
@@ -406,40 +455,24 @@ def _main(argv):
                         bpy.ops.object.delete()
                         continue
 
-                inner_cage = roblox_tools.duplicate_cage("Template_InnerCage")
-                if inner_cage is not None:
-                    inner_cage.name = obj.name + "_InnerCage"
-                    # game_readiness_tools.autofit_mesh(inner_cage, obj, 0.1)
-                else:
-                    raise Exception("ERROR: main(): unable to make inner cage.")
+                item_list.append(obj)
 
-                outer_cage = roblox_tools.duplicate_cage("Template_InnerCage")
-                if outer_cage is not None:
-                    outer_cage.name = obj.name + "_OuterCage"
-                    # game_readiness_tools.autofit_mesh(outer_cage, obj, 1.5, 10)
-                    game_readiness_tools.autofit_mesh(outer_cage, obj, 1.05, 2, 25, 3, False)
-                else:
-                    raise Exception("ERROR: main(): unable to make outer cage.")
-
-                if hidden_surface_removal:
-                    # remove hidden faces
-                    thresholds = [t * 28 for t in [0.005, 0.010, 0.015]]
-                    # game_readiness_tools.remove_obscured_faces(obj, 0.0001, [1000000])
-                    game_readiness_tools.remove_obscured_faces(obj)
-
-                # decimate
-                tolerance = 0.005
-                target_triangles = 4000 * (1-tolerance)
-                game_readiness_tools.adjust_decimation_to_target(obj, target_triangles, tolerance)
+        item_jobs = int(os.environ.get("DAZTOROBLOX_ITEM_JOBS", parallel_item_jobs))
+        if item_jobs > 1 and len(item_list) > 1:
+            process_layered_items_parallel(item_list, hidden_surface_removal, intermediate_folder_path, item_jobs)
+        else:
+            for obj in item_list:
+                process_layered_item(obj, hidden_surface_removal)
 
 
+    blender_tools.begin_stage("image_cleanup")
     # remove missing or unused images
     _add_to_log("DEBUG: deleting missing or unused images...")
     for image in bpy.data.images:
         is_missing = False
         if image.filepath:
             imagePath = bpy.path.abspath(image.filepath)
-            if (not os.path.exists(imagePath)):
+            if (not blender_tools.texture_file_exists(imagePath)):
                 is_missing = True
 
         is_unused = False
@@ -457,6 +490,8 @@ def _main(argv):
     _add_to_log("DEBUG: main(): packing all images...")
     bpy.ops.file.pack_all()
 
+    blender_tools.end_stage("image_cleanup")
+    blender_tools.begin_stage("save_blend")
     # select all objects
     bpy.ops.object.select_all(action="SELECT")
     # set active object
@@ -464,8 +499,11 @@ def _main(argv):
 
     # switch to object mode before saving (pre-processing save)
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
+    if save_intermediate_blend_files:
+        bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
 
+    blender_tools.end_stage("save_blend")
+    blender_tools.begin_stage("scaling")
     # unparent attachments
     for obj in bpy.data.objects:
         if obj.type == 'MESH' and "_Att" in obj.name:
@@ -493,6 +531,7 @@ def _main(argv):
         else:
             cage_collection.hide_viewport = True
 
+    blender_tools.end_stage("scaling")
     # prepare destination folder paths
     destinationPath = roblox_output_path.replace("\\","/")
     if (not os.path.exists(destinationPath)):
@@ -507,6 +546,7 @@ def _main(argv):
     fbx_output_file_path = os.path.join(destinationPath, fbx_output_name).replace("\\","/")
     _add_to_log("DEBUG: saving Roblox FBX file to destination: " + fbx_output_file_path)
  
+    blender_tools.begin_stage("apply_modifiers")
      # Apply all modifiers
     for obj in bpy.data.objects:
         if obj.type == 'MESH'and (
@@ -519,6 +559,8 @@ def _main(argv):
             except Exception as e:
                 _add_to_log("ERROR: unable to apply mesh modifiers: " + str(e))
 
+    blender_tools.end_stage("apply_modifiers")
+    blender_tools.begin_stage("fbx_export")
     # export to fbx
     try:
         bpy.ops.export_scene.fbx(filepath=fbx_output_file_path, 
@@ -536,13 +578,135 @@ def _main(argv):
         _add_to_log("ERROR: unable to save Roblox FBX file: " + fbx_output_file_path)
         _add_to_log("EXCEPTION: " + str(e))
 
+    blender_tools.end_stage("fbx_export")
+    blender_tools.begin_stage("save_output_blend")
     # save blender file to destination
     blender_output_file_path = fbx_output_file_path.replace(".fbx", ".blend")
     bpy.ops.wm.save_as_mainfile(filepath=blender_output_file_path)
 
+    blender_tools.end_stage("save_output_blend")
+    image_cache_stats = blender_tools.log_image_cache_stats()
+    blender_tools.write_stage_timings(fbx_output_file_path.replace(".fbx", "_timings.json"), {"pipeline_cache": pipeline_cache.get_cache_stats(), "image_cache": image_cache_stats})
     _add_to_log("DEBUG: main(): completed conversion for: " + str(fbxPath))
 
 
+# inner and outer cage duplicates of the cage template for a layered item, not fitted yet
+def make_item_cages(obj):
+    inner_cage = roblox_tools.duplicate_cage("Template_InnerCage")
+    if inner_cage is not None:
+        inner_cage.name = obj.name + "_InnerCage"
+        # game_readiness_tools.autofit_mesh(inner_cage, obj, 0.1)
+    else:
+        raise Exception("ERROR: main(): unable to make inner cage.")
+
+    outer_cage = roblox_tools.duplicate_cage("Template_InnerCage")
+    if outer_cage is not None:
+        outer_cage.name = obj.name + "_OuterCage"
+    else:
+        raise Exception("ERROR: main(): unable to make outer cage.")
+    return inner_cage, outer_cage
+
+# cages, hidden surface removal and decimation of one layered item, returns (inner_cage, outer_cage, decimation ratio)
+def process_layered_item(obj, hidden_surface_removal):
+    blender_tools.begin_stage(obj.name + ":cages")
+    inner_cage, outer_cage = make_item_cages(obj)
+    # game_readiness_tools.autofit_mesh(outer_cage, obj, 1.5, 10)
+    game_readiness_tools.autofit_mesh(outer_cage, obj, 1.05, 2, 25, 3, False)
+
+    blender_tools.end_stage(obj.name + ":cages")
+    if hidden_surface_removal:
+        blender_tools.begin_stage(obj.name + ":remove_obscured_faces")
+        # remove hidden faces
+        thresholds = [t * 28 for t in [0.005, 0.010, 0.015]]
+        # game_readiness_tools.remove_obscured_faces(obj, 0.0001, [1000000])
+        game_readiness_tools.remove_obscured_faces(obj)
+        blender_tools.end_stage(obj.name + ":remove_obscured_faces")
+
+    blender_tools.begin_stage(obj.name + ":decimation")
+    # decimate
+    tolerance = 0.005
+    target_triangles = 4000 * (1-tolerance)
+    decimation_ratio = game_readiness_tools.adjust_decimation_to_target(obj, target_triangles, tolerance)
+    blender_tools.end_stage(obj.name + ":decimation")
+    return inner_cage, outer_cage, decimation_ratio
+
+# Per-item fan-out: every layered item is written to its own .blend file, together with the cage template
+# and the objects it depends on (ex: armature), and processed by blender_accessory_item_worker.py in a pool
+# of Blender subprocesses.  Only the results are merged back into this scene: the fitted outer cage
+# coordinates, the faces kept by hidden surface removal and the decimation ratio.  Items whose
+# subprocess fails are processed in this process instead.
+def process_layered_items_parallel(item_list, hidden_surface_removal, work_folder, num_jobs):
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+
+    blender_tools.begin_stage("item_fanout")
+    cage_template = bpy.data.objects.get("Template_InnerCage")
+    fanout_folder = os.path.join(work_folder, "item_fanout").replace("\\","/")
+    os.makedirs(fanout_folder, exist_ok=True)
+    item_jobs = []
+    for index, obj in enumerate(item_list):
+        item_blend_path = fanout_folder + f"/item_{index}.blend"
+        result_path = fanout_folder + f"/item_{index}_result.npz"
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        bpy.data.libraries.write(item_blend_path, {obj, cage_template}, fake_user=True)
+        item_jobs.append((obj.name, item_blend_path, result_path))
+
+    # the subprocesses share the pipeline cache of this run
+    environment = dict(os.environ)
+    if pipeline_cache.cache_folder is not None:
+        environment["DAZTOROBLOX_CACHE_FOLDER"] = pipeline_cache.cache_folder
+
+    def run_item(item_job):
+        obj_name, item_blend_path, result_path = item_job
+        command = [bpy.app.binary_path, "--background", "--factory-startup", "--python-exit-code", "11",
+                   "--python", os.path.join(script_dir, "blender_accessory_item_worker.py"), "--",
+                   item_blend_path, obj_name, result_path, str(int(bool(hidden_surface_removal)))]
+        with open(item_blend_path.replace(".blend", ".log"), "w") as log_file:
+            try:
+                process = subprocess.run(command, cwd=fanout_folder, stdout=log_file, stderr=subprocess.STDOUT, env=environment)
+            except OSError as e:
+                _add_to_log("ERROR: process_layered_items_parallel(): unable to start blender: " + str(e))
+                return -1
+        return process.returncode
+
+    _add_to_log(f"DEBUG: process_layered_items_parallel(): {len(item_jobs)} items, {num_jobs} blender processes")
+    with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        return_codes = list(executor.map(run_item, item_jobs))
+    blender_tools.end_stage("item_fanout")
+
+    failed_items = 0
+    for (obj_name, item_blend_path, result_path), return_code in zip(item_jobs, return_codes):
+        obj = bpy.data.objects.get(obj_name)
+        if return_code != 0 or not os.path.exists(result_path):
+            _add_to_log(f"ERROR: process_layered_items_parallel(): {obj_name} failed (exit code {return_code}), see: {item_blend_path.replace('.blend', '.log')}")
+            failed_items += 1
+            process_layered_item(obj, hidden_surface_removal)
+            continue
+        merge_layered_item_result(obj, result_path)
+
+    # keep the item files and logs of failed items for debugging
+    if failed_items == 0:
+        shutil.rmtree(fanout_folder, ignore_errors=True)
+
+def merge_layered_item_result(obj, result_path):
+    import numpy as np
+    blender_tools.begin_stage(obj.name + ":merge")
+    with np.load(result_path) as result:
+        inner_cage, outer_cage = make_item_cages(obj)
+        game_readiness_tools.set_vertex_coordinates_array(outer_cage.data, result["outer_cage_coords"])
+        kept_faces = result["kept_faces"]
+        if len(kept_faces) < len(obj.data.polygons):
+            face_mask = np.ones(len(obj.data.polygons), dtype=bool)
+            face_mask[kept_faces] = False
+            num_removed = game_readiness_tools.remove_faces(obj, face_mask)
+            _add_to_log(f"Removed {num_removed} obscured faces")
+        decimate_mod = game_readiness_tools.get_decimate_modifier(obj)
+        decimate_mod.ratio = float(result["decimation_ratio"])
+        bpy.context.view_layer.update()
+    _add_to_log(f"DEBUG: merge_layered_item_result(): {obj.name}: decimation ratio: {decimate_mod.ratio:.4f}")
+    blender_tools.end_stage(obj.name + ":merge")
+
 def move_root_node_to_origin():
     _add_to_log("DEBUG: move_root_node_to_origin(): bpy.data.objects=" + str(bpy.data.objects))
     # move root node to origin
@@ -16,6 +16,8 @@ EXAMPLE:
 
 """
 do_experimental_remove_materials = True
+# save the pre-processing .blend file next to the fbx (debug option)
+save_intermediate_blend_files = False
 
 
 logFilename = "blender_dtu_to_roblox_R15.log"
@@ -41,17 +43,25 @@ except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
 try:
+    import log_tools
     import blender_tools
     blender_tools.logFilename = logFilename
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import vertex_index_store
 except:
     sys.path.append(script_dir)
+    import log_tools
     import blender_tools
     import roblox_tools
     import game_readiness_tools
-    from game_readiness_roblox_data import *
+    import vertex_index_store
+log_tools.default_log_filename = logFilename
+
+# vertex groups are read lazily from the binary store (see vertex_index_store.py)
+roblox_vertex_data = vertex_index_store.load_vertex_index_store(script_dir + "/game_readiness_roblox_data")
+geo_group_names = roblox_vertex_data.get_name_list("geo_group_names")
+decimation_group_names = roblox_vertex_data.get_name_list("decimation_group_names")
 
 decimation_lookup = {
                     "Skullcap_DecimationGroup": 0.905,
@@ -75,9 +85,7 @@ decimation_lookup = {
 
 
 def _add_to_log(sMessage):
-    print(str(sMessage))
-    with open(logFilename, "a") as file:
-        file.write(sMessage + "\n")
+    log_tools.log(sMessage, logFilename)
 
 def _main(argv):
     try:
@@ -94,6 +102,9 @@ def _main(argv):
         _add_to_log(f"ERROR: unable to parse token_id from '{line}'")
         token_id = 0
 
+    blender_tools.reset_stage_timings()
+    blender_tools.reset_image_cache_stats()
+    game_readiness_tools.clear_object_ray_casters()
     blender_tools.delete_all_items()
     blender_tools.switch_to_layout_mode()
 
@@ -107,6 +118,8 @@ def _main(argv):
     blenderFilePath = fbxPath.replace(".fbx", ".blend")
     intermediate_folder_path = os.path.dirname(fbxPath)
 
+    blender_tools.cprofile_output_folder = os.path.dirname(fbxPath)
+    blender_tools.begin_stage("fbx_import")
     # load FBX
     _add_to_log("DEBUG: main(): loading fbx file: " + str(fbxPath))
     blender_tools.import_fbx(fbxPath)
@@ -124,6 +137,8 @@ def _main(argv):
         if obj.type == 'MESH' and "_Att" in obj.name:
             roblox_tools.bind_attachment_to_bone_inplace(obj)
 
+    blender_tools.end_stage("fbx_import")
+    blender_tools.begin_stage("process_dtu")
     blender_tools.fix_eyes()
     blender_tools.fix_scalp()
 
@@ -139,6 +154,8 @@ def _main(argv):
         bHasAnimation = False
 
 
+    blender_tools.end_stage("process_dtu")
+    blender_tools.begin_stage("pose")
     # clear all animation data
     # Iterate over all objects
     _add_to_log("DEBUG: main(): clearing animation data")
@@ -173,6 +190,7 @@ def _main(argv):
     # # separate by bone influence
     # separate_by_bone_influence()
 
+    blender_tools.end_stage("pose")
     main_obj = None
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -185,6 +203,7 @@ def _main(argv):
         return
     bpy.context.view_layer.objects.active = main_obj
 
+    blender_tools.begin_stage("hd_duplicate_and_decimate")
     if True:
         # Create duplicate of original Genesis9.Shape to perform baking later
         obj = main_obj
@@ -250,6 +269,8 @@ def _main(argv):
             bpy.ops.object.modifier_apply(modifier="Eyes")
             break
 
+    blender_tools.end_stage("hd_duplicate_and_decimate")
+    blender_tools.begin_stage("remove_extra_meshes")
     figure_list = ["genesis9.shape", "genesis9mouth.shape", "genesis9eyes.shape", "hd_genesis9.shape"]
     # add any custom eyes or eyelashes to safe list
     head_accessories_list = []
@@ -327,17 +348,18 @@ def _main(argv):
                     if source_cage != bpy.context.object and source_cage.name in bpy.context.object.name:
                         bpy.context.object.name = cage_name
 
-    # read from python data file (import vertex_indices_for_daztoroblox.py)
+    blender_tools.end_stage("remove_extra_meshes")
+    blender_tools.begin_stage("separation")
+    # read from vertex index store (game_readiness_roblox_data.bin)
     for group_name in geo_group_names + decimation_group_names:
         _add_to_log("DEBUG: creating vertex group: " + group_name)
-        # evaluate group_name to python variable name
-        vertex_index_buffer = globals()[group_name]
+        vertex_index_buffer = roblox_vertex_data.get_vertex_indices(group_name)
         game_readiness_tools.create_vertex_group(main_obj, group_name, vertex_index_buffer)
 
     # separate by vertex group
-    for group_name in geo_group_names:
-        _add_to_log("DEBUG: separating by vertex group: " + group_name)
-        game_readiness_tools.separate_by_vertexgroup(main_obj, group_name)
+    _add_to_log("DEBUG: separating by vertex groups: " + str(geo_group_names))
+    geo_names = {group_name: group_name.replace("_GeoGroup", "_Geo") for group_name in geo_group_names}
+    game_readiness_tools.separate_by_vertexgroups(main_obj, geo_names)
 
     # add eyes and mouth to head_geo
     # deselect all
@@ -357,6 +379,8 @@ def _main(argv):
         obj.select_set(True)
         bpy.ops.object.delete()
 
+    blender_tools.end_stage("separation")
+    blender_tools.begin_stage("decimation_setup")
     # for each obj, select correct decimation group and add decimate modifier
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -381,13 +405,15 @@ def _main(argv):
                     game_readiness_tools.add_decimate_modifier_per_vertex_group(obj, group_name, decimate_ratio)
                     break
 
+    blender_tools.end_stage("decimation_setup")
+    blender_tools.begin_stage("image_cleanup")
     # remove missing or unused images
     _add_to_log("DEBUG: deleting missing or unused images...")
     for image in bpy.data.images:
         is_missing = False
         if image.filepath:
             imagePath = bpy.path.abspath(image.filepath)
-            if (not os.path.exists(imagePath)):
+            if (not blender_tools.texture_file_exists(imagePath)):
                 is_missing = True
 
         is_unused = False
@@ -405,6 +431,8 @@ def _main(argv):
     _add_to_log("DEBUG: main(): packing all images...")
     bpy.ops.file.pack_all()
 
+    blender_tools.end_stage("image_cleanup")
+    blender_tools.begin_stage("save_blend")
     # select all objects
     bpy.ops.object.select_all(action="SELECT")
     # set active object
@@ -412,8 +440,11 @@ def _main(argv):
 
     # switch to object mode before saving (pre-processing save)
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
+    if save_intermediate_blend_files:
+        bpy.ops.wm.save_as_mainfile(filepath=blenderFilePath)
 
+    blender_tools.end_stage("save_blend")
+    blender_tools.begin_stage("scaling_and_attachments")
     # unparent attachments
     for obj in bpy.data.objects:
         if obj.type == 'MESH' and "_Att" in obj.name:
@@ -449,6 +480,8 @@ def _main(argv):
             new_matrix = obj.matrix_world @ new_rotation.to_matrix().to_4x4()
             obj.matrix_world = new_matrix
 
+    blender_tools.end_stage("scaling_and_attachments")
+    blender_tools.begin_stage("facs_animation")
     # add cage and attachments
     #roblox_tools.add_cage_and_attachments()
 
@@ -459,6 +492,7 @@ def _main(argv):
     # roblox UGC Validation Fixes
     roblox_tools.ugc_validation_fixes()
 
+    blender_tools.end_stage("facs_animation")
     # hide HD_Genesis9.Shape if present
     obj = bpy.data.objects.get("HD_Genesis9.Shape")
     if obj is not None:
@@ -483,8 +517,11 @@ def _main(argv):
     blender_output_file_path = fbx_output_file_path.replace(".fbx", ".blend")
     glb_output_file_path = fbx_output_file_path.replace(".fbx", ".glb")
 
+    blender_tools.begin_stage("fbx_export")
     # save blender file to destination
     bpy.ops.wm.save_as_mainfile(filepath=blender_output_file_path)
+    # the GLB variant is exported from the same scene, after restoring what the FBX variant changes
+    export_state = blender_tools.snapshot_export_state()
 
     # select armature
     bpy.ops.object.select_all(action="DESELECT")
@@ -519,9 +556,12 @@ def _main(argv):
         _add_to_log("ERROR: unable to save Roblox FBX file: " + fbx_output_file_path)
         _add_to_log("EXCEPTION: " + str(e))
 
-    # Reload blender file
-    bpy.ops.wm.open_mainfile(filepath=blender_output_file_path)
+    blender_tools.end_stage("fbx_export")
+    blender_tools.begin_stage("restore_export_state")
+    blender_tools.restore_export_state(export_state)
 
+    blender_tools.end_stage("restore_export_state")
+    blender_tools.begin_stage("glb_scaling")
     # unparent all geometry from armature (inlcuding attachments)
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
@@ -571,6 +611,8 @@ def _main(argv):
     for obj in bpy.data.objects:
         blender_tools.apply_mesh_modifiers(obj)
 
+    blender_tools.end_stage("glb_scaling")
+    blender_tools.begin_stage("glb_export")
     generate_final_glb = True
     if generate_final_glb:
         try:
@@ -605,6 +647,9 @@ def _main(argv):
             _add_to_log("EXCEPTION: " + str(e))
             raise e
 
+    blender_tools.end_stage("glb_export")
+    image_cache_stats = blender_tools.log_image_cache_stats()
+    blender_tools.write_stage_timings(fbx_output_file_path.replace(".fbx", "_timings.json"), {"image_cache": image_cache_stats})
     _add_to_log("DEBUG: main(): completed conversion for: " + str(fbxPath))
 
 
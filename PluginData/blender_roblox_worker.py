@@ -0,0 +1,353 @@
+"""Blender Roblox Conversion Worker
+
+This is a command-line script that keeps one Blender process running and serves
+conversion jobs from a file-based job queue, so Blender startup, addon init, the
+vertex data store and the FACS template are only loaded once for many conversions.
+
+Each job runs the unchanged _main() of one of the conversion scripts:
+    r15             blender_dtu_to_roblox_blend.py
+    s1              blender_dtu_to_avatar_autosetup.py
+    accessories     blender_dtu_to_r15_accessories.py
+
+Job queue folder protocol:
+    <job_id>.job.json       written by the client: {"script": "r15", "fbx_path": "...",
+                            "working_directory": "...", "options": {"module_setting": value},
+                            "log_path": "..."}  (optional, stdout/stderr of the job)
+    <job_id>.running.json   job claimed by a worker (renamed from .job.json)
+    <job_id>.result.json    written by the worker: status, exit_code, duration, error
+    shutdown                stops all workers serving the folder once their current job is done
+
+USAGE: blender.exe --background --python blender_roblox_worker.py -- <job queue folder> [--idle-timeout <seconds>] [--max-jobs <count>]
+
+EXAMPLE:
+
+    C:/Blender3.6/blender.exe --background --python blender_roblox_worker.py -- C:/Users/dbui/Documents/DazToRoblox/JobQueue
+
+"""
+
+logFilename = "blender_roblox_worker.log"
+
+## Do not modify below
+def _print_usage():
+    print("\nUSAGE: blender.exe --background --python blender_roblox_worker.py -- <job queue folder> [--idle-timeout <seconds>] [--max-jobs <count>]\n")
+
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+
+import sys
+import os
+import json
+import time
+import uuid
+import traceback
+import importlib
+try:
+    import bpy
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+try:
+    import log_tools
+    import blender_tools
+    import roblox_tools
+    import game_readiness_tools
+except:
+    sys.path.append(script_dir)
+    import log_tools
+    try:
+        import blender_tools
+        import roblox_tools
+        import game_readiness_tools
+    except:
+        # client side functions (submit_job etc.) do not need blender
+        pass
+
+JOB_POSTFIX = ".job.json"
+RUNNING_POSTFIX = ".running.json"
+RESULT_POSTFIX = ".result.json"
+SHUTDOWN_FILENAME = "shutdown"
+
+script_modules = {
+    "r15": "blender_dtu_to_roblox_blend",
+    "s1": "blender_dtu_to_avatar_autosetup",
+    "accessories": "blender_dtu_to_r15_accessories",
+}
+
+# bpy.data collections emptied between jobs
+reset_data_collections = ["objects", "meshes", "armatures", "curves", "lattices", "cameras", "lights",
+                          "collections", "materials", "node_groups", "textures", "images", "actions",
+                          "shape_keys", "worlds", "libraries"]
+
+# scene settings changed by the conversion scripts, restored between jobs
+reset_scene_settings = ["render.engine", "render.fps", "frame_start", "frame_end", "frame_current",
+                        "unit_settings.scale_length", "cursor.location",
+                        "render.bake.margin", "render.bake.use_pass_direct", "render.bake.use_pass_indirect",
+                        "render.bake.use_pass_color", "render.bake.use_pass_glossy", "render.bake.use_pass_diffuse",
+                        "render.bake.use_pass_transmission", "render.bake.use_pass_emit",
+                        "cycles.samples", "cycles.time_limit", "cycles.bake_type", "cycles.device"]
+
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage, logFilename)
+
+
+def _write_json(file_path, data):
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temp_path, file_path)
+
+
+# Client side (does not need bpy): queue a job and return its job_id
+def submit_job(queue_folder, script, fbx_path, options=None, working_directory=None, job_id=None, log_path=None):
+    if script not in script_modules:
+        raise ValueError(f"Unknown conversion script: {script}")
+    os.makedirs(queue_folder, exist_ok=True)
+    if job_id is None:
+        job_id = uuid.uuid4().hex
+    job = {"job_id": job_id, "script": script, "fbx_path": fbx_path,
+           "working_directory": working_directory, "options": options or {}, "log_path": log_path}
+    _write_json(os.path.join(queue_folder, job_id + JOB_POSTFIX), job)
+    return job_id
+
+# Client side: wait for the result of job_id, returns None on timeout
+def wait_for_result(queue_folder, job_id, timeout=None, poll_interval=0.5):
+    result_path = os.path.join(queue_folder, job_id + RESULT_POSTFIX)
+    start_time = time.time()
+    while not os.path.exists(result_path):
+        if timeout is not None and time.time() - start_time > timeout:
+            return None
+        time.sleep(poll_interval)
+    with open(result_path, "r") as file:
+        return json.load(file)
+
+# Client side: ask all workers serving queue_folder to exit
+def request_shutdown(queue_folder):
+    with open(os.path.join(queue_folder, SHUTDOWN_FILENAME), "w") as file:
+        file.write("shutdown\n")
+
+
+def _get_setting(owner, setting_path):
+    for name in setting_path.split("."):
+        owner = getattr(owner, name)
+    return owner
+
+def _set_setting(owner, setting_path, value):
+    names = setting_path.split(".")
+    for name in names[:-1]:
+        owner = getattr(owner, name)
+    setattr(owner, names[-1], value)
+
+def snapshot_scene_settings(scene):
+    settings = {}
+    for setting_path in reset_scene_settings:
+        try:
+            value = _get_setting(scene, setting_path)
+        except AttributeError:
+            continue
+        if hasattr(value, "copy"):
+            value = value.copy()
+        settings[setting_path] = value
+    return settings
+
+# Return Blender to an empty scene between jobs.  Cached template actions (fake user) are kept.
+def reset_scene(scene_settings):
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    protected_actions = set()
+    for template_action in roblox_tools.template_action_cache.values():
+        try:
+            protected_actions.add(template_action.name)
+        except ReferenceError:
+            pass
+
+    for collection_name in reset_data_collections:
+        data_collection = getattr(bpy.data, collection_name, None)
+        if data_collection is None or not hasattr(data_collection, "remove"):
+            continue
+        for data_block in list(data_collection):
+            if collection_name == "actions" and data_block.name in protected_actions:
+                continue
+            data_collection.remove(data_block, do_unlink=True)
+    bpy.ops.outliner.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+
+    # only one scene is used by the conversion scripts
+    scene = bpy.context.scene
+    for other_scene in list(bpy.data.scenes):
+        if other_scene != scene:
+            bpy.data.scenes.remove(other_scene, do_unlink=True)
+    for setting_path, value in scene_settings.items():
+        try:
+            _set_setting(scene, setting_path, value)
+        except (AttributeError, TypeError, ValueError):
+            _add_to_log("ERROR: reset_scene(): unable to restore scene setting: " + setting_path)
+    scene.world = bpy.data.worlds.new("World")
+
+    # python side caches that refer to removed data
+    blender_tools.clear_image_cache()
+    game_readiness_tools.clear_object_ray_casters()
+
+
+# redirect the stdout/stderr file descriptors of this process (python and blender output) to log_path,
+# returns the saved descriptors for restore_output()
+def redirect_output(log_path):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(log_fd)
+    return saved_fds
+
+def restore_output(saved_fds):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(saved_fds[0], 1)
+    os.dup2(saved_fds[1], 2)
+    os.close(saved_fds[0])
+    os.close(saved_fds[1])
+
+def run_job(job, scene_settings):
+    script = job.get("script")
+    module = importlib.import_module(script_modules[script])
+
+    # module settings overridden for this job only
+    saved_options = {}
+    for name, value in job.get("options", {}).items():
+        if hasattr(module, name):
+            saved_options[name] = getattr(module, name)
+            setattr(module, name, value)
+        else:
+            _add_to_log(f"ERROR: run_job(): unknown option for {script}: {name}")
+
+    saved_fds = None
+    if job.get("log_path"):
+        try:
+            saved_fds = redirect_output(job["log_path"])
+        except OSError as e:
+            _add_to_log("ERROR: run_job(): unable to open job log: " + job["log_path"] + ": " + str(e))
+
+    saved_working_directory = os.getcwd()
+    if job.get("working_directory"):
+        os.chdir(job["working_directory"])
+    blender_tools.logFilename = module.logFilename
+    log_tools.default_log_filename = module.logFilename
+
+    result = {"job_id": job.get("job_id"), "script": script, "fbx_path": job.get("fbx_path"),
+              "status": "completed", "exit_code": 0, "error": None}
+    start_time = time.time()
+    try:
+        module._add_to_log("Starting script (" + script + ", worker)...\nDEBUG: fbx_path=" + str(job.get("fbx_path")))
+        module._main([job["fbx_path"]])
+        module._add_to_log("Script completed.\n")
+    except SystemExit as e:
+        # the conversion scripts call exit() on errors and early outs
+        exit_code = e.code if isinstance(e.code, int) else 0
+        result["exit_code"] = exit_code
+        if exit_code != 0:
+            result["status"] = "failed"
+            result["error"] = f"exit({exit_code})"
+    except Exception as e:
+        result["status"] = "failed"
+        result["exit_code"] = -1
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+        _add_to_log("ERROR: run_job(): " + result["traceback"])
+    result["duration"] = time.time() - start_time
+
+    for name, value in saved_options.items():
+        setattr(module, name, value)
+    os.chdir(saved_working_directory)
+    blender_tools.logFilename = logFilename
+    log_tools.default_log_filename = logFilename
+    log_tools.flush_all()
+
+    try:
+        reset_scene(scene_settings)
+    except Exception as e:
+        _add_to_log("ERROR: run_job(): unable to reset scene: " + str(e))
+    if saved_fds is not None:
+        restore_output(saved_fds)
+    return result
+
+# claim the oldest waiting job by renaming it, returns (job_id, job) or (None, None)
+def claim_next_job(queue_folder):
+    job_files = [file_name for file_name in os.listdir(queue_folder) if file_name.endswith(JOB_POSTFIX)]
+    job_files.sort(key=lambda file_name: os.path.getmtime(os.path.join(queue_folder, file_name)))
+    for file_name in job_files:
+        job_id = file_name[:-len(JOB_POSTFIX)]
+        running_path = os.path.join(queue_folder, job_id + RUNNING_POSTFIX)
+        try:
+            os.rename(os.path.join(queue_folder, file_name), running_path)
+        except OSError:
+            # claimed by another worker
+            continue
+        with open(running_path, "r") as file:
+            job = json.load(file)
+        job["job_id"] = job_id
+        return job_id, job
+    return None, None
+
+def serve(queue_folder, idle_timeout=None, max_jobs=None, poll_interval=0.25):
+    roblox_tools.cache_template_actions = True
+
+    # load the conversion modules (and the vertex data store) once
+    for module_name in script_modules.values():
+        importlib.import_module(module_name)
+
+    os.makedirs(queue_folder, exist_ok=True)
+    scene_settings = snapshot_scene_settings(bpy.context.scene)
+    _add_to_log("DEBUG: serve(): waiting for jobs in " + queue_folder)
+
+    jobs_completed = 0
+    idle_start = time.time()
+    while True:
+        if os.path.exists(os.path.join(queue_folder, SHUTDOWN_FILENAME)):
+            _add_to_log("DEBUG: serve(): shutdown requested.")
+            break
+        if max_jobs is not None and jobs_completed >= max_jobs:
+            break
+        job_id, job = claim_next_job(queue_folder)
+        if job_id is None:
+            if idle_timeout is not None and time.time() - idle_start > idle_timeout:
+                _add_to_log("DEBUG: serve(): idle timeout.")
+                break
+            time.sleep(poll_interval)
+            continue
+
+        _add_to_log(f"DEBUG: serve(): starting job {job_id}: {job.get('script')} {job.get('fbx_path')}")
+        if job.get("script") not in script_modules or not job.get("fbx_path"):
+            result = {"job_id": job_id, "status": "failed", "exit_code": -1, "duration": 0.0,
+                      "error": "invalid job: " + json.dumps(job)}
+        else:
+            result = run_job(job, scene_settings)
+        _write_json(os.path.join(queue_folder, job_id + RESULT_POSTFIX), result)
+        os.remove(os.path.join(queue_folder, job_id + RUNNING_POSTFIX))
+        _add_to_log(f"DEBUG: serve(): job {job_id} {result['status']} in {result['duration']:.2f}s")
+        jobs_completed += 1
+        idle_start = time.time()
+    return jobs_completed
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="blender_roblox_worker.py")
+    parser.add_argument("queue_folder")
+    parser.add_argument("--idle-timeout", type=float, default=None)
+    parser.add_argument("--max-jobs", type=int, default=None)
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:
+        _print_usage()
+        return
+    serve(args.queue_folder.replace("\\","/"), args.idle_timeout, args.max_jobs)
+
+
+# Execute main()
+if __name__=='__main__':
+    _add_to_log("Starting worker...\nDEBUG: sys.argv=" + str(sys.argv))
+    _main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    _add_to_log("Worker stopped.\n")
+    exit(0)
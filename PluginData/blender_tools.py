@@ -2,6 +2,13 @@
 2024-11-26 - new function to propagate armature scaling to animation keyframes
 2024-12-02 - work-around for GLTF exporter: create a new 1x1 black texture for metallic input if no metallic map is found
 2024-12-17 - disabled MISSING_METALLIC_TEX_WORKAROUND to decrease moderation rejection
+2026-10-18 - stage profiling (begin_stage, end_stage, profile_stage, write_stage_timings)
+2026-10-18 - _add_to_log() routed through buffered, leveled log_tools; stages set the log context
+2026-10-18 - export variants (snapshot_export_state, bake_armature_scale, restore_export_state)
+2026-10-18 - image cache shares images by content hash, evicts unused images over a memory budget
+2026-10-18 - process_dtu() texture_variants: downscaled textures from texture_tools.prepare_textures()
+2026-10-18 - process_dtu() prefetches DTU textures into texture_manifest, used instead of file system checks
+2026-10-18 - process_dtu() deduplicate_materials: one material and slot per unique DTU Properties signature of an object
 
 Blender python module containing various tools for importing and exporting
 asset files in dtu format to blender, gltf and swapping out full res, 2K, 1K
@@ -21,42 +28,181 @@ logFilename = "blender_tools.log"
 MISSING_METALLIC_TEX_WORKAROUND = True
 
 ## Do not modify below
-import sys, json, os
+import sys, json, os, hashlib
+import log_tools
 try:
     import bpy
     import NodeArrange
+    import pipeline_cache
+    import texture_tools
 except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
 def _add_to_log(sMessage):
-    print(str(sMessage))
-    with open(logFilename, "a") as file:
-        file.write(sMessage + "\n")
+    log_tools.log(sMessage, logFilename)
 
 
+# Image cache: images are shared per (file content hash, color space), so a texture copied into several
+# folders is only decoded and packed once.  When the decoded size of the cached images goes over
+# image_cache_max_bytes (DAZTOROBLOX_IMAGE_CACHE_MAX_MB), images no longer used by any material are
+# removed, least recently used first.  Blender decodes images lazily, so the decoded size of an image that was
+# not decoded yet is estimated when it is loaded (see estimate_image_decoded_bytes()).
+image_cache_max_bytes = int(os.environ.get("DAZTOROBLOX_IMAGE_CACHE_MAX_MB", "4096")) * 1024 * 1024
+# (path + color space) -> image
 global_image_cache = {}
+# (content hash, color space) -> image
+image_content_cache = {}
+# image name -> last use (image_cache_use_count)
+image_cache_last_use = {}
+image_cache_use_count = 0
+# image name -> estimated decoded size in bytes
+image_cache_decoded_bytes = {}
+image_cache_stats = {"hits": 0, "content_hits": 0, "misses": 0, "evictions": 0,
+                     "loaded_bytes": 0, "deduplicated_bytes": 0, "evicted_bytes": 0, "peak_decoded_bytes": 0}
 
 def scalar_to_vec3(i):
     return [i, i, i]
 
 
+# returns the cached image for key, or None if it is not cached or was removed from bpy.data
+def get_cached_image(cache, key):
+    cached_image = cache.get(key)
+    if cached_image is None:
+        return None
+    try:
+        cached_image.name
+    except ReferenceError:
+        del cache[key]
+        return None
+    return cached_image
+
 def cached_image_load(texture_map, color_space=None):
-    global global_image_cache
+    global global_image_cache, image_cache_use_count
     cached_image = None
     # lookup texture_map in cache to see if it's already loaded
     hashed_texture_map = texture_map + str(color_space)
     #hashed_texture_map = texture_map
-    if (hashed_texture_map in global_image_cache):
+    cached_image = get_cached_image(global_image_cache, hashed_texture_map)
+    if cached_image is not None:
         _add_to_log("DEBUG: load_cached_image_to_material(): using cached image: " + texture_map)
-        cached_image = global_image_cache[hashed_texture_map]
+        image_cache_stats["hits"] += 1
     else:
-        _add_to_log("DEBUG: load_cached_image_to_material(): loading image: " + texture_map)
-        cached_image = bpy.data.images.load(texture_map)
-        if color_space is not None:
-            cached_image.colorspace_settings.name = color_space
+        # same bytes under another path: share the image
+        content_hash = pipeline_cache.hash_file(texture_map)
+        content_key = None
+        if content_hash is not None:
+            content_key = (content_hash, str(color_space))
+            cached_image = get_cached_image(image_content_cache, content_key)
+        if cached_image is not None:
+            _add_to_log("DEBUG: load_cached_image_to_material(): same content as " + cached_image.filepath + ", using cached image: " + texture_map)
+            image_cache_stats["content_hits"] += 1
+            image_cache_stats["deduplicated_bytes"] += os.path.getsize(texture_map)
+        else:
+            _add_to_log("DEBUG: load_cached_image_to_material(): loading image: " + texture_map)
+            cached_image = bpy.data.images.load(texture_map)
+            if color_space is not None:
+                cached_image.colorspace_settings.name = color_space
+            image_cache_decoded_bytes[cached_image.name] = estimate_image_decoded_bytes(texture_map)
+            image_cache_stats["misses"] += 1
+            if content_key is not None:
+                image_cache_stats["loaded_bytes"] += os.path.getsize(texture_map)
+                image_content_cache[content_key] = cached_image
+            evict_image_cache(keep_image=cached_image)
         global_image_cache[hashed_texture_map] = cached_image
+    image_cache_use_count += 1
+    image_cache_last_use[cached_image.name] = image_cache_use_count
     return cached_image    
 
+# decoded size of the texture file, from the texture_manifest header probe or the image file, 0 if unknown.
+# Blender decodes 8 bit images to 4 channel byte buffers whatever the channels of the file.
+def estimate_image_decoded_bytes(texture_map):
+    record = texture_manifest.get(texture_tools.get_manifest_key(texture_map))
+    if record is not None and record["width"] is not None:
+        image_size = (record["width"], record["height"])
+    else:
+        image_size = texture_tools.get_image_size(texture_map)
+    if image_size is None:
+        return 0
+    return image_size[0] * image_size[1] * 4
+
+# memory used by the pixels of an image: the actual size once decoded, the estimate made when it was loaded before
+def get_image_decoded_bytes(image):
+    if not image.has_data:
+        return image_cache_decoded_bytes.get(image.name, 0)
+    bytes_per_channel = 4 if image.is_float else 1
+    return image.size[0] * image.size[1] * image.channels * bytes_per_channel
+
+def get_cached_images():
+    cached_images = {}
+    for cache in [global_image_cache, image_content_cache]:
+        for key in list(cache.keys()):
+            cached_image = get_cached_image(cache, key)
+            if cached_image is not None:
+                cached_images[cached_image.name] = cached_image
+    return list(cached_images.values())
+
+def get_image_cache_decoded_bytes():
+    decoded_bytes = sum(get_image_decoded_bytes(cached_image) for cached_image in get_cached_images())
+    image_cache_stats["peak_decoded_bytes"] = max(image_cache_stats["peak_decoded_bytes"], decoded_bytes)
+    return decoded_bytes
+
+# remove cached images without users, least recently used first, until the decoded size of the cached images
+# fits in max_bytes (default: image_cache_max_bytes).  Returns the number of removed images.
+def evict_image_cache(max_bytes=None, keep_image=None):
+    if max_bytes is None:
+        max_bytes = image_cache_max_bytes
+    cached_images = get_cached_images()
+    decoded_bytes = get_image_cache_decoded_bytes()
+    if decoded_bytes <= max_bytes:
+        return 0
+    unused_images = [cached_image for cached_image in cached_images if cached_image.users == 0 and cached_image != keep_image]
+    unused_images.sort(key=lambda cached_image: image_cache_last_use.get(cached_image.name, 0))
+    num_evicted = 0
+    for cached_image in unused_images:
+        if decoded_bytes <= max_bytes:
+            break
+        image_bytes = get_image_decoded_bytes(cached_image)
+        if image_bytes == 0:
+            continue
+        for cache in [global_image_cache, image_content_cache]:
+            for key in [key for key, value in cache.items() if value == cached_image]:
+                del cache[key]
+        image_cache_last_use.pop(cached_image.name, None)
+        image_cache_decoded_bytes.pop(cached_image.name, None)
+        _add_to_log(f"DEBUG: evict_image_cache(): removing unused image: {cached_image.name} ({image_bytes} bytes)")
+        bpy.data.images.remove(cached_image)
+        decoded_bytes -= image_bytes
+        image_cache_stats["evictions"] += 1
+        image_cache_stats["evicted_bytes"] += image_bytes
+        num_evicted += 1
+    return num_evicted
+
+def clear_image_cache():
+    texture_manifest.clear()
+    global_image_cache.clear()
+    image_content_cache.clear()
+    image_cache_last_use.clear()
+    image_cache_decoded_bytes.clear()
+
+def get_image_cache_stats():
+    stats = dict(image_cache_stats)
+    stats["decoded_bytes"] = get_image_cache_decoded_bytes()
+    stats["peak_decoded_bytes"] = image_cache_stats["peak_decoded_bytes"]
+    stats["images"] = len(get_cached_images())
+    return stats
+
+def reset_image_cache_stats():
+    for name in image_cache_stats:
+        image_cache_stats[name] = 0
+
+def log_image_cache_stats():
+    stats = get_image_cache_stats()
+    _add_to_log(f"DEBUG: image cache: {stats['images']} images, {stats['hits']} hits, {stats['content_hits']} shared by content "
+                f"({stats['deduplicated_bytes']} bytes not loaded again), {stats['misses']} loaded ({stats['loaded_bytes']} bytes), "
+                f"{stats['evictions']} evicted ({stats['evicted_bytes']} bytes), decoded: {stats['decoded_bytes']} bytes "
+                f"(peak: {stats['peak_decoded_bytes']} bytes)")
+    return stats
+
 
 def load_cached_image_to_material(matName, input_key, output_key, texture_map, texture_value, color_space=None):
     cached_image = cached_image_load(texture_map, color_space)
@@ -127,24 +273,46 @@ def fix_scalp():
             mat.use_backface_culling = True
             mat.show_transparent_back = False
 
-def swap_lowres_filename(filename, lowres_mode="2k"):
+# texture files referenced by the DTU being processed, {texture_tools.get_manifest_key(path): record}
+texture_manifest = {}
+
+# same as os.path.exists(), answered from texture_manifest for prefetched textures
+def texture_file_exists(file_path):
+    record = texture_manifest.get(texture_tools.get_manifest_key(file_path))
+    if record is None:
+        return os.path.exists(file_path)
+    return record["exists"]
+
+# low resolution file names tried by swap_lowres_filename(), in order
+def get_lowres_candidates(filename, lowres_mode="2k"):
     filename_base, ext = os.path.splitext(filename)
     filename_2k = filename_base + "_2k"
     filename_1k = filename_base + "_1k"
-    filename_square_png = filename_base + "_square.png"
-    if os.path.exists(filename_square_png):
-        return filename_square_png
+    candidates = [filename_base + "_square.png"]
     if lowres_mode.lower() == "1k":
-        if os.path.exists(filename_1k + ".jpg"):
-            return filename_1k + ".jpg"
-        if os.path.exists(filename_1k + ext):
-            return filename_1k + ext
-    if os.path.exists(filename_2k + ".jpg"):
-        return filename_2k + ".jpg"
-    if os.path.exists(filename_2k + ext):
-        return filename_2k + ext
+        candidates += [filename_1k + ".jpg", filename_1k + ext]
+    candidates += [filename_2k + ".jpg", filename_2k + ext]
+    return candidates
+
+def swap_lowres_filename(filename, lowres_mode="2k"):
+    for candidate in get_lowres_candidates(filename, lowres_mode):
+        if texture_file_exists(candidate):
+            return candidate
     return filename
 
+# probe all texture files of the DTU materials (and their low resolution and downscaled variants) at once
+def prefetch_texture_manifest(materialsList, lowres_mode=None, texture_variants=None):
+    texture_paths = []
+    for mat in materialsList:
+        for texture_path in texture_tools.get_material_texture_paths(mat):
+            texture_paths.append(texture_path)
+            if lowres_mode is not None:
+                texture_paths += get_lowres_candidates(texture_path, lowres_mode)
+            if texture_variants and texture_path in texture_variants:
+                texture_paths.append(texture_variants[texture_path])
+    texture_manifest.clear()
+    texture_manifest.update(texture_tools.prefetch_textures(texture_paths))
+
 def remove_unlinked_shader_nodes(mat_name):
     # Get the material
     material = bpy.data.materials.get(mat_name)
@@ -302,7 +470,7 @@ def apply_tpose_for_g8_g9():
 
 
 
-def process_material(mat, lowres_mode=None):
+def process_material(mat, lowres_mode=None, texture_variants=None):
     matName = ""
     colorMap = ""
     color_value = None
@@ -420,6 +588,18 @@ def process_material(mat, lowres_mode=None):
         _add_to_log("ERROR: process_dtu(): unable to retrieve extra maps: " + str(e))
         raise e
 
+    # downscaled variants made by texture_tools.prepare_textures()
+    if texture_variants:
+        colorMap = texture_variants.get(colorMap, colorMap)
+        metallicMap = texture_variants.get(metallicMap, metallicMap)
+        specular_weight_map = texture_variants.get(specular_weight_map, specular_weight_map)
+        reflectivity_map = texture_variants.get(reflectivity_map, reflectivity_map)
+        roughnessMap = texture_variants.get(roughnessMap, roughnessMap)
+        glossy_weight_map = texture_variants.get(glossy_weight_map, glossy_weight_map)
+        emissionMap = texture_variants.get(emissionMap, emissionMap)
+        normalMap = texture_variants.get(normalMap, normalMap)
+        cutoutMap = texture_variants.get(cutoutMap, cutoutMap)
+
     # _add_to_log("DEBUG: process_dtu(): matname=" + matName)
     # _add_to_log("DEBUG: process_dtu(): c map = \"" + str(colorMap) + "\"")
     # _add_to_log("DEBUG: process_dtu(): m map = \"" + str(metallicMap) + "\"")
@@ -449,7 +629,7 @@ def process_material(mat, lowres_mode=None):
     bsdf_inputs = nodes["Principled BSDF"].inputs
 
     if (colorMap != ""):
-        if (not os.path.exists(colorMap)):
+        if (not texture_file_exists(colorMap)):
             _add_to_log("ERROR: process_dtu(): color map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -464,7 +644,7 @@ def process_material(mat, lowres_mode=None):
         bsdf_inputs["Base Color"].default_value = color_value
 
     if (metallicMap != ""):
-        if (not os.path.exists(metallicMap)):
+        if (not texture_file_exists(metallicMap)):
             _add_to_log("ERROR: process_dtu(): metallic map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -502,7 +682,7 @@ def process_material(mat, lowres_mode=None):
             links.new(node_tex.outputs["Color"], bsdf_inputs["Metallic"])
 
     if (reflectivity_map != ""):
-        if (not os.path.exists(reflectivity_map)):
+        if (not texture_file_exists(reflectivity_map)):
             _add_to_log("ERROR: process_dtu(): specular reflectivity map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -514,7 +694,7 @@ def process_material(mat, lowres_mode=None):
             # link = links.new(node_tex.outputs["Color"], bsdf_inputs["Specular"])
             load_cached_image_to_material(matName, "Roughness", "Color", reflectivity_map, reflectivity_value, "Non-Color")
     elif (specular_weight_map != ""):
-        if (not os.path.exists(specular_weight_map)):
+        if (not texture_file_exists(specular_weight_map)):
             _add_to_log("ERROR: process_dtu(): specular weight map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -526,7 +706,7 @@ def process_material(mat, lowres_mode=None):
             # link = links.new(node_tex.outputs["Color"], bsdf_inputs["Specular"])
             load_cached_image_to_material(matName, "Roughness", "Color", specular_weight_map, dual_lobe_specular_weight, "Non-Color")
     elif (glossy_weight_map != ""):
-        if (not os.path.exists(glossy_weight_map)):
+        if (not texture_file_exists(glossy_weight_map)):
             _add_to_log("ERROR: process_dtu(): glossy weight map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -560,7 +740,7 @@ def process_material(mat, lowres_mode=None):
             bsdf_inputs["Specular"].default_value = 0.0
 
     if (roughnessMap != ""):
-        if (not os.path.exists(roughnessMap)):
+        if (not texture_file_exists(roughnessMap)):
             _add_to_log("ERROR: process_dtu(): roughness map file does not exist, skipping...")
         else:
             # # _add_to_log("DEBUG: Creating Roughness Node to: " + roughnessMap )
@@ -577,7 +757,7 @@ def process_material(mat, lowres_mode=None):
         bsdf_inputs["Roughness"].default_value = roughness_value
 
     if (emissionMap != ""):
-        if (not os.path.exists(emissionMap)):
+        if (not texture_file_exists(emissionMap)):
             _add_to_log("ERROR: process_dtu(): emission map file does not exist, skipping...")
         else:
             # # create image texture node
@@ -603,7 +783,7 @@ def process_material(mat, lowres_mode=None):
             bsdf_inputs["Emission"].default_value = [0, 0, 0, 0]
 
     if (normalMap != ""):
-        if (not os.path.exists(normalMap)):
+        if (not texture_file_exists(normalMap)):
             _add_to_log("ERROR: process_dtu(): normal map file does not exist, skipping...")
         else:
             # create image texture node
@@ -668,7 +848,7 @@ def process_material(mat, lowres_mode=None):
         if bsdf_inputs["Metallic"].default_value < refraction_weight:
             bsdf_inputs["Metallic"].default_value = refraction_weight
         if (cutoutMap != ""):
-            if (not os.path.exists(cutoutMap)):
+            if (not texture_file_exists(cutoutMap)):
                 _add_to_log("ERROR: process_dtu(): cutout map file does not exist, skipping...")
             else:
                 # create image texture node
@@ -686,7 +866,75 @@ def process_material(mat, lowres_mode=None):
     NodeArrange.toNodeArrange(data.node_tree.nodes)
     _add_to_log("DEBUG: process_dtu(): done processing material: " + matName)
 
-def process_dtu(jsonPath, lowres_mode=None):
+# hash of the owning asset and the Properties block of a DTU material, materials with the same signature get
+# identical node trees.  The asset name keeps materials from being shared between objects, later stages rename
+# and modify materials per object.
+def get_material_signature(mat):
+    signature_json = json.dumps([mat.get("Asset Name", ""), mat.get("Properties", [])], sort_keys=True)
+    return hashlib.sha256(signature_json.encode("utf-8")).hexdigest()
+
+# material names kept even when their properties match another material, other code finds them by name
+material_dedup_protected_names = ["scalp", "skullcap", "cap", "moisture", "tear"]
+
+# Find DTU materials with the same signature as an earlier one, point all material slots using them to that
+# material, merge the slots and remove them.  Returns {duplicate material name: shared material name}.
+def deduplicate_dtu_materials(materialsList):
+    shared_material_names = {}
+    duplicate_material_names = {}
+    for mat in materialsList:
+        matName = mat["Material Name"]
+        if matName not in bpy.data.materials or matName in duplicate_material_names:
+            continue
+        if any(protected_name in matName.lower() for protected_name in material_dedup_protected_names):
+            continue
+        shared_material_name = shared_material_names.setdefault(get_material_signature(mat), matName)
+        if shared_material_name != matName:
+            duplicate_material_names[matName] = shared_material_name
+    if not duplicate_material_names:
+        return duplicate_material_names
+
+    for obj in bpy.data.objects:
+        remapped = False
+        for mat_slot in obj.material_slots:
+            if mat_slot.material is not None and mat_slot.material.name in duplicate_material_names:
+                mat_slot.material = bpy.data.materials[duplicate_material_names[mat_slot.material.name]]
+                remapped = True
+        if remapped and obj.type == 'MESH':
+            merge_duplicate_material_slots(obj)
+    for matName, shared_material_name in duplicate_material_names.items():
+        _add_to_log("DEBUG: deduplicate_dtu_materials(): replacing material: " + matName + " with " + shared_material_name)
+        bpy.data.materials.remove(bpy.data.materials[matName])
+    _add_to_log(f"DEBUG: deduplicate_dtu_materials(): {len(duplicate_material_names)} materials replaced by {len(set(duplicate_material_names.values()))} shared materials")
+    return duplicate_material_names
+
+# merge material slots of obj that use the same material, faces are moved to the first slot
+def merge_duplicate_material_slots(obj):
+    mesh = obj.data
+    unique_materials = []
+    slot_remap = []
+    for material in mesh.materials:
+        if material is None or material not in unique_materials:
+            unique_materials.append(material)
+            slot_remap.append(len(unique_materials) - 1)
+        else:
+            slot_remap.append(unique_materials.index(material))
+    if len(unique_materials) == len(mesh.materials):
+        return 0
+    material_indices = [0] * len(mesh.polygons)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    material_indices = [slot_remap[index] if index < len(slot_remap) else index for index in material_indices]
+    # move the unique materials to the first slots, then drop the trailing slots no face uses anymore
+    for index, material in enumerate(unique_materials):
+        mesh.materials[index] = material
+    mesh.polygons.foreach_set("material_index", material_indices)
+    removed_count = len(mesh.materials) - len(unique_materials)
+    for index in range(removed_count):
+        mesh.materials.pop(index=len(mesh.materials) - 1)
+    mesh.update()
+    _add_to_log(f"DEBUG: merge_duplicate_material_slots(): {obj.name}: merged {removed_count} material slots")
+    return removed_count
+
+def process_dtu(jsonPath, lowres_mode=None, texture_variants=None, deduplicate_materials=False):
     _add_to_log("DEBUG: process_dtu(): json file = " + jsonPath)
     jsonObj = {}
     dtuVersion = -1
@@ -751,6 +999,11 @@ def process_dtu(jsonPath, lowres_mode=None):
             _add_to_log("DEBUG: process_dtu(): renaming object: " + obj.name + " to " + studio_label)
             obj.name = studio_label
 
+    # build one node tree per unique set of material properties
+    duplicate_material_names = {}
+    if deduplicate_materials:
+        duplicate_material_names = deduplicate_dtu_materials(materialsList)
+
     # delete all nodes from materials so that we can rebuild them
     for mat in materialsList:
         matName = mat["Material Name"]
@@ -762,10 +1015,15 @@ def process_dtu(jsonPath, lowres_mode=None):
 #            _add_to_log("DEBUG: process_dtu(): removing node: " + node.name)
             nodes.remove(node)
 
+    # probe all textures at once instead of one file system check after the other
+    prefetch_texture_manifest(materialsList, lowres_mode, texture_variants)
+
     # find and process each DTU material node
     for mat in materialsList:
+        if mat["Material Name"] in duplicate_material_names:
+            continue
         try:
-            process_material(mat, lowres_mode)
+            process_material(mat, lowres_mode, texture_variants)
         except Exception as e:
             _add_to_log("ERROR: exception caught while processing material: " + mat["Material Name"] + ", " + str(e))
             if "moisture" not in mat["Material Name"].lower():
@@ -868,3 +1126,215 @@ def apply_mesh_modifiers(obj):
     else:
         _add_to_log("ERROR: apply_mesh_modifiers(): Object is not a mesh.")
         return
+
+
+# Export variants: the FBX and GLB outputs are exported from one in-memory scene.  Instead of saving the
+# scene and reopening it before the next export, snapshot_export_state() records what an export variant
+# changes (object parenting and transforms, selection, scene unit scale and fps) and restore_export_state()
+# puts it back, undoing any armature scale baked with bake_armature_scale() since the snapshot.
+def snapshot_export_state():
+    scene = bpy.context.scene
+    object_states = {}
+    for obj in scene.objects:
+        object_states[obj.name] = {
+            "parent": obj.parent.name if obj.parent is not None else None,
+            "parent_type": obj.parent_type,
+            "parent_bone": obj.parent_bone,
+            "matrix_parent_inverse": obj.matrix_parent_inverse.copy(),
+            "matrix_world": obj.matrix_world.copy(),
+            "selected": obj.select_get(),
+        }
+    active_object = bpy.context.view_layer.objects.active
+    return {
+        "objects": object_states,
+        "active": active_object.name if active_object is not None else None,
+        "scale_length": scene.unit_settings.scale_length,
+        "fps": scene.render.fps,
+        "frame_current": scene.frame_current,
+        "baked_scales": {},
+    }
+
+# scale armature (and the objects parented to it) by scale_factor, apply the scale and propagate it to the
+# animation keyframes.  With export_state, the scale is undone by restore_export_state().
+def bake_armature_scale(armature, scale_factor, export_state=None):
+    bpy.ops.object.select_all(action="DESELECT")
+    armature.select_set(True)
+    bpy.context.view_layer.objects.active = armature
+    bpy.ops.transform.resize(value=(scale_factor, scale_factor, scale_factor))
+    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+    # Apply the scale work-around to animation keyframes
+    propagate_scale_to_animation(armature, scale_factor)
+    if export_state is not None:
+        baked_scales = export_state["baked_scales"]
+        baked_scales[armature.name] = baked_scales.get(armature.name, 1.0) * scale_factor
+
+def restore_export_state(export_state):
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode="OBJECT")
+    for armature_name, baked_scale in export_state["baked_scales"].items():
+        armature = bpy.data.objects.get(armature_name)
+        if armature is not None and baked_scale != 1.0:
+            bake_armature_scale(armature, 1.0 / baked_scale)
+    export_state["baked_scales"] = {}
+
+    for obj_name, obj_state in export_state["objects"].items():
+        obj = bpy.data.objects.get(obj_name)
+        if obj is None:
+            _add_to_log("ERROR: restore_export_state(): object not found: " + obj_name)
+            continue
+        parent = bpy.data.objects.get(obj_state["parent"]) if obj_state["parent"] is not None else None
+        if obj.parent != parent:
+            obj.parent = parent
+        if obj.parent_type != obj_state["parent_type"]:
+            obj.parent_type = obj_state["parent_type"]
+        if obj.parent_bone != obj_state["parent_bone"]:
+            obj.parent_bone = obj_state["parent_bone"]
+        obj.matrix_parent_inverse = obj_state["matrix_parent_inverse"]
+        obj.matrix_world = obj_state["matrix_world"]
+        obj.select_set(obj_state["selected"])
+
+    scene = bpy.context.scene
+    scene.unit_settings.scale_length = export_state["scale_length"]
+    scene.render.fps = export_state["fps"]
+    scene.frame_set(export_state["frame_current"])
+    if export_state["active"] is not None:
+        bpy.context.view_layer.objects.active = bpy.data.objects.get(export_state["active"])
+    bpy.context.view_layer.update()
+
+
+# Stage profiling: wall time, CPU time, peak RSS and scene vertex/face counts per named pipeline stage.
+# Stages listed in the DAZTOROBLOX_CPROFILE_STAGES environment variable (comma separated) are also run
+# under cProfile and dumped to <stage name>.prof in cprofile_output_folder.
+stage_records = []
+open_stages = {}
+cprofile_stage_names = [name.strip() for name in os.environ.get("DAZTOROBLOX_CPROFILE_STAGES", "").split(",") if name.strip()]
+cprofile_output_folder = None
+
+# peak resident memory of this process in bytes, None if not available
+def get_peak_rss():
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except Exception:
+        pass
+    return None
+
+def get_scene_mesh_counts():
+    num_vertices = 0
+    num_faces = 0
+    num_objects = 0
+    for obj in bpy.data.objects:
+        if obj.type == 'MESH':
+            num_vertices += len(obj.data.vertices)
+            num_faces += len(obj.data.polygons)
+            num_objects += 1
+    return num_vertices, num_faces, num_objects
+
+def begin_stage(stage_name):
+    import time
+    profiler = None
+    if stage_name in cprofile_stage_names:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    open_stages[stage_name] = (time.perf_counter(), time.process_time(), profiler)
+    set_stage_log_context(stage_name)
+
+# per object stages are named "<object name>:<stage>"
+def set_stage_log_context(stage_name):
+    if stage_name is None:
+        log_tools.set_log_context(None, None)
+    elif ":" in stage_name:
+        object_name, stage = stage_name.rsplit(":", 1)
+        log_tools.set_log_context(stage, object_name)
+    else:
+        log_tools.set_log_context(stage_name, None)
+
+# stage name usable as a file name on all platforms, per object stage names contain ':'
+def get_stage_filename(stage_name):
+    return "".join("_" if char in '<>:"/\\|?*' or ord(char) < 32 else char for char in stage_name).strip(" .") or "stage"
+
+def end_stage(stage_name):
+    import time
+    if stage_name not in open_stages:
+        _add_to_log("ERROR: end_stage(): stage was not started: " + stage_name)
+        return None
+    start_wall_time, start_cpu_time, profiler = open_stages.pop(stage_name)
+    set_stage_log_context(list(open_stages)[-1] if open_stages else None)
+    record = {
+        "stage": stage_name,
+        "wall_time": time.perf_counter() - start_wall_time,
+        "cpu_time": time.process_time() - start_cpu_time,
+        "peak_rss": get_peak_rss(),
+    }
+    if profiler is not None:
+        profiler.disable()
+        profile_path = os.path.join(cprofile_output_folder or os.getcwd(), get_stage_filename(stage_name) + ".prof")
+        try:
+            profiler.dump_stats(profile_path)
+            record["cprofile"] = profile_path.replace("\\","/")
+        except OSError as e:
+            _add_to_log("ERROR: end_stage(): unable to write " + profile_path + ": " + str(e))
+    try:
+        record["vertices"], record["faces"], record["mesh_objects"] = get_scene_mesh_counts()
+    except Exception:
+        pass
+    stage_records.append(record)
+    _add_to_log(f"DEBUG: end_stage(): {stage_name}: wall={record['wall_time']:.3f}s cpu={record['cpu_time']:.3f}s")
+    return record
+
+# context manager and decorator: "with profile_stage("fbx_import"):" or "@profile_stage("fbx_import")"
+class profile_stage:
+    def __init__(self, stage_name):
+        self.stage_name = stage_name
+
+    def __enter__(self):
+        begin_stage(self.stage_name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_stage(self.stage_name)
+        return False
+
+    def __call__(self, function):
+        def wrapper(*args, **kwargs):
+            with profile_stage(self.stage_name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+# write all stage records (and any stages still open) to a json file
+def write_stage_timings(json_path, extra_info=None):
+    timings = {"stages": list(stage_records), "open_stages": list(open_stages.keys()), "peak_rss": get_peak_rss()}
+    timings["total_wall_time"] = sum(record["wall_time"] for record in stage_records)
+    if extra_info is not None:
+        timings.update(extra_info)
+    try:
+        with open(json_path, "w") as file:
+            json.dump(timings, file, indent=2)
+        _add_to_log("DEBUG: write_stage_timings(): " + json_path)
+    except Exception as e:
+        _add_to_log("ERROR: write_stage_timings(): unable to write " + json_path + ": " + str(e))
+
+def reset_stage_timings():
+    stage_records.clear()
+    open_stages.clear()
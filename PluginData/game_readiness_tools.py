@@ -13,78 +13,228 @@ from pathlib import Path
 script_dir = str(Path( __file__ ).parent.absolute())
 
 import os
+import time
+import log_tools
 
 try:
     import bpy
     import NodeArrange
+    import image_buffer_tools
+    import pipeline_cache
 except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage)
     
 
-# do a mesh separation based on a vertex group, and keep the normals of the original mesh, but by "keep_normals", I mean to copy normal vectors to two arrays for the new object and the remaining object based on the vertex group or inverse of the vertex group, then for each vertex in the new mesh and remaining mesh, assign the normal vector from the corresponding array
-# def separate_by_vertexgroup_keep_normals(obj, vertex_group_name):
 def separate_by_vertexgroup(obj, vertex_group_name):
-    # make list of all original objects
-    original_objects = bpy.data.objects[:]
-
-    # 1. check if obj is a mesh
-    if obj.type == 'MESH':
-        # 2. then check if the vertex group exists
-        vertex_group = obj.vertex_groups.get(vertex_group_name)
-        if vertex_group:
-            # 3. then prepare two arrays for normal vectors, one for the new object, and one for the remaining object
-            normals_new = []
-            normals_remaining = []
-            vertex_group_index = vertex_group.index
-            # 4. copy normal vectors to the arrays based on the vertex group
-            for vertex in obj.data.vertices:
-                if any(group.group == vertex_group_index for group in vertex.groups):
-                    normals_new.append(vertex.normal)
-                else:
-                    normals_remaining.append(vertex.normal)
+    geo_name = vertex_group_name.replace("_GeoGroup", "_Geo")
+    new_objects = separate_by_vertexgroups(obj, {vertex_group_name: geo_name})
+    return new_objects.get(geo_name)
+
+# foreach_get/foreach_set access of generic mesh attributes: data_type -> (property, components, dtype)
+attribute_foreach_access = {
+    "FLOAT": ("value", 1, "float32"),
+    "INT": ("value", 1, "int32"),
+    "INT8": ("value", 1, "int32"),
+    "BOOLEAN": ("value", 1, "bool"),
+    "FLOAT2": ("vector", 2, "float32"),
+    "INT32_2D": ("value", 2, "int32"),
+    "FLOAT_VECTOR": ("vector", 3, "float32"),
+    "FLOAT_COLOR": ("color", 4, "float32"),
+    "BYTE_COLOR": ("color", 4, "float32"),
+    "QUATERNION": ("value", 4, "float32"),
+}
+# attributes copied with the mesh element properties instead of as generic attributes
+separate_skipped_attributes = ["position", "material_index", "sharp_face", "sharp_edge", "custom_normal"]
+
+def get_foreach_array(collection, property_name, count, components, dtype):
+    values = np.empty(count * components, dtype=dtype)
+    collection.foreach_get(property_name, values)
+    return values.reshape(-1, components) if components > 1 else values
+
+# loop indices of face_indices, in face order
+def get_face_loop_indices(loop_start, loop_total, face_indices):
+    totals = loop_total[face_indices]
+    part_loop_start = np.cumsum(totals) - totals
+    return np.repeat(loop_start[face_indices] - part_loop_start, totals) + np.arange(totals.sum())
+
+# Split obj into one new object per {vertex group name: new object name} entry, in a single pass.
+# Each face goes to the first group (in mapping order) that contains all of its vertices, which is the
+# same result as calling bpy.ops.mesh.separate() once per group; faces in none of the groups stay in obj.
+# The mesh data is read once, then every part is built with from_pydata() from the vertices its faces use,
+# and its UVs, custom normals, materials, generic attributes, shape keys and vertex weights are copied
+# through a vertex/edge/loop index remap.  Loose edges and vertices are not carried into the parts (they
+# stay in obj).  Returns {new object name: new object}.
+def separate_by_vertexgroups(obj, group_output_names):
+    new_objects = {}
+    if obj.type != 'MESH':
+        _add_to_log("ERROR: Active object is not a mesh.")
+        return new_objects
 
-            # 5. then perform the separation based on the vertex group by selecting the vertices in the vertex group and then separate by selection
-            print("DEBUG: Separating mesh based on vertex group: ", vertex_group_name)
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bpy.ops.object.select_all(action='DESELECT')
-            obj.select_set(True)
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.vertex_group_set_active(group=vertex_group_name)
-            bpy.ops.object.vertex_group_select()
+    bpy.ops.object.mode_set(mode='OBJECT')
+    mesh = obj.data
+    num_faces = len(mesh.polygons)
+    loop_start, loop_total, loop_verts, _, _ = get_polygon_loop_arrays(mesh)
+    vertex_group_weights = VertexGroupWeights(obj)
+
+    # assign every face to a part
+    face_parts = np.full(num_faces, -1, dtype=np.int64)
+    part_names = []
+    for vertex_group_name, output_name in group_output_names.items():
+        if obj.vertex_groups.get(vertex_group_name) is None:
+            _add_to_log(f"ERROR: Vertex group '{vertex_group_name}' not found.")
+            continue
+        _add_to_log("DEBUG: Separating mesh based on vertex group: " + vertex_group_name)
+        in_group = vertex_group_weights.get_membership_mask(vertex_group_name)
+        if num_faces > 0:
+            part_faces = np.logical_and.reduceat(in_group[loop_verts], loop_start) & (face_parts < 0)
+        else:
+            part_faces = np.zeros(0, dtype=bool)
+        if not np.any(part_faces):
+            _add_to_log(f"ERROR: Separation failed. Make sure the vertex group ({vertex_group_name}) is not empty.")
+            continue
+        face_parts[part_faces] = len(part_names)
+        part_names.append(output_name)
+
+    if len(part_names) == 0:
+        return new_objects
+
+    # read the mesh data once
+    num_verts = len(mesh.vertices)
+    num_edges = len(mesh.edges)
+    num_loops = len(mesh.loops)
+    coords = get_foreach_array(mesh.vertices, "co", num_verts, 3, np.float32)
+    edge_verts = get_foreach_array(mesh.edges, "vertices", num_edges, 2, np.int64)
+    edge_keys = np.minimum(edge_verts[:, 0], edge_verts[:, 1]) * num_verts + np.maximum(edge_verts[:, 0], edge_verts[:, 1])
+    edge_order = np.argsort(edge_keys)
+    face_data = {name: get_foreach_array(mesh.polygons, name, num_faces, 1, dtype)
+                 for name, dtype in [("material_index", np.int32), ("use_smooth", bool)]}
+    edge_data = {name: get_foreach_array(mesh.edges, name, num_edges, 1, bool) for name in ["use_seam", "use_edge_sharp"]}
+    uv_data = {uv_layer.name: get_foreach_array(uv_layer.data, "uv", num_loops, 2, np.float32) for uv_layer in mesh.uv_layers}
+    loop_normals = None
+    if mesh.has_custom_normals:
+        if hasattr(mesh, "corner_normals"):
+            loop_normals = get_foreach_array(mesh.corner_normals, "vector", num_loops, 3, np.float32)
+        else:
+            mesh.calc_normals_split()
+            loop_normals = get_foreach_array(mesh.loops, "normal", num_loops, 3, np.float32)
+    domain_sizes = {"POINT": num_verts, "EDGE": num_edges, "FACE": num_faces, "CORNER": num_loops}
+    attribute_data = {}
+    for attribute in mesh.attributes:
+        if (attribute.name.startswith(".") or attribute.name in separate_skipped_attributes or attribute.name in uv_data
+                or attribute.domain not in domain_sizes or attribute.data_type not in attribute_foreach_access):
+            continue
+        property_name, components, dtype = attribute_foreach_access[attribute.data_type]
+        attribute_data[attribute.name] = (attribute.domain, attribute.data_type,
+            get_foreach_array(attribute.data, property_name, domain_sizes[attribute.domain], components, dtype))
+
+    part_vertex_list = []
+    for part_index, output_name in enumerate(part_names):
+        face_indices = np.flatnonzero(face_parts == part_index)
+        loop_indices = get_face_loop_indices(loop_start, loop_total, face_indices)
+        part_verts = np.unique(loop_verts[loop_indices])
+        vertex_remap = np.full(num_verts, -1, dtype=np.int64)
+        vertex_remap[part_verts] = np.arange(len(part_verts))
+        part_loop_verts = vertex_remap[loop_verts[loop_indices]].tolist()
+        part_faces = []
+        loop_index = 0
+        for total in loop_total[face_indices].tolist():
+            part_faces.append(part_loop_verts[loop_index:loop_index + total])
+            loop_index += total
+
+        part_mesh = bpy.data.meshes.new(output_name)
+        part_mesh.from_pydata(coords[part_verts].tolist(), [], part_faces)
+        for material in mesh.materials:
+            part_mesh.materials.append(material)
+        if hasattr(mesh, "use_auto_smooth"):
+            part_mesh.use_auto_smooth = mesh.use_auto_smooth
+            part_mesh.auto_smooth_angle = mesh.auto_smooth_angle
+
+        # edges of the part in the original mesh, from their sorted vertex pairs
+        part_edge_verts = part_verts[get_foreach_array(part_mesh.edges, "vertices", len(part_mesh.edges), 2, np.int64)]
+        part_edge_keys = np.minimum(part_edge_verts[:, 0], part_edge_verts[:, 1]) * num_verts + np.maximum(part_edge_verts[:, 0], part_edge_verts[:, 1])
+        edge_indices = edge_order[np.searchsorted(edge_keys, part_edge_keys, sorter=edge_order)]
+        domain_indices = {"POINT": part_verts, "EDGE": edge_indices, "FACE": face_indices, "CORNER": loop_indices}
+
+        for name, values in face_data.items():
+            part_mesh.polygons.foreach_set(name, values[face_indices])
+        for name, values in edge_data.items():
+            part_mesh.edges.foreach_set(name, values[edge_indices])
+        for name, values in uv_data.items():
+            part_mesh.uv_layers.new(name=name).data.foreach_set("uv", values[loop_indices].ravel())
+        if mesh.uv_layers.active is not None:
+            part_mesh.uv_layers.active = part_mesh.uv_layers[mesh.uv_layers.active.name]
+        for name, (domain, data_type, values) in attribute_data.items():
+            if name in part_mesh.attributes:
+                continue
             try:
-                bpy.ops.mesh.separate(type='SELECTED')
-                bpy.ops.object.mode_set(mode='OBJECT')
-            except RuntimeError:
-                bpy.ops.object.mode_set(mode='OBJECT')
-                print(f"ERROR: Separation failed. Make sure the vertex group ({vertex_group_name}) is not empty.")
-                return
-
-            # look for the new object by checking which object is not in the original objects
-            new_obj = None
-            for new_obj in bpy.data.objects:
-                if new_obj not in original_objects:
-                    break
-            if new_obj is None:
-                print("ERROR: New object not found after separation")
-                return
-            geo_name = vertex_group_name.replace("_GeoGroup", "_Geo")
-            new_obj.name = geo_name
-
-            # 6. then assign the normal vectors from the arrays to the new mesh and the remaining mesh
-            # print("DEBUG: Applying custom normals for vertex group: ", vertex_group_name)
-            # apply_custom_normals(new_obj, normals_new)
-            # print("DEBUG: Applying custom normals for remaining vertices")
-            # apply_custom_normals(obj, normals_remaining)
+                part_attribute = part_mesh.attributes.new(name, data_type, domain)
+                part_attribute.data.foreach_set(attribute_foreach_access[data_type][0], values[domain_indices[domain]].ravel())
+            except (RuntimeError, TypeError) as e:
+                _add_to_log(f"ERROR: separate_by_vertexgroups(): unable to copy attribute {name}: {e}")
+        active_color = getattr(mesh.color_attributes, "active_color", None)
+        if active_color is not None and active_color.name in part_mesh.color_attributes:
+            part_mesh.color_attributes.active_color = part_mesh.color_attributes[active_color.name]
+        part_mesh.update()
+        if loop_normals is not None:
+            part_mesh.normals_split_custom_set(loop_normals[loop_indices])
+
+        new_obj = obj.copy()
+        new_obj.data = part_mesh
+        for collection in obj.users_collection:
+            collection.objects.link(new_obj)
+        new_obj.name = output_name
+        part_mesh.name = output_name
+        new_objects[output_name] = new_obj
+        part_vertex_list.append((new_obj, part_verts, vertex_remap))
+
+        # vertex weights, one vertex_group.add() per group and weight value
+        entries = np.flatnonzero(vertex_remap[vertex_group_weights.vertex_indices] >= 0)
+        entries = entries[np.argsort(vertex_group_weights.group_indices[entries], kind="stable")]
+        groups, group_starts = np.unique(vertex_group_weights.group_indices[entries], return_index=True)
+        for group_index, group_entries in zip(groups.tolist(), np.split(entries, group_starts[1:])):
+            group_verts = vertex_remap[vertex_group_weights.vertex_indices[group_entries]]
+            weights, weight_inverse = np.unique(vertex_group_weights.weights[group_entries], return_inverse=True)
+            vertex_group = new_obj.vertex_groups[vertex_group_weights.group_names[group_index]]
+            for weight_index, weight in enumerate(weights.tolist()):
+                vertex_group.add(group_verts[weight_inverse == weight_index].tolist(), weight, 'REPLACE')
+
+    # shape keys: the same key blocks on every part, each original key block is read once
+    if mesh.shape_keys is not None:
+        key_blocks = list(mesh.shape_keys.key_blocks)
+        for new_obj, _, _ in part_vertex_list:
+            for key_block in key_blocks:
+                new_obj.shape_key_add(name=key_block.name, from_mix=False)
+            part_shape_keys = new_obj.data.shape_keys
+            part_shape_keys.use_relative = mesh.shape_keys.use_relative
+            for key_block in key_blocks:
+                part_key_block = part_shape_keys.key_blocks[key_block.name]
+                part_key_block.relative_key = part_shape_keys.key_blocks[key_block.relative_key.name]
+                part_key_block.slider_min = key_block.slider_min
+                part_key_block.slider_max = key_block.slider_max
+                part_key_block.value = key_block.value
+                part_key_block.mute = key_block.mute
+                part_key_block.interpolation = key_block.interpolation
+                part_key_block.vertex_group = key_block.vertex_group
+        for key_block in key_blocks:
+            key_coords = get_foreach_array(key_block.data, "co", num_verts, 3, np.float32)
+            for new_obj, part_verts, _ in part_vertex_list:
+                new_obj.data.shape_keys.key_blocks[key_block.name].data.foreach_set("co", key_coords[part_verts].ravel())
+
+    # remove all separated faces from the original object
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bm.faces.ensure_lookup_table()
+    separated_faces = [bm.faces[i] for i in np.flatnonzero(face_parts >= 0).tolist()]
+    bmesh.ops.delete(bm, geom=separated_faces, context='FACES')
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
 
-        else:
-            print(f"ERROR: Vertex group '{vertex_group_name}' not found.")
-            return
-    else:
-        print("ERROR: Active object is not a mesh.")
-        return
-    print(f"Separation based on vertex group '{vertex_group_name}' completed.")
+    _add_to_log(f"Separation based on vertex groups completed: {list(new_objects.keys())}")
+    return new_objects
 
 def apply_custom_normals(obj, custom_normals):
     # Ensure the object is in object mode
@@ -98,39 +248,129 @@ def apply_custom_normals(obj, custom_normals):
     # sanity checks:
     # 1. check if number of elements in custom_normals matches number of normals in the mesh
     if len(structured_normals) != len(obj.data.vertices):
-        print("ERROR: Number of custom normals does not match number of vertices in mesh")
+        _add_to_log("ERROR: Number of custom normals does not match number of vertices in mesh")
         return
     # 2. check if the number of elements in each normal is 3
     if any(len(n) != 3 for n in structured_normals):
-        print("ERROR: Each normal must be a tuple or list of three floats")
+        _add_to_log("ERROR: Each normal must be a tuple or list of three floats")
         return
     else:
-        print("INFO: Number of custom normals and vertices match, len=3 for each normal")
+        _add_to_log("INFO: Number of custom normals and vertices match, len=3 for each normal")
     # 3. check if all elements in each normal are floats
     if any(not all(isinstance(v, float) for v in n) for n in structured_normals):
-        print("ERROR: Each normal must be a tuple or list of three floats")
+        _add_to_log("ERROR: Each normal must be a tuple or list of three floats")
         return
     else:
-        print("INFO: All elements in each normal are floats")
+        _add_to_log("INFO: All elements in each normal are floats")
     # 4. check if custom normals are nearly equal to the original normals
     epsilon = 1e-6
     zero_vectors = 0
     for i, vertex in enumerate(obj.data.vertices):
         if all(abs(a - b) < epsilon for a, b in zip(vertex.normal, structured_normals[i])):
-            print(f"INFO: Custom normal for vertex {i} is nearly equal to original normal")
+            _add_to_log(f"INFO: Custom normal for vertex {i} is nearly equal to original normal")
             # set custom normal to zero vector
             structured_normals[i] = (0.0, 0.0, 0.0)
             zero_vectors += 1
     if zero_vectors > 0:
-        print(f"INFO: {zero_vectors} custom normals set to zero vector")
+        _add_to_log(f"INFO: {zero_vectors} custom normals set to zero vector")
     else:
-        print("INFO: No custom normals set to zero vector")
+        _add_to_log("INFO: No custom normals set to zero vector")
 
     # Set custom normals
     obj.data.normals_split_custom_set_from_vertices(structured_normals)
-    print("DEBUG: Custom normals applied to mesh: ", obj.name)
-
-def get_vertexgroup_indices(group_name, obj=None):
+    _add_to_log("DEBUG: Custom normals applied to mesh: " + obj.name)
+
+# Sparse [vertex, group] weight matrix of a mesh object in CSR form, built with a single scan of the mesh.
+# Row v holds the (group index, weight) entries of vertex v, in the same order as vertex.groups.
+class VertexGroupWeights:
+    def __init__(self, obj):
+        self.group_names = [vg.name for vg in obj.vertex_groups]
+        self.group_lookup = {name: index for index, name in enumerate(self.group_names)}
+        self.num_verts = len(obj.data.vertices)
+
+        row_counts = np.zeros(self.num_verts, dtype=np.int64)
+        group_indices = []
+        weights = []
+        for vertex in obj.data.vertices:
+            groups = vertex.groups
+            row_counts[vertex.index] = len(groups)
+            for group in groups:
+                group_indices.append(group.group)
+                weights.append(group.weight)
+
+        self.indptr = np.zeros(self.num_verts + 1, dtype=np.int64)
+        np.cumsum(row_counts, out=self.indptr[1:])
+        self.vertex_indices = np.repeat(np.arange(self.num_verts), row_counts)
+        self.group_indices = np.array(group_indices, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float32)
+        # entries pointing at a deleted vertex group are ignored
+        valid = self.group_indices < len(self.group_names)
+        if not np.all(valid):
+            self.vertex_indices = self.vertex_indices[valid]
+            self.group_indices = self.group_indices[valid]
+            self.weights = self.weights[valid]
+            self.indptr = np.zeros(self.num_verts + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.vertex_indices, minlength=self.num_verts), out=self.indptr[1:])
+
+    def get_entry_mask(self, weight_threshold=None, inclusive=True):
+        if weight_threshold is None:
+            return np.ones(len(self.weights), dtype=bool)
+        if inclusive:
+            return self.weights >= weight_threshold
+        return self.weights > weight_threshold
+
+    # sorted vertex indices assigned to group_name (optionally filtered by weight), None if the group does not exist
+    def get_vertex_indices(self, group_name, weight_threshold=None, inclusive=True):
+        group_index = self.group_lookup.get(group_name)
+        if group_index is None:
+            return None
+        mask = (self.group_indices == group_index) & self.get_entry_mask(weight_threshold, inclusive)
+        return self.vertex_indices[mask]
+
+    def get_membership_mask(self, group_name, weight_threshold=None, inclusive=True):
+        mask = np.zeros(self.num_verts, dtype=bool)
+        vertex_indices = self.get_vertex_indices(group_name, weight_threshold, inclusive)
+        if vertex_indices is not None:
+            mask[vertex_indices] = True
+        return mask
+
+    def get_vertex_group_names(self, vertex_index, weight_threshold=None, inclusive=True):
+        start, end = self.indptr[vertex_index], self.indptr[vertex_index + 1]
+        mask = self.get_entry_mask(weight_threshold, inclusive)[start:end]
+        return [self.group_names[i] for i in self.group_indices[start:end][mask].tolist()]
+
+    # {group name: number of vertices over the threshold}
+    def count_vertices_per_group(self, weight_threshold=None, inclusive=True):
+        mask = self.get_entry_mask(weight_threshold, inclusive)
+        counts = np.bincount(self.group_indices[mask], minlength=len(self.group_names))
+        return dict(zip(self.group_names, counts.tolist()))
+
+    # names of the groups with more than min_count vertices over the threshold, in the order a
+    # vertex-by-vertex scan would see each group pass min_count
+    def get_groups_over_count(self, min_count, weight_threshold=None, inclusive=True):
+        entries = np.flatnonzero(self.get_entry_mask(weight_threshold, inclusive))
+        order = np.argsort(self.group_indices[entries], kind="stable")
+        entries = entries[order]
+        groups, starts, counts = np.unique(self.group_indices[entries], return_index=True, return_counts=True)
+        over = counts > min_count
+        passed_at = entries[starts[over] + min_count]
+        return [self.group_names[i] for i in groups[over][np.argsort(passed_at)].tolist()]
+
+    # dense [vertex, group] weights with columns in the order of group_names, missing groups are all zero
+    def get_dense_weights(self, group_names):
+        column_lookup = np.full(len(self.group_names), -1, dtype=np.int64)
+        for column, name in enumerate(group_names):
+            group_index = self.group_lookup.get(name)
+            if group_index is not None:
+                column_lookup[group_index] = column
+        columns = column_lookup[self.group_indices]
+        used = columns >= 0
+        dense = np.zeros((self.num_verts, len(group_names)), dtype=np.float32)
+        dense[self.vertex_indices[used], columns[used]] = self.weights[used]
+        return dense
+
+
+def get_vertexgroup_indices(group_name, obj=None, vertex_group_weights=None):
     # object mode
     bpy.ops.object.mode_set(mode='OBJECT')
 
@@ -140,41 +380,30 @@ def get_vertexgroup_indices(group_name, obj=None):
     else:
         bpy.context.view_layer.objects.active = obj
 
-    # List to hold the indices of vertices in the group
-    vertex_indices = []
-
     # Ensure the object is a mesh
-    if obj.type == 'MESH':       
-        # Find the vertex group by name
-        vertex_group = obj.vertex_groups.get(group_name)
-        if vertex_group is not None:
-            # Iterate through each vertex in the mesh
-            for vertex in obj.data.vertices:
-                for group in vertex.groups:
-                    # Check if the vertex is in the vertex group
-                    if group.group == vertex_group.index:
-                        # Add the vertex index to the list
-                        vertex_indices.append(vertex.index)
-                        break  # Stop checking this vertex's groups
-            
-        else:
-            print(f"Vertex group '{group_name}' not found.")
-            return None
-    else:
-        print("Active object is not a mesh.")
+    if obj.type != 'MESH':
+        _add_to_log("Active object is not a mesh.")
         return None
-    
-    return vertex_indices
+
+    if vertex_group_weights is None:
+        vertex_group_weights = VertexGroupWeights(obj)
+    vertex_indices = vertex_group_weights.get_vertex_indices(group_name)
+    if vertex_indices is None:
+        _add_to_log(f"Vertex group '{group_name}' not found.")
+        return None
+
+    return vertex_indices.tolist()
 
 
 # set up vertex index files from a prepared model
 def generate_vertex_index_files(obj, group_names):
     # print("DEBUG: generate_vertex_index_files():...")
+    vertex_group_weights = VertexGroupWeights(obj)
     for group_name in group_names:
-        vertex_indices = get_vertexgroup_indices(group_name, obj)
+        vertex_indices = get_vertexgroup_indices(group_name, obj, vertex_group_weights)
         # print(vertex_indices)
         filename = f"{script_dir}/vertex_indices/{group_name}_vertex_indices.txt"
-        print("DEBUG: writing to file: " + filename)
+        _add_to_log("DEBUG: writing to file: " + filename)
         with open(filename, "w") as file:
             if vertex_indices is None:
                 file.write("Vertex group not found.")
@@ -186,10 +415,11 @@ def generate_vertex_index_files(obj, group_names):
 def generate_vertex_index_python_data(obj, group_names):
     # print("DEBUG: generate_vertex_index_python_data():...")
     filename = f"{script_dir}/python_vertex_indices.py"
+    vertex_group_weights = VertexGroupWeights(obj)
     for group_name in group_names:
-        vertex_indices = get_vertexgroup_indices(group_name, obj)
+        vertex_indices = get_vertexgroup_indices(group_name, obj, vertex_group_weights)
         # print(vertex_indices)
-        print("DEBUG: writing to file: " + filename)
+        _add_to_log("DEBUG: writing to file: " + filename)
         with open(filename, "a") as file:
             if vertex_indices is None:
                 file.write(f"# Vertex group '{group_name}' not found.\n\n")
@@ -205,15 +435,15 @@ def create_vertex_groups_from_files(obj, group_names):
     # print("DEBUG: create_vertex_groups_from_files():...")
     for group_name in group_names:
         filename = f"{script_dir}/vertex_indices/{group_name}_vertex_indices.txt"
-        print("DEBUG: filename: " + filename)
+        _add_to_log("DEBUG: filename: " + filename)
         if not os.path.exists(filename):
-            print(f"File '{filename}' not found.")
+            _add_to_log(f"File '{filename}' not found.")
             continue
         with open(filename, "r") as file:
             try:
                 vertex_indices = [int(line) for line in file]
             except ValueError:
-                print(f"Error reading file '{filename}'.")
+                _add_to_log(f"Error reading file '{filename}'.")
                 continue
             # Create a new vertex group
             new_group = obj.vertex_groups.new(name=group_name)
@@ -222,7 +452,10 @@ def create_vertex_groups_from_files(obj, group_names):
 
 
 def create_vertex_group(obj, group_name, vertex_indices):
-    print("DEBUG: obj=" + obj.name + " creating vertex group: " + group_name + ", index count: " + str(len(vertex_indices)))
+    _add_to_log("DEBUG: obj=" + obj.name + " creating vertex group: " + group_name + ", index count: " + str(len(vertex_indices)))
+    # vertex index store arrays => plain int list
+    if hasattr(vertex_indices, "tolist"):
+        vertex_indices = vertex_indices.tolist()
     # Create a new vertex group
     new_group = obj.vertex_groups.new(name=group_name)
     # Assign the vertex indices to the group
@@ -236,7 +469,7 @@ def remove_extra_meshes(safe_mesh_names_list):
             name = obj.name
             # if name.lower().contains("eyebrow") or name.lower().contains("eyelash") or name.lower().contains("tear") or name.lower().contains("moisture"):
             if name.lower() not in safe_mesh_names_list:
-                print("DEBUG: Removing object " + name)
+                _add_to_log("DEBUG: Removing object " + name)
                 bpy.ops.object.select_all(action='DESELECT')
                 obj.select_set(True)
                 bpy.ops.object.delete()
@@ -253,7 +486,7 @@ def remove_moisture_materials(obj):
     bpy.ops.object.mode_set(mode="OBJECT")
     for idx, mat_slot in enumerate(obj.material_slots):
         if  mat_slot.material and "moisture" in mat_slot.material.name.lower():
-            print("DEBUG: Removing vertices with material " + mat_slot.material.name)
+            _add_to_log("DEBUG: Removing vertices with material " + mat_slot.material.name)
             mat_indices_to_remove.append(idx)
     if len(mat_indices_to_remove) > 0:
         for poly in obj.data.polygons:
@@ -281,18 +514,18 @@ def remove_extra_materials(safe_material_names_list, safe_mesh_names_list=[]):
                 mat_name = mat.name
                 if mat_name.lower() in safe_material_names_list:
                     continue
-                print("DEBUG: Removing material " + mat_name + " from object " + obj.name)
+                _add_to_log("DEBUG: Removing material " + mat_name + " from object " + obj.name)
                 materials_to_remove.append([obj, mat])
     for obj, mat in materials_to_remove:
         # remove material
-        print("DEBUG: Removing material " + mat.name + " from object " + obj.name)
+        _add_to_log("DEBUG: Removing material " + mat.name + " from object " + obj.name)
         bpy.context.view_layer.objects.active = obj
         bpy.context.object.active_material_index = obj.material_slots.find(mat.name)
         bpy.ops.object.material_slot_remove()
 
 def add_decimate_modifier_per_vertex_group(obj, vertex_group_name, decimation_ratio):
     if vertex_group_name not in obj.vertex_groups:
-        print("ERROR: add_decimate_modifier_per_vertex_group(): vertex_group_name not found: " + vertex_group_name + " for object: " + obj.name)
+        _add_to_log("ERROR: add_decimate_modifier_per_vertex_group(): vertex_group_name not found: " + vertex_group_name + " for object: " + obj.name)
         return
     # object mode
     bpy.ops.object.mode_set(mode="OBJECT")
@@ -302,7 +535,7 @@ def add_decimate_modifier_per_vertex_group(obj, vertex_group_name, decimation_ra
     obj.select_set(True)
     # add decimation modifier
     bpy.context.view_layer.objects.active = obj
-    print("DEBUG: adding decimation modifier for group: " + vertex_group_name + " to object: " + obj.name)
+    _add_to_log("DEBUG: adding decimation modifier for group: " + vertex_group_name + " to object: " + obj.name)
     new_modifier = obj.modifiers.new(name=vertex_group_name, type='DECIMATE')
     new_modifier.name = vertex_group_name
     new_modifier.decimate_type = 'COLLAPSE'
@@ -371,9 +604,9 @@ def find_roughness_node(material):
     if nodes.get('Principled BSDF') is not None:
         roughness_value = nodes['Principled BSDF'].inputs['Roughness'].default_value
         roughness_node.outputs['Color'].default_value = (roughness_value, roughness_value, roughness_value, 1.0)
-        print(f"DEBUG: find_roughness_node(): Place holder Roughness value: {roughness_value} used for material: {material.name}")
+        _add_to_log(f"DEBUG: find_roughness_node(): Place holder Roughness value: {roughness_value} used for material: {material.name}")
     else:
-        print(f"DEBUG: find_roughness_node(): Principled BSDF node not found for material: {material.name}")
+        _add_to_log(f"DEBUG: find_roughness_node(): Principled BSDF node not found for material: {material.name}")
         roughness_node.outputs['Color'].default_value = (0.5, 0.5, 0.5, 1.0)
     return roughness_node
 
@@ -389,9 +622,9 @@ def find_metallic_node(material):
     if nodes.get('Principled BSDF') is not None:
         metallic_value = nodes['Principled BSDF'].inputs['Metallic'].default_value
         metallic_node.outputs['Color'].default_value = (metallic_value, metallic_value, metallic_value, 1.0)
-        print(f"DEBUG: find_metallic_node(): Place holder Metallic value: {metallic_value} used for material: {material.name}")
+        _add_to_log(f"DEBUG: find_metallic_node(): Place holder Metallic value: {metallic_value} used for material: {material.name}")
     else:
-        print(f"DEBUG: find_metallic_node(): Principled BSDF node not found for material: {material.name}")
+        _add_to_log(f"DEBUG: find_metallic_node(): Principled BSDF node not found for material: {material.name}")
         metallic_node.outputs['Color'].default_value = (0.0, 0.0, 0.0, 1.0)
     return metallic_node
 
@@ -407,9 +640,9 @@ def find_alpha_node(material, no_placeholder=False):
     if nodes.get('Principled BSDF') is not None:
         alpha_value = nodes['Principled BSDF'].inputs['Alpha'].default_value
         alpha_node.outputs['Color'].default_value = (alpha_value, alpha_value, alpha_value, alpha_value)
-        print(f"DEBUG: find_alpha_node(): Place holder Alpha value: {alpha_value} used for material: {material.name}")
+        _add_to_log(f"DEBUG: find_alpha_node(): Place holder Alpha value: {alpha_value} used for material: {material.name}")
     else:
-        print(f"DEBUG: find_alpha_node(): Principled BSDF node not found for material: {material.name}")
+        _add_to_log(f"DEBUG: find_alpha_node(): Principled BSDF node not found for material: {material.name}")
         alpha_node.outputs['Color'].default_value = (0.0, 0.0, 0.0, 1.0)
     return alpha_node
 
@@ -445,19 +678,19 @@ def bake_roughness_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     bake_nodes = []
     for mat_slot in obj.material_slots:
         if mat_slot.material and mat_slot.material.use_nodes:
-            print(f"Setting up bake node for material: {mat_slot.material.name}")
+            _add_to_log(f"Setting up bake node for material: {mat_slot.material.name}")
             bake_node = setup_bake_nodes(mat_slot.material, atlas)
             bake_nodes.append(bake_node)
         else:
-            print(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
+            _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
     if not bake_nodes:
-        print("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
         return
 
     # Bake
-    print("Starting bake operation...")
+    _add_to_log("Starting bake operation...")
     bpy.ops.object.bake(type='ROUGHNESS', use_clear=clear_texture, margin=8)
-    print("Bake operation completed.")
+    _add_to_log("Bake operation completed.")
 
     # Clean up bake nodes
     cleanup_bake_nodes(obj, bake_nodes)
@@ -479,19 +712,19 @@ def bake_normal_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     bake_nodes = []
     for mat_slot in obj.material_slots:
         if mat_slot.material and mat_slot.material.use_nodes:
-            print(f"Setting up bake node for material: {mat_slot.material.name}")
+            _add_to_log(f"Setting up bake node for material: {mat_slot.material.name}")
             bake_node = setup_bake_nodes(mat_slot.material, atlas)
             bake_nodes.append(bake_node)
         else:
-            print(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
+            _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
     if not bake_nodes:
-        print("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
         return
 
     # Bake
-    print("Starting bake operation...")
+    _add_to_log("Starting bake operation...")
     bpy.ops.object.bake(type='NORMAL', use_clear=clear_texture, margin=8)
-    print("Bake operation completed.")
+    _add_to_log("Bake operation completed.")
 
     # Clean up bake nodes
     cleanup_bake_nodes(obj, bake_nodes)
@@ -528,7 +761,7 @@ def bake_metallic_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     bake_nodes = []
     for mat_slot in obj.material_slots:
         if mat_slot.material and mat_slot.material.use_nodes:
-            print(f"Setting up bake node for material: {mat_slot.material.name}")
+            _add_to_log(f"Setting up bake node for material: {mat_slot.material.name}")
             bake_node = setup_bake_nodes(mat_slot.material, atlas)
             bake_nodes.append(bake_node)
             material = mat_slot.material
@@ -549,15 +782,15 @@ def bake_metallic_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
             else:
                 material.node_tree.links.new(metallic_node.outputs[output_type], nodes['Principled BSDF'].inputs['Emission'])   
         else:
-            print(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
+            _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
     if not bake_nodes:
-        print("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
         return
 
     # Bake
-    print("Starting bake operation...")
+    _add_to_log("Starting bake operation...")
     bpy.ops.object.bake(type='EMIT', use_clear=clear_texture, margin=8)
-    print("Bake operation completed.")
+    _add_to_log("Bake operation completed.")
 
     # Clean up bake nodes
     cleanup_bake_nodes(obj, bake_nodes, True)
@@ -565,7 +798,7 @@ def bake_metallic_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     return
 
 def bake_alpha_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
-    print(f"Starting bake process for object: {obj.name}")
+    _add_to_log(f"Starting bake process for object: {obj.name}")
     bpy.ops.object.select_all(action='DESELECT')
     obj.select_set(True)
     bpy.context.view_layer.objects.active = obj
@@ -581,7 +814,7 @@ def bake_alpha_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     bake_nodes = []
     for mat_slot in obj.material_slots:
         if mat_slot.material and mat_slot.material.use_nodes:
-            print(f"Setting up bake node for material: {mat_slot.material.name}")
+            _add_to_log(f"Setting up bake node for material: {mat_slot.material.name}")
             bake_node = setup_bake_nodes(mat_slot.material, atlas)
             bake_nodes.append(bake_node)
             material = mat_slot.material
@@ -602,15 +835,15 @@ def bake_alpha_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
             else:
                 material.node_tree.links.new(alpha_node.outputs[output_type], nodes['Principled BSDF'].inputs['Emission'])
         else:
-            print(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
+            _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
     if not bake_nodes:
-        print("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
         return
 
     # Bake
-    print("Starting bake operation...")
+    _add_to_log("Starting bake operation...")
     bpy.ops.object.bake(type='EMIT', pass_filter={'EMIT'}, use_clear=clear_texture, margin=8)
-    print("Bake operation completed.")
+    _add_to_log("Bake operation completed.")
     
     # Clean up bake nodes
     cleanup_bake_nodes(obj, bake_nodes, True)
@@ -619,7 +852,7 @@ def bake_alpha_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
 
 
 def bake_diffuse_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
-    print(f"Starting bake process for object: {obj.name}")
+    _add_to_log(f"Starting bake process for object: {obj.name}")
     bpy.ops.object.select_all(action='DESELECT')
     obj.select_set(True)
     bpy.context.view_layer.objects.active = obj
@@ -641,7 +874,7 @@ def bake_diffuse_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     bake_nodes = []
     for mat_slot in obj.material_slots:
         if mat_slot.material and mat_slot.material.use_nodes:
-            print(f"Setting up bake node for material: {mat_slot.material.name}")
+            _add_to_log(f"Setting up bake node for material: {mat_slot.material.name}")
             bake_node = setup_bake_nodes(mat_slot.material, atlas)
             bake_nodes.append(bake_node)
             material = mat_slot.material
@@ -665,15 +898,15 @@ def bake_diffuse_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
             else:
                 material.node_tree.links.new(diffuse_node.outputs[output_type], nodes['Principled BSDF'].inputs['Emission'])
         else:
-            print(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
+            _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")    
     if not bake_nodes:
-        print("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
         return
 
     # Bake
-    print("Starting bake operation...")
+    _add_to_log("Starting bake operation...")
     bpy.ops.object.bake(type='EMIT', pass_filter={'EMIT'}, use_clear=clear_texture, margin=8)
-    print("Bake operation completed.")
+    _add_to_log("Bake operation completed.")
     
     # Clean up bake nodes
     cleanup_bake_nodes(obj, bake_nodes, True)
@@ -681,6 +914,476 @@ def bake_diffuse_to_atlas(obj, atlas, bake_quality=4, clear_texture=False):
     return
 
 
+# Principled BSDF input and bake type for each atlas channel.  EMIT channels are baked by routing
+# their source through the Principled BSDF emission input.
+atlas_channel_inputs = {"alpha": "Alpha", "diffuse": "Base Color", "normal": "Normal", "metallic": "Metallic", "roughness": "Roughness"}
+atlas_channel_bake_types = {"alpha": 'EMIT', "diffuse": 'EMIT', "normal": 'NORMAL', "metallic": 'EMIT', "roughness": 'ROUGHNESS'}
+
+# returns the (linear) RGB value a channel bakes to when its Principled BSDF input is not linked,
+# or None if the channel has to be baked
+def get_constant_channel_value(material, channel):
+    if channel == "normal":
+        return None
+    input_name = atlas_channel_inputs[channel]
+    nodes = material.node_tree.nodes
+    for node in nodes:
+        if node.type == 'BSDF_PRINCIPLED':
+            if input_name in node.inputs and node.inputs[input_name].is_linked:
+                return None
+    # same values as the placeholder nodes made by find_*_node()
+    principled_node = nodes.get('Principled BSDF')
+    if principled_node is None:
+        if channel == "roughness":
+            return (0.5, 0.5, 0.5)
+        return (0.0, 0.0, 0.0)
+    value = principled_node.inputs[input_name].default_value
+    if channel == "diffuse":
+        return (value[0], value[1], value[2])
+    return (value, value, value)
+
+def get_bake_source_output(material, channel):
+    if channel == "alpha":
+        source_node = find_alpha_node(material)
+    elif channel == "diffuse":
+        source_node = find_diffuse_node(material)
+    else:
+        source_node = find_metallic_node(material)
+    output_type = ""
+    # loop through and find linked output
+    for output in source_node.outputs:
+        if output.is_linked:
+            if channel != "diffuse":
+                output_type = output.name
+                break
+            # check what it is linked to
+            for link in output.links:
+                if link.to_node.type == 'BSDF_PRINCIPLED' and link.to_socket.name == 'Base Color':
+                    output_type = output.name
+                    break
+    if output_type == "" and type(source_node) == bpy.types.ShaderNodeRGB:
+        output_type = 'Color'
+    return source_node.outputs[output_type]
+
+def get_emission_input(material):
+    nodes = material.node_tree.nodes
+    if bpy.app.version >= (4, 0, 0):
+        nodes['Principled BSDF'].inputs['Emission Strength'].default_value = 1.0
+        return nodes['Principled BSDF'].inputs['Emission Color']
+    return nodes['Principled BSDF'].inputs['Emission']
+
+# returns the uv coordinates of the loop triangles of mesh in uv_layer as a (T, 3, 2) array
+def get_loop_triangle_uvs(mesh, uv_layer):
+    num_triangles = len(mesh.loop_triangles)
+    triangle_loops = np.empty(num_triangles * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("loops", triangle_loops)
+    loop_uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", loop_uvs)
+    return loop_uvs.reshape(-1, 2)[triangle_loops].reshape(-1, 3, 2)
+
+# returns the active uv layer triangles of all objects as a (T, 3, 2) array, together with the index
+# into materials of each triangle (-1 if its material slot is not in materials)
+def get_uv_triangles(obj_list, materials):
+    uv_triangle_list = []
+    material_index_list = []
+    for obj in obj_list:
+        mesh = obj.data
+        if mesh.uv_layers.active is None:
+            continue
+        mesh.calc_loop_triangles()
+        num_triangles = len(mesh.loop_triangles)
+        triangle_material_slots = np.empty(num_triangles, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("material_index", triangle_material_slots)
+        uv_triangle_list.append(get_loop_triangle_uvs(mesh, mesh.uv_layers.active))
+        slot_lookup = np.array([materials.index(slot.material) if slot.material in materials else -1 for slot in obj.material_slots] + [-1], dtype=np.int32)
+        material_index_list.append(slot_lookup[np.clip(triangle_material_slots, 0, len(slot_lookup) - 1)])
+    if not uv_triangle_list:
+        return np.zeros((0, 3, 2), dtype=np.float32), np.zeros(0, dtype=np.int32)
+    return np.concatenate(uv_triangle_list), np.concatenate(material_index_list)
+
+# the uv layer sampled by image textures without a vector input (and by the UV output of Texture Coordinate
+# nodes): the render-active layer, or the first other layer when the render-active one is the bake target
+def get_source_uv_layer(mesh):
+    target_uv_layer = mesh.uv_layers.active
+    for uv_layer in mesh.uv_layers:
+        if uv_layer.active_render and uv_layer != target_uv_layer:
+            return uv_layer
+    for uv_layer in mesh.uv_layers:
+        if uv_layer != target_uv_layer:
+            return uv_layer
+    return target_uv_layer
+
+# same triangles as get_uv_triangles(), with the uv coordinates of the source uv layer
+def get_source_uv_triangles(obj_list):
+    uv_triangle_list = []
+    for obj in obj_list:
+        mesh = obj.data
+        if mesh.uv_layers.active is None:
+            continue
+        mesh.calc_loop_triangles()
+        uv_triangle_list.append(get_loop_triangle_uvs(mesh, get_source_uv_layer(mesh)))
+    if not uv_triangle_list:
+        return np.zeros((0, 3, 2), dtype=np.float32)
+    return np.concatenate(uv_triangle_list)
+
+# returns a (height, width) int32 map of the triangle covering each pixel center, -1 where none does.
+# uv_triangles is a (T, 3, 2) array of uv coordinates.
+def rasterize_uv_triangles(uv_triangles, width, height, batch_size=4096):
+    triangle_map = np.full((height, width), -1, dtype=np.int32)
+    if len(uv_triangles) == 0:
+        return triangle_map
+    # pixel space, pixel centers are at integer + 0.5
+    points = np.asarray(uv_triangles, dtype=np.float64) * (width, height)
+    x_min = np.clip(np.floor(points[:, :, 0].min(axis=1) - 0.5), 0, width - 1).astype(np.int64)
+    x_max = np.clip(np.ceil(points[:, :, 0].max(axis=1) - 0.5), 0, width - 1).astype(np.int64)
+    y_min = np.clip(np.floor(points[:, :, 1].min(axis=1) - 0.5), 0, height - 1).astype(np.int64)
+    y_max = np.clip(np.ceil(points[:, :, 1].max(axis=1) - 0.5), 0, height - 1).astype(np.int64)
+    box_width = x_max - x_min + 1
+    box_height = y_max - y_min + 1
+    a = points[:, 0]
+    v0 = points[:, 1] - a
+    v1 = points[:, 2] - a
+    denominator = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+    # triangles of similar bounding box size are rasterized together on a padded pixel grid
+    order = np.argsort(box_width * box_height, kind="stable")
+    order = order[np.abs(denominator[order]) > 1e-12]
+    start = 0
+    while start < len(order):
+        batch = order[start:start + batch_size]
+        # keep the padded grid bounded for batches with large triangles
+        while len(batch) > 1 and len(batch) * int(box_width[batch].max()) * int(box_height[batch].max()) > 16 * 1024 * 1024:
+            batch = batch[:len(batch) // 2]
+        start += len(batch)
+        offset_y, offset_x = np.mgrid[0:int(box_height[batch].max()), 0:int(box_width[batch].max())]
+        pixel_x = x_min[batch, None, None] + offset_x
+        pixel_y = y_min[batch, None, None] + offset_y
+        dx = pixel_x + 0.5 - a[batch, 0, None, None]
+        dy = pixel_y + 0.5 - a[batch, 1, None, None]
+        inverse = 1.0 / denominator[batch, None, None]
+        u = (dx * v1[batch, 1, None, None] - v1[batch, 0, None, None] * dy) * inverse
+        v = (v0[batch, 0, None, None] * dy - dx * v0[batch, 1, None, None]) * inverse
+        inside = (u >= -1e-6) & (v >= -1e-6) & (u + v <= 1.0 + 1e-6)
+        inside &= (offset_x < box_width[batch, None, None]) & (offset_y < box_height[batch, None, None])
+        triangle_map[pixel_y[inside], pixel_x[inside]] = np.broadcast_to(batch[:, None, None], inside.shape)[inside]
+    return triangle_map
+
+# grows the covered area of a triangle map by margin pixels, same purpose as the bake margin
+def dilate_triangle_map(triangle_map, margin=8):
+    triangle_map = triangle_map.copy()
+    for i in range(margin):
+        empty = triangle_map < 0
+        if not empty.any():
+            break
+        # any covered neighbor is good enough, take the largest index of the 8 neighbors
+        neighbor = triangle_map.copy()
+        np.maximum(neighbor[1:, :], triangle_map[:-1, :], out=neighbor[1:, :])
+        np.maximum(neighbor[:-1, :], triangle_map[1:, :], out=neighbor[:-1, :])
+        rows = neighbor.copy()
+        np.maximum(neighbor[:, 1:], rows[:, :-1], out=neighbor[:, 1:])
+        np.maximum(neighbor[:, :-1], rows[:, 1:], out=neighbor[:, :-1])
+        triangle_map[empty] = neighbor[empty]
+    return triangle_map
+
+# encode (linear) RGB values the way a bake would store them in image
+def encode_constant_values(image, rgb_values):
+    rgb_values = np.array(rgb_values, dtype=np.float32)
+    if not image.is_float and image.colorspace_settings.name != 'Non-Color':
+        rgb_values = linear_to_srgb(np.clip(rgb_values, 0.0, 1.0)).astype(np.float32)
+    return rgb_values
+
+# fill the whole image with a constant (linear) RGB value
+def fill_image_with_constant(image, rgb_value):
+    pixels = image_buffer_tools.new_image_buffer(image)
+    pixels[:, :3] = encode_constant_values(image, rgb_value)
+    pixels[:, 3] = 1.0
+    image_buffer_tools.write_image_buffer(image, pixels)
+
+# When True, atlas channels whose source in a material is an unlinked constant or a plain image texture are
+# composited on the CPU from the source images (see composite_channel_to_atlas()) instead of baked with Cycles.
+# Materials with any other node graph are still baked.
+use_atlas_compositor = True
+
+# color spaces of byte images whose pixels can be used as they are (sRGB pixels are linearized)
+composite_color_spaces = ["sRGB", "Non-Color", "Linear", "Raw"]
+LUMINANCE_WEIGHTS = (0.2126729, 0.7151522, 0.0721750)
+
+# Returns how the channel of material can be composited without a bake:
+#   ("constant", rgb) for an unlinked Principled BSDF input (see get_constant_channel_value()),
+#   ("texture", image node, output name, scale, offset) for an image texture linked straight to the input,
+#       optionally through a Mapping node (Horizontal/Vertical Tiles of process_material) fed by a UV output,
+# or None if the channel has to be baked.
+def get_composite_channel_source(material, channel):
+    if channel == "normal":
+        return None
+    constant_value = get_constant_channel_value(material, channel)
+    if constant_value is not None:
+        return ("constant", constant_value)
+    input_name = atlas_channel_inputs[channel]
+    for node in material.node_tree.nodes:
+        if node.type == 'BSDF_PRINCIPLED' and input_name in node.inputs and node.inputs[input_name].is_linked:
+            link = node.inputs[input_name].links[0]
+            break
+    else:
+        return None
+
+    image_node = link.from_node
+    if image_node.type != 'TEX_IMAGE' or image_node.projection != 'FLAT' or image_node.extension not in ('REPEAT', 'EXTEND', 'CLIP'):
+        return None
+    image = image_node.image
+    if image is None or image.source not in ('FILE', 'GENERATED') or image.size[0] == 0 or image.size[1] == 0:
+        return None
+    if not image.is_float and image.colorspace_settings.name not in composite_color_spaces:
+        return None
+
+    scale = (1.0, 1.0)
+    offset = (0.0, 0.0)
+    vector_input = image_node.inputs['Vector']
+    if vector_input.is_linked:
+        vector_link = vector_input.links[0]
+        mapping_node = vector_link.from_node
+        if mapping_node.type == 'MAPPING':
+            if mapping_node.vector_type != 'POINT' or not mapping_node.inputs['Vector'].is_linked:
+                return None
+            for input_name in ['Location', 'Rotation', 'Scale']:
+                if input_name in mapping_node.inputs and mapping_node.inputs[input_name].is_linked:
+                    return None
+            if any(abs(value) > 1e-6 for value in mapping_node.inputs['Rotation'].default_value):
+                return None
+            location = mapping_node.inputs['Location'].default_value
+            mapping_scale = mapping_node.inputs['Scale'].default_value
+            scale = (mapping_scale[0], mapping_scale[1])
+            offset = (location[0], location[1])
+            vector_link = mapping_node.inputs['Vector'].links[0]
+        if vector_link.from_node.type != 'TEX_COORD' or vector_link.from_socket.name != 'UV':
+            return None
+    return ("texture", image_node, link.from_socket.name, scale, offset)
+
+# (height, width, 3) float32 texels of a "texture" source, converted to the linear values the channel bakes to
+def get_composite_texels(source, channel):
+    _, image_node, output_name, _, _ = source
+    image = image_node.image
+    width, height = image.size
+    buffer = image_buffer_tools.read_image_buffer(image).reshape((height, width, -1))
+    if output_name == "Alpha":
+        if buffer.shape[2] == 4:
+            values = np.repeat(buffer[:, :, 3:4], 3, axis=2)
+        else:
+            values = np.ones((height, width, 3), dtype=np.float32)
+    else:
+        if buffer.shape[2] >= 3:
+            values = buffer[:, :, :3]
+        else:
+            values = np.repeat(buffer[:, :, :1], 3, axis=2)
+        if not image.is_float and image.colorspace_settings.name == "sRGB":
+            values = srgb_to_linear(values).astype(np.float32)
+    if channel == "roughness":
+        # the Roughness input is a float, the color is converted to its luminance
+        values = np.repeat((values @ np.array(LUMINANCE_WEIGHTS, dtype=np.float32))[:, :, None], 3, axis=2)
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+# bilinear (or closest) sample of (height, width, channels) texels at uvs, with the wrap mode of an image node extension
+def sample_texels(texels, uvs, extension='REPEAT', interpolation='Linear'):
+    height, width = texels.shape[:2]
+    x = uvs[:, 0] * width
+    y = uvs[:, 1] * height
+    def wrap(index, size):
+        if extension == 'REPEAT':
+            return np.mod(index, size)
+        return np.clip(index, 0, size - 1)
+    if interpolation == 'Closest':
+        values = texels[wrap(np.floor(y).astype(np.int64), height), wrap(np.floor(x).astype(np.int64), width)]
+    else:
+        # pixel centers are at integer + 0.5
+        x -= 0.5
+        y -= 0.5
+        x0 = np.floor(x)
+        y0 = np.floor(y)
+        fx = (x - x0)[:, None].astype(np.float32)
+        fy = (y - y0)[:, None].astype(np.float32)
+        x0 = x0.astype(np.int64)
+        y0 = y0.astype(np.int64)
+        x1 = wrap(x0 + 1, width)
+        y1 = wrap(y0 + 1, height)
+        x0 = wrap(x0, width)
+        y0 = wrap(y0, height)
+        values = ((texels[y0, x0] * (1 - fx) + texels[y0, x1] * fx) * (1 - fy) +
+                  (texels[y1, x0] * (1 - fx) + texels[y1, x1] * fx) * fy)
+    if extension == 'CLIP':
+        outside = (uvs[:, 0] < 0) | (uvs[:, 0] > 1) | (uvs[:, 1] < 0) | (uvs[:, 1] > 1)
+        values[outside] = 0.0
+    return values
+
+# maps atlas pixels (flat indices) through their triangles back to the source uv layout.  Pixels outside their
+# triangle (the dilated gutter) are clamped to the triangle, like the bake margin extends its edge pixels.
+def map_atlas_pixels_to_source_uvs(pixel_indices, pixel_triangles, width, height, uv_triangles, source_uv_triangles):
+    points = np.stack([(pixel_indices % width + 0.5) / width, (pixel_indices // width + 0.5) / height], axis=1)
+    triangles = uv_triangles[pixel_triangles].astype(np.float64)
+    a = triangles[:, 0]
+    v0 = triangles[:, 1] - a
+    v1 = triangles[:, 2] - a
+    d = points - a
+    denominator = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+    denominator[np.abs(denominator) < 1e-20] = 1e-20
+    u = (d[:, 0] * v1[:, 1] - v1[:, 0] * d[:, 1]) / denominator
+    v = (v0[:, 0] * d[:, 1] - d[:, 0] * v0[:, 1]) / denominator
+    weights = np.clip(np.stack([1.0 - u - v, u, v], axis=1), 0.0, 1.0)
+    weights /= np.maximum(weights.sum(axis=1), 1e-12)[:, None]
+    return np.einsum("ij,ijk->ik", weights, source_uv_triangles[pixel_triangles].astype(np.float64))
+
+# Composite one atlas channel without baking.  Every atlas pixel of a material with a source (see
+# get_composite_channel_source()) gets its constant, or the source image sampled at the source uv of the pixel.
+# triangle_map should be dilated, the gutter replaces the bake margin.  Pixels of materials without a source
+# (baked with Cycles) and pixels not covered by any triangle are left unchanged.
+def composite_channel_to_atlas(atlas, channel, triangle_map, uv_triangles, source_uv_triangles, triangle_materials, material_sources, chunk_size=1024 * 1024):
+    pixels = image_buffer_tools.read_image_buffer(atlas)
+    width, height = atlas.size
+    triangle_indices = triangle_map.ravel()
+    pixel_indices = np.flatnonzero(triangle_indices >= 0)
+    pixel_materials = triangle_materials[triangle_indices[pixel_indices]]
+
+    # materials sharing an image are composited one after the other, texels are kept for one image at a time
+    texels_key = None
+    texels = None
+    material_order = sorted(range(len(material_sources)), key=lambda index: str(material_sources[index][1].image.name) if material_sources[index] is not None and material_sources[index][0] == "texture" else "")
+    for material_index in material_order:
+        source = material_sources[material_index]
+        if source is None:
+            continue
+        material_pixels = pixel_indices[pixel_materials == material_index]
+        if len(material_pixels) == 0:
+            continue
+        if source[0] == "constant":
+            pixels[material_pixels, :3] = encode_constant_values(atlas, source[1])
+        else:
+            _, image_node, output_name, scale, offset = source
+            if texels_key != (image_node.image.name, output_name):
+                texels_key = (image_node.image.name, output_name)
+                texels = get_composite_texels(source, channel)
+            for start in range(0, len(material_pixels), chunk_size):
+                chunk = material_pixels[start:start + chunk_size]
+                source_uvs = map_atlas_pixels_to_source_uvs(chunk, triangle_indices[chunk], width, height, uv_triangles, source_uv_triangles)
+                source_uvs = source_uvs * scale + offset
+                values = sample_texels(texels, source_uvs, image_node.extension, image_node.interpolation)
+                pixels[chunk, :3] = encode_constant_values(atlas, values)
+        pixels[material_pixels, 3] = 1.0
+    image_buffer_tools.write_image_buffer(atlas, pixels)
+
+# Bake several atlas channels for all objects in obj_list.  Every material gets a single bake node that is
+# reused for all channels, each channel is baked with one multi-object bake call, and channels whose value
+# is an unlinked constant in every material are filled on the CPU instead of baked.  Materials whose channel
+# is a constant or a plain image texture are composited on the CPU (use_atlas_compositor), Cycles only bakes
+# the others.  channel_atlases is a {channel: image} dictionary, channels are baked in its order.
+def bake_channels_to_atlas(obj_list, channel_atlases, bake_quality=4, clear_texture=False):
+    if type(obj_list) != list:
+        obj_list = [obj_list]
+
+    materials = []
+    for obj in obj_list:
+        for mat_slot in obj.material_slots:
+            if mat_slot.material and mat_slot.material.use_nodes:
+                if mat_slot.material not in materials:
+                    materials.append(mat_slot.material)
+            else:
+                _add_to_log(f"Warning: Material slot has no material or doesn't use nodes: {mat_slot.name}")
+    if not materials:
+        _add_to_log("Error: No bake nodes were created. Check if the object has materials with nodes.")
+        return
+
+    bpy.context.scene.render.engine = 'CYCLES'
+    bpy.context.scene.cycles.samples = bake_quality
+    bpy.context.scene.cycles.time_limit = 1
+    bpy.context.scene.render.bake.use_pass_direct = False
+    bpy.context.scene.render.bake.use_pass_indirect = False
+    bpy.context.scene.render.bake.use_pass_color = False
+    bpy.context.scene.render.bake.use_pass_glossy = False
+    bpy.context.scene.render.bake.use_pass_diffuse = False
+    bpy.context.scene.render.bake.use_pass_transmission = False
+    bpy.context.scene.render.bake.use_pass_emit = True
+    bpy.context.scene.render.bake.margin = 8
+
+    bake_nodes = {}
+    emission_linked = False
+    # uv triangles and their pixel coverage, shared by all composited channels
+    uv_triangles = None
+    source_uv_triangles = None
+    triangle_materials = None
+    triangle_maps = {}
+    # bake target of composited materials in channels that are partly baked
+    discard_image = None
+    for channel, atlas in channel_atlases.items():
+        constant_values = [get_constant_channel_value(material, channel) for material in materials]
+        if constant_values[0] is not None and all(value == constant_values[0] for value in constant_values):
+            _add_to_log(f"DEBUG: bake_channels_to_atlas(): {channel} is constant {constant_values[0]} for all materials, filling instead of baking")
+            fill_image_with_constant(atlas, constant_values[0])
+            continue
+
+        if use_atlas_compositor:
+            material_sources = [get_composite_channel_source(material, channel) for material in materials]
+        elif all(value is not None for value in constant_values):
+            material_sources = [("constant", value) for value in constant_values]
+        else:
+            material_sources = [None] * len(materials)
+        num_composited = sum(1 for source in material_sources if source is not None)
+        if num_composited > 0:
+            if triangle_materials is None:
+                uv_triangles, triangle_materials = get_uv_triangles(obj_list, materials)
+            if source_uv_triangles is None and any(source is not None and source[0] == "texture" for source in material_sources):
+                source_uv_triangles = get_source_uv_triangles(obj_list)
+            map_size = (atlas.size[0], atlas.size[1])
+            if map_size not in triangle_maps:
+                triangle_map = rasterize_uv_triangles(uv_triangles, map_size[0], map_size[1])
+                triangle_maps[map_size] = dilate_triangle_map(triangle_map, bpy.context.scene.render.bake.margin)
+        if num_composited == len(materials):
+            _add_to_log(f"DEBUG: bake_channels_to_atlas(): {channel} is constant or a plain image texture in all materials, compositing instead of baking")
+            composite_channel_to_atlas(atlas, channel, triangle_maps[map_size], uv_triangles, source_uv_triangles, triangle_materials, material_sources)
+            continue
+
+        bake_type = atlas_channel_bake_types[channel]
+        for material, source in zip(materials, material_sources):
+            if material not in bake_nodes:
+                _add_to_log(f"Setting up bake node for material: {material.name}")
+                bake_nodes[material] = setup_bake_nodes(material, atlas)
+            bake_node = bake_nodes[material]
+            bake_node.image = atlas
+            if source is not None:
+                # composited after the bake, Cycles still needs a target for it
+                if discard_image is None:
+                    discard_image = bpy.data.images.new(name="AtlasBakeDiscard", width=8, height=8)
+                bake_node.image = discard_image
+            material.node_tree.nodes.active = bake_node
+            if bake_type == 'EMIT':
+                # link channel source to emission color of Principled BSDF node
+                material.node_tree.links.new(get_bake_source_output(material, channel), get_emission_input(material))
+                emission_linked = True
+
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj in obj_list:
+            obj.select_set(True)
+        bpy.context.view_layer.objects.active = obj_list[0]
+        bpy.context.scene.cycles.bake_type = bake_type
+
+        _add_to_log(f"Starting {channel} bake operation for {len(obj_list)} objects...")
+        if bake_type == 'EMIT':
+            bpy.ops.object.bake(type='EMIT', pass_filter={'EMIT'}, use_clear=clear_texture, margin=8)
+        else:
+            bpy.ops.object.bake(type=bake_type, use_clear=clear_texture, margin=8)
+        _add_to_log("Bake operation completed.")
+        if num_composited > 0:
+            _add_to_log(f"DEBUG: bake_channels_to_atlas(): compositing {channel} for {num_composited} of {len(materials)} materials")
+            composite_channel_to_atlas(atlas, channel, triangle_maps[map_size], uv_triangles, source_uv_triangles, triangle_materials, material_sources)
+
+    # Clean up bake nodes
+    for material, bake_node in bake_nodes.items():
+        material.node_tree.nodes.remove(bake_node)
+        if emission_linked:
+            emission_input = get_emission_input(material)
+            if emission_input.is_linked:
+                material.node_tree.links.remove(emission_input.links[0])
+    if discard_image is not None:
+        bpy.data.images.remove(discard_image)
+
+    return
+
+
 def create_texture_atlas(obj_name, atlas_size=4096):
     atlas = bpy.data.images.new(name=f"{obj_name}_Atlas", width=atlas_size, height=atlas_size, alpha=True)
     atlas_material = bpy.data.materials.new(name=f"{obj_name}_Atlas_Material")
@@ -747,11 +1450,11 @@ def switch_uv(obj_or_list, new_uv_name):
     try:
         obj.data.uv_layers[new_uv_name].active_render = True
     except:
-        print("ERROR: retrying to set uv layer: " + new_uv_name)
+        _add_to_log("ERROR: retrying to set uv layer: " + new_uv_name)
         try:
             obj.data.uv_layers[new_uv_name].active_render = True
         except:
-            print("ERROR: Unable to set active_render for uv layer: " + new_uv_name)
+            _add_to_log("ERROR: Unable to set active_render for uv layer: " + new_uv_name)
 
 def remove_other_uvs(obj_or_list, new_uv_name):
     if isinstance(obj_or_list, list):
@@ -770,7 +1473,7 @@ def remove_other_uvs(obj_or_list, new_uv_name):
     for uv_layer_name in uv_layer_names_to_remove:
         uv_layer = obj.data.uv_layers.get(uv_layer_name)
         if uv_layer is not None:
-            print("DEBUG: removing uv_layer: " + uv_layer_name)
+            _add_to_log("DEBUG: removing uv_layer: " + uv_layer_name)
             obj.data.uv_layers.remove(uv_layer)
 
 def obj_uses_alpha(obj_list):
@@ -784,7 +1487,7 @@ def obj_uses_alpha(obj_list):
                         if "Alpha" in node.inputs and node.inputs["Alpha"].is_linked:
                             return True
                         elif "Alpha" in node.inputs and node.inputs["Alpha"].default_value != 1.0:
-                            print(f"DEBUG: obj_uses_alpha({obj.name}\':\'{mat_slot.name}): Alpha default value: " + str(node.inputs["Alpha"].default_value))
+                            _add_to_log(f"DEBUG: obj_uses_alpha({obj.name}\':\'{mat_slot.name}): Alpha default value: " + str(node.inputs["Alpha"].default_value))
                             return True
     return False
 
@@ -799,7 +1502,7 @@ def obj_uses_diffuse(obj_list):
                         if "Base Color" in node.inputs and node.inputs["Base Color"].is_linked:
                             return True
                         elif "Base Color" in node.inputs and node.inputs["Base Color"].default_value != (0.0, 0.0, 0.0, 1.0):
-                            print(f"DEBUG: obj_uses_diffuse({obj.name}\':\'{mat_slot.name}): Base Color default value: " + str(node.inputs["Base Color"].default_value))
+                            _add_to_log(f"DEBUG: obj_uses_diffuse({obj.name}\':\'{mat_slot.name}): Base Color default value: " + str(node.inputs["Base Color"].default_value))
                             return True
     return False
 
@@ -814,7 +1517,7 @@ def obj_uses_metallic(obj_list):
                         if "Metallic" in node.inputs and node.inputs["Metallic"].is_linked:
                             return True
                         elif "Metallic" in node.inputs and node.inputs["Metallic"].default_value != 0.0:
-                            print(f"DEBUG: obj_uses_metallic({obj.name}\':\'{mat_slot.name}): Metallic default value: " + str(node.inputs["Metallic"].default_value))
+                            _add_to_log(f"DEBUG: obj_uses_metallic({obj.name}\':\'{mat_slot.name}): Metallic default value: " + str(node.inputs["Metallic"].default_value))
                             return True
     return False
 
@@ -829,7 +1532,7 @@ def obj_uses_roughness(obj_list):
                         if "Roughness" in node.inputs and node.inputs["Roughness"].is_linked:
                             return True
                         elif "Roughness" in node.inputs and node.inputs["Roughness"].default_value != 0.5:
-                            print(f"DEBUG: obj_uses_roughness({obj.name}\':\'{mat_slot.name}): Roughness default value: " + str(node.inputs["Roughness"].default_value))
+                            _add_to_log(f"DEBUG: obj_uses_roughness({obj.name}\':\'{mat_slot.name}): Roughness default value: " + str(node.inputs["Roughness"].default_value))
                             return True
     return False
 
@@ -845,6 +1548,59 @@ def obj_uses_normal(obj_list):
                             return True
     return False
 
+# name of a cached atlas file, the object name is not part of the cache key
+def get_atlas_cache_filename(channel, atlas_path):
+    return channel + os.path.splitext(atlas_path)[1]
+
+# pipeline_cache data for a material: node settings, links and the contents of its image files
+def get_material_cache_data(material):
+    if material is None or not material.use_nodes:
+        return [str(material)]
+    data = []
+    for node in sorted(material.node_tree.nodes, key=lambda node: node.name):
+        node_data = [node.name, node.bl_idname]
+        for node_input in node.inputs:
+            if node_input.is_linked or not hasattr(node_input, "default_value"):
+                continue
+            value = node_input.default_value
+            if hasattr(value, "__len__"):
+                value = tuple(value)
+            node_data.append((node_input.identifier, value))
+        if node.type == 'TEX_IMAGE' and node.image is not None:
+            image = node.image
+            node_data.append((image.source, image.colorspace_settings.name, image.alpha_mode, tuple(image.size)))
+            if image.packed_file is None and image.source == 'FILE':
+                node_data.append(pipeline_cache.hash_file(bpy.path.abspath(image.filepath)))
+            else:
+                node_data.append(image.name)
+        data.append(node_data)
+    for link in material.node_tree.links:
+        data.append((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier))
+    return data
+
+# atlas cache key: geometry and all UV layers of the objects (including the packed atlas UVs), their materials and the bake settings
+def get_atlas_cache_key(obj_list, channels, atlas_size, bake_quality):
+    data = []
+    for obj in obj_list:
+        data.append(get_mesh_cache_data(obj, include_uvs=True))
+        for mat_slot in obj.material_slots:
+            data.append(get_material_cache_data(mat_slot.material))
+    params = [channels, atlas_size, bake_quality, use_atlas_compositor, tuple(bpy.app.version)]
+    return pipeline_cache.make_key("texture_atlas", params, data)
+
+# copy the cached atlas files to their output paths and load them into the atlas images
+def load_cached_atlas_files(cache_entry, atlas_files):
+    for channel, atlas_image, atlas_path in atlas_files:
+        if not pipeline_cache.copy_file(cache_entry, get_atlas_cache_filename(channel, atlas_path), atlas_path):
+            _add_to_log("ERROR: load_cached_atlas_files(): cached file missing for channel: " + channel)
+            return False
+    for channel, atlas_image, atlas_path in atlas_files:
+        atlas_image.filepath_raw = atlas_path
+        atlas_image.file_format = 'PNG' if atlas_path.endswith(".png") else 'JPEG'
+        atlas_image.source = 'FILE'
+        atlas_image.reload()
+    return True
+
 def convert_to_atlas(obj_list, image_output_path, atlas_size=4096, bake_quality=4, make_uv=True, enable_gpu=False):
     if type(obj_list) != list:
         obj_list = [obj_list]
@@ -853,7 +1609,7 @@ def convert_to_atlas(obj_list, image_output_path, atlas_size=4096, bake_quality=
     # make sure Principled BSDF is materials
     for obj in obj_list:
         if obj.visible_get() == False:
-            print(f"ERROR: Object {obj.name} is not visible")
+            _add_to_log(f"ERROR: Object {obj.name} is not visible")
             return None, None, None
         for mat_slot in obj.material_slots:
             if mat_slot.material and mat_slot.material.use_nodes:
@@ -861,12 +1617,12 @@ def convert_to_atlas(obj_list, image_output_path, atlas_size=4096, bake_quality=
                     if node.type == 'BSDF_PRINCIPLED':
                         break
                 else:
-                    print(f"ERROR: No Principled BSDF node found in material: {mat_slot.material.name}")
+                    _add_to_log(f"ERROR: No Principled BSDF node found in material: {mat_slot.material.name}")
                     return None, None, None
 
     obj_name = obj_list[0].name
 
-    print(f"Starting atlas conversion for object list, using object name for atlas: {obj_name}")
+    _add_to_log(f"Starting atlas conversion for object list, using object name for atlas: {obj_name}")
 
     uses_alpha = obj_uses_alpha(obj_list)
     uses_diffuse = obj_uses_diffuse(obj_list)
@@ -893,55 +1649,53 @@ def convert_to_atlas(obj_list, image_output_path, atlas_size=4096, bake_quality=
     if enable_gpu:
         enable_gpu_acceleration()
 
-    for obj in obj_list:
-        if uses_alpha:
-            bake_alpha_to_atlas(obj, alpha_atlas, bake_quality, False)
-        if uses_diffuse:
-            bake_diffuse_to_atlas(obj, diffuse_atlas, bake_quality, False)
-        if uses_normal:
-            bake_normal_to_atlas(obj, normal_atlas, bake_quality, False)
-        if uses_metallic:
-            bake_metallic_to_atlas(obj, metallic_atlas, bake_quality, False)
-        if uses_roughness:
-            bake_roughness_to_atlas(obj, roughness_atlas, bake_quality, False)
-
+    channel_atlases = {}
     if uses_alpha:
-        alpha_atlas_path = image_output_path + "/" + f"{obj_name}_Atlas_A.png"
-        print("DEBUG: saving: " + alpha_atlas_path)
-        # save atlas image to disk
-        alpha_atlas.filepath_raw = alpha_atlas_path
-        alpha_atlas.file_format = 'PNG'
-        alpha_atlas.save()
-        copy_intensity_to_alpha(alpha_atlas, diffuse_atlas)
-
+        channel_atlases["alpha"] = alpha_atlas
+    if uses_diffuse:
+        channel_atlases["diffuse"] = diffuse_atlas
+    if uses_normal:
+        channel_atlases["normal"] = normal_atlas
+    if uses_metallic:
+        channel_atlases["metallic"] = metallic_atlas
+    if uses_roughness:
+        channel_atlases["roughness"] = roughness_atlas
+    # atlas files, in save order: (channel, image, file path)
+    atlas_files = []
+    if uses_alpha:
+        atlas_files.append(("alpha", alpha_atlas, image_output_path + "/" + f"{obj_name}_Atlas_A.png"))
     if uses_diffuse or uses_alpha:
-        diffuse_atlas_path = image_output_path + "/" + f"{obj_name}_Atlas_D.png"
-        print("DEBUG: saving: " + diffuse_atlas_path)
-        # save atlas image to disk
-        diffuse_atlas.filepath_raw = diffuse_atlas_path
-        diffuse_atlas.file_format = 'PNG'
-        diffuse_atlas.save()
-
+        atlas_files.append(("diffuse", diffuse_atlas, image_output_path + "/" + f"{obj_name}_Atlas_D.png"))
     if uses_normal:
-        normal_atlas_path = image_output_path + "/" + f"{obj_name}_Atlas_N.jpg"
-        print("DEBUG: saving: " + normal_atlas_path)
-        normal_atlas.filepath_raw = normal_atlas_path
-        normal_atlas.file_format = 'JPEG'
-        normal_atlas.save()
-
+        atlas_files.append(("normal", normal_atlas, image_output_path + "/" + f"{obj_name}_Atlas_N.jpg"))
     if uses_metallic:
-        metallic_atlas_path = image_output_path + "/" + f"{obj_name}_Atlas_M.jpg"
-        print("DEBUG: saving: " + metallic_atlas_path)
-        metallic_atlas.filepath_raw = metallic_atlas_path
-        metallic_atlas.file_format = 'JPEG'
-        metallic_atlas.save()
-
+        atlas_files.append(("metallic", metallic_atlas, image_output_path + "/" + f"{obj_name}_Atlas_M.jpg"))
     if uses_roughness:
-        roughness_atlas_path = image_output_path + "/" + f"{obj_name}_Atlas_R.jpg"
-        print("DEBUG: saving: " + roughness_atlas_path)
-        roughness_atlas.filepath_raw = roughness_atlas_path
-        roughness_atlas.file_format = 'JPEG'
-        roughness_atlas.save()
+        atlas_files.append(("roughness", roughness_atlas, image_output_path + "/" + f"{obj_name}_Atlas_R.jpg"))
+
+    atlas_cache_key = None
+    atlas_cache_entry = None
+    if pipeline_cache.is_enabled():
+        atlas_cache_key = get_atlas_cache_key(obj_list, [channel for channel, _, _ in atlas_files], atlas_size, bake_quality)
+        atlas_cache_entry = pipeline_cache.load_entry(atlas_cache_key, "texture_atlas")
+        if atlas_cache_entry is not None and not load_cached_atlas_files(atlas_cache_entry, atlas_files):
+            atlas_cache_entry = None
+
+    if atlas_cache_entry is None:
+        bake_channels_to_atlas(obj_list, channel_atlases, bake_quality, False)
+        for channel, atlas_image, atlas_path in atlas_files:
+            _add_to_log("DEBUG: saving: " + atlas_path)
+            # save atlas image to disk
+            atlas_image.filepath_raw = atlas_path
+            atlas_image.file_format = 'PNG' if atlas_path.endswith(".png") else 'JPEG'
+            atlas_image.save()
+            if channel == "alpha":
+                copy_intensity_to_alpha(alpha_atlas, diffuse_atlas)
+        if atlas_cache_key is not None:
+            cache_files = {get_atlas_cache_filename(channel, atlas_path): atlas_path for channel, _, atlas_path in atlas_files}
+            pipeline_cache.store_entry(atlas_cache_key, "texture_atlas", {"channels": list(cache_files)}, files=cache_files)
+    else:
+        _add_to_log(f"DEBUG: convert_to_atlas(): loaded {len(atlas_files)} atlas images from cache for: {obj_name}")
 
     nodes = atlas_material.node_tree.nodes
     if uses_normal:
@@ -977,7 +1731,7 @@ def convert_to_atlas(obj_list, image_output_path, atlas_size=4096, bake_quality=
     #     background.inputs['Strength'].default_value = 0.0
     # # bpy.context.scene.world.use_nodes = False
 
-    print("Atlas conversion completed.")
+    _add_to_log("Atlas conversion completed.")
 
     return diffuse_atlas, atlas_material, original_materials
 
@@ -999,9 +1753,9 @@ def copy_intensity_to_alpha(source_image, target_image):
                          source=({source_image.size[0]}, {source_image.size[1]}), \
                         target=({target_image.size[0]}, {target_image.size[1]})")
     
-    # Get image data as numpy arrays
-    source_pixels = np.array(source_image.pixels[:]).reshape((-1, 4))
-    target_pixels = np.array(target_image.pixels[:]).reshape((-1, 4))
+    # Get image data as float32 numpy buffers
+    source_pixels = image_buffer_tools.read_image_buffer(source_image)
+    target_pixels = image_buffer_tools.read_image_buffer(target_image)
     
     # Convert source RGB to linear space
     # source_linear = srgb_to_linear(source_pixels[:, :3])
@@ -1012,16 +1766,13 @@ def copy_intensity_to_alpha(source_image, target_image):
     intensity = np.mean(source_pixels[:, :3], axis=1)
 
     # Copy intensity to alpha channel of target image
-    target_pixels[:, 3] = intensity
+    image_buffer_tools.pack_channels(target_pixels, {"A": intensity})
     
     # Convert RGB of target back to sRGB space (alpha remains linear)
     # target_pixels[:, :3] = linear_to_srgb(target_pixels[:, :3])
     
-    # Update the target image
-    target_image.pixels = target_pixels.flatten()
-    
-    # Refresh the image in Blender
-    target_image.update()
+    # Update and refresh the target image
+    image_buffer_tools.write_image_buffer(target_image, target_pixels)
 
 
 
@@ -1089,32 +1840,36 @@ def transfer_weights(source_mesh_name, target_mesh_name):
             if mod.type == "ARMATURE":
                 mod.name = armature_name
 
-    print(f"Weights transferred successfully from {source_mesh_name} to {target_mesh_name}!")
+    _add_to_log(f"Weights transferred successfully from {source_mesh_name} to {target_mesh_name}!")
 
 import bmesh
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
 
-def get_significant_vertex_group_names(obj, vertex_index, weight_threshold):
+# pass a VertexGroupWeights of obj as vertex_group_weights when querying many vertices
+def get_significant_vertex_group_names(obj, vertex_index, weight_threshold, vertex_group_weights=None):
+    if vertex_group_weights is not None:
+        return vertex_group_weights.get_vertex_group_names(vertex_index, weight_threshold)
     vertex = obj.data.vertices[vertex_index]
     return [obj.vertex_groups[g.group].name for g in vertex.groups if g.weight >= weight_threshold]
 
-def have_common_vertex_groups_per_vertex(source_obj, source_vert_index, target_obj, target_face_index, weight_threshold=0.55):
-    source_groups = set(get_significant_vertex_group_names(source_obj, source_vert_index, weight_threshold))
+def have_common_vertex_groups_per_vertex(source_obj, source_vert_index, target_obj, target_face_index, weight_threshold=0.55, source_weights=None, target_weights=None):
+    source_groups = set(get_significant_vertex_group_names(source_obj, source_vert_index, weight_threshold, source_weights))
     target_face = target_obj.data.polygons[target_face_index]
     target_groups = set()
     for vert in target_face.vertices:
-        target_groups.update(get_significant_vertex_group_names(target_obj, vert, weight_threshold))
+        target_groups.update(get_significant_vertex_group_names(target_obj, vert, weight_threshold, target_weights))
     return bool(source_groups.intersection(target_groups))
 
-def have_common_vertex_groups_per_face(source_obj, source_face, target_obj, target_face_index, weight_threshold=0.55):
+def have_common_vertex_groups_per_face(source_obj, source_face, target_obj, target_face_index, weight_threshold=0.55, source_weights=None, target_weights=None):
     source_groups = set()
     for vert in source_face.verts:
-        source_groups.update(get_significant_vertex_group_names(source_obj, vert.index, weight_threshold))
+        source_groups.update(get_significant_vertex_group_names(source_obj, vert.index, weight_threshold, source_weights))
 
     target_face = target_obj.data.polygons[target_face_index]
     target_groups = set()
     for vert in target_face.vertices:
-        target_groups.update(get_significant_vertex_group_names(target_obj, vert, weight_threshold))
+        target_groups.update(get_significant_vertex_group_names(target_obj, vert, weight_threshold, target_weights))
 
     return bool(source_groups.intersection(target_groups))
 
@@ -1125,7 +1880,7 @@ def are_normals_same(normal1, normal2, threshold=0.01):
     return normal1.normalized().dot(normal2.normalized()) > 1 - threshold
 
 
-def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iterations=200, pass2_iterations=5, lock_tagged_verts=True):
+def autofit_mesh_bmesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iterations=200, pass2_iterations=5, lock_tagged_verts=True):
 
     weight_threshold = 0.55
     normal_threshold = 0.01
@@ -1156,6 +1911,9 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
     bm_source = bmesh.new()
     bm_source.from_mesh(source.data)
 
+    source_weights = VertexGroupWeights(source)
+    target_weights = VertexGroupWeights(target)
+
     for iteration in range(pass1_iterations):
         bm_source.faces.ensure_lookup_table()
         previous_source_mesh.from_mesh(source.data)
@@ -1178,7 +1936,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
             hit, loc, face_normal, face_index = target.ray_cast(v.co, normal * ray_cast_direction, distance=distance_cutoff)
             if hit:
                 hits += 1
-                if have_common_vertex_groups_per_vertex(source, i, target, face_index, weight_threshold) == False:
+                if have_common_vertex_groups_per_vertex(source, i, target, face_index, weight_threshold, source_weights, target_weights) == False:
                     # ignored += 1
                     continue
                 if are_normals_opposite(face_normal, normal, 0.9) == True:
@@ -1269,7 +2027,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
         bm_source.normal_update()
         result, face_indexes = calculate_if_normals_were_flipped(bm_source, original_normals)
         if result:
-            print(f"DEBUG: (PASS1) Flip detected, undoing offset for {len(face_indexes)} faces")
+            _add_to_log(f"DEBUG: (PASS1) Flip detected, undoing offset for {len(face_indexes)} faces")
             previous_source_mesh.faces.ensure_lookup_table()
             for face_index in face_indexes:
                 current_face = bm_source.faces[face_index]
@@ -1282,13 +2040,13 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
         # double check
         result, _ = calculate_if_normals_were_flipped(bm_source, original_normals)
         if result:
-            print("DEBUG: autofit_mesh(): PASS1: Flipped normals detected. Aborting.")
+            _add_to_log("DEBUG: autofit_mesh(): PASS1: Flipped normals detected. Aborting.")
             bm_source.free()
             previous_source_mesh.free()
             return
 
 
-        print(f"DEBUG: autofit_mesh(): PASS1: [{iteration}] hits={hits}, moved={num_verts}, skipped={skipped}, ignored={ignored}, (offset_multiplier={offset_multiplier:.2f}, fit_ratio={fit_ratio:.2f}), normal={normal_threshold:.3f}, weight={weight_threshold:.3f})")
+        _add_to_log(f"DEBUG: autofit_mesh(): PASS1: [{iteration}] hits={hits}, moved={num_verts}, skipped={skipped}, ignored={ignored}, (offset_multiplier={offset_multiplier:.2f}, fit_ratio={fit_ratio:.2f}), normal={normal_threshold:.3f}, weight={weight_threshold:.3f})")
 
         bm_source.to_mesh(source.data)
         source.data.update()
@@ -1335,7 +2093,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
             hit, loc, face_normal, face_index = source.ray_cast(v.co, -normal * ray_cast_direction, distance=distance_cutoff)
             if hit:
                 total_skip_no_skip += 1
-                if have_common_vertex_groups_per_vertex(target, i, source, face_index) == False:
+                if have_common_vertex_groups_per_vertex(target, i, source, face_index, 0.55, target_weights, source_weights) == False:
                     skipped_faces += 1
                     continue
                 if are_normals_opposite(face_normal, normal, 1.0) == True:
@@ -1372,7 +2130,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
         bm_source.normal_update()
         result, face_indexes = calculate_if_normals_were_flipped(bm_source, original_normals)
         if result:
-            print(f"DEBUG: (PASS2) Flip detected, undoing offset for {len(face_indexes)} faces")
+            _add_to_log(f"DEBUG: (PASS2) Flip detected, undoing offset for {len(face_indexes)} faces")
             previous_source_mesh.faces.ensure_lookup_table()
             for face_index in face_indexes:
                 current_face = bm_source.faces[face_index]
@@ -1382,7 +2140,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
                     add_tagged_verts(current_vert)
         result, _ = calculate_if_normals_were_flipped(bm_source, original_normals)
         if result:
-            print("DEBUG: autofit_mesh(): PASS2: Flipped normals detected. Aborting.")
+            _add_to_log("DEBUG: autofit_mesh(): PASS2: Flipped normals detected. Aborting.")
             bm_source.free()
             previous_source_mesh.free()
             bm_target.free()
@@ -1413,7 +2171,7 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
         #     previous_source_mesh.free()
         #     return
 
-        print(f"DEBUG: autofit_mesh(): PASS2: [{iteration}] total_skip_no_skip={total_skip_no_skip}, moved={num_third_pass_faces}, skipped={skipped_faces}, opposite={opposite}, same={same}, not_same={not_same}")
+        _add_to_log(f"DEBUG: autofit_mesh(): PASS2: [{iteration}] total_skip_no_skip={total_skip_no_skip}, moved={num_third_pass_faces}, skipped={skipped_faces}, opposite={opposite}, same={same}, not_same={not_same}")
         bm_source.to_mesh(source.data)
         source.data.update()
 
@@ -1422,103 +2180,546 @@ def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iter
         lock_string = "locked verts"
     else:
         lock_string = "tagged verts"
-    print(f"DEBUG: {lock_string} [{len(tagged_vert_indexes)}] = " + str(tagged_vert_indexes))
+    _add_to_log(f"DEBUG: {lock_string} [{len(tagged_vert_indexes)}] = " + str(tagged_vert_indexes))
 
     bm_source.free()
     bm_target.free()
     previous_source_mesh.free()
 
-    print(f"autofit_mesh(): obj={source.name} DONE")
+    _add_to_log(f"autofit_mesh(): obj={source.name} DONE")
+
+
+# When True, autofit_mesh() uses the NumPy engine below instead of the original per-BMVert implementation.
+USE_NUMPY_AUTOFIT = True
+
+# NumPy autofit pass 1 convergence: an iteration is converged when at most AUTOFIT_MOVED_FRACTION_TOLERANCE of the
+# vertices moved, none of them further than AUTOFIT_DISPLACEMENT_TOLERANCE.  Pass 1 stops after more than
+# AUTOFIT_CONVERGED_ITERATIONS converged iterations in a row (default: the original 18 iterations without any move).
+AUTOFIT_MOVED_FRACTION_TOLERANCE = 0.0
+AUTOFIT_DISPLACEMENT_TOLERANCE = 0.0
+AUTOFIT_CONVERGED_ITERATIONS = 18
+# write the fitted coordinates to the mesh every K iterations, 0 = only once the fit is done
+AUTOFIT_WRITEBACK_INTERVAL = 0
+
+# short summary of an autofit_mesh_numpy() report
+def format_autofit_report(report):
+    summary = f"autofit_mesh(): obj={report['object']}"
+    for pass_name in ["pass1", "pass2"]:
+        pass_report = report[pass_name]
+        summary += (f", {pass_name}: {pass_report['iterations']} iterations, hits={sum(pass_report['hits'])}, "
+                    f"moved={sum(pass_report['moved'])}, skipped={sum(pass_report['skipped'])}, undone={sum(pass_report['undone'])}, "
+                    f"{pass_report['time']:.3f}s")
+    summary += f", converged={report['pass1']['converged']}, tagged={report['tagged_verts']}"
+    if report["aborted"] is not None:
+        summary += f", aborted in {report['aborted']}"
+    return summary
+
+def autofit_mesh(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iterations=200, pass2_iterations=5, lock_tagged_verts=True):
+    # the fitted coordinates only depend on both meshes (target as evaluated for ray casting) and the settings
+    cache_key = None
+    if pipeline_cache.is_enabled():
+        params = [fit_ratio, distance_cutoff, pass1_iterations, pass2_iterations, lock_tagged_verts, USE_NUMPY_AUTOFIT,
+                  AUTOFIT_MOVED_FRACTION_TOLERANCE, AUTOFIT_DISPLACEMENT_TOLERANCE, AUTOFIT_CONVERGED_ITERATIONS]
+        cache_key = pipeline_cache.make_key("autofit_mesh", params, get_mesh_cache_data(source, include_weights=True),
+                                            get_mesh_cache_data(target, include_weights=True, evaluated=True))
+        cache_entry = pipeline_cache.load_entry(cache_key, "autofit_mesh")
+        if cache_entry is not None:
+            coords = pipeline_cache.load_array(cache_entry, "coords")
+            if len(coords) == len(source.data.vertices):
+                set_vertex_coordinates_array(source.data, coords)
+                _add_to_log(f"autofit_mesh(): obj={source.name} loaded from cache")
+                return cache_entry["data"]
+
+    report = None
+    if USE_NUMPY_AUTOFIT:
+        report = autofit_mesh_numpy(source, target, fit_ratio, distance_cutoff, pass1_iterations, pass2_iterations, lock_tagged_verts)
+        _add_to_log("DEBUG: " + format_autofit_report(report))
+    else:
+        autofit_mesh_bmesh(source, target, fit_ratio, distance_cutoff, pass1_iterations, pass2_iterations, lock_tagged_verts)
+
+    if cache_key is not None:
+        pipeline_cache.store_entry(cache_key, "autofit_mesh", report, arrays={"coords": get_vertex_coordinates_array(source.data)})
+    return report
+
+
+def get_vertex_coordinates_array(mesh):
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    return coords.reshape((-1, 3)).astype(np.float64)
+
+def set_vertex_coordinates_array(mesh, coords):
+    mesh.vertices.foreach_set("co", coords.astype(np.float32).ravel())
+    mesh.update()
+
+# returns (loop_start, loop_total, loop_verts, loop_polys, next_loops) for the polygons of a mesh
+def get_polygon_loop_arrays(mesh):
+    num_polys = len(mesh.polygons)
+    loop_start = np.empty(num_polys, dtype=np.int64)
+    loop_total = np.empty(num_polys, dtype=np.int64)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_polys = np.repeat(np.arange(num_polys), loop_total)
+    next_loops = np.arange(len(loop_verts)) + 1
+    next_loops[loop_start + loop_total - 1] = loop_start
+    return loop_start, loop_total, loop_verts, loop_polys, next_loops
+
+# pipeline_cache data for the geometry of obj: coordinates, topology, material indices and transform,
+# optionally vertex group weights, all UV layers and the evaluated (modifiers applied) geometry
+def get_mesh_cache_data(obj, include_weights=False, include_uvs=False, evaluated=False):
+    mesh = obj.data
+    _, loop_total, loop_verts, _, _ = get_polygon_loop_arrays(mesh)
+    material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    data = [get_vertex_coordinates_array(mesh), loop_total, loop_verts, material_indices, np.array(obj.matrix_world)]
+    if include_weights:
+        weights = VertexGroupWeights(obj)
+        data += [weights.group_names, weights.indptr, weights.group_indices, weights.weights]
+    if include_uvs:
+        for uv_layer in mesh.uv_layers:
+            uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            uv_layer.data.foreach_get("uv", uvs)
+            data += [uv_layer.name, uv_layer.active_render, uvs]
+    if evaluated:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        obj_eval = obj.evaluated_get(depsgraph)
+        mesh_eval = obj_eval.to_mesh()
+        _, eval_loop_total, eval_loop_verts, _, _ = get_polygon_loop_arrays(mesh_eval)
+        data += [get_vertex_coordinates_array(mesh_eval), eval_loop_total, eval_loop_verts]
+        obj_eval.to_mesh_clear()
+    return data
+
+def normalize_vectors(vectors):
+    lengths = np.linalg.norm(vectors, axis=1)
+    result = np.zeros_like(vectors)
+    nonzero = lengths > 0
+    result[nonzero] = vectors[nonzero] / lengths[nonzero, None]
+    return result
+
+# Newell face normals for all polygons at once, normalized
+def calculate_face_normals_array(coords, loop_arrays):
+    loop_start, loop_total, loop_verts, loop_polys, next_loops = loop_arrays
+    if len(loop_start) == 0:
+        return np.zeros((0, 3))
+    cross = np.cross(coords[loop_verts], coords[loop_verts[next_loops]])
+    return normalize_vectors(np.add.reduceat(cross, loop_start, axis=0))
+
+# vertex normals as the normalized sum of the linked (normalized) face normals
+def calculate_vertex_normals_array(num_verts, face_normals, loop_arrays):
+    loop_start, loop_total, loop_verts, loop_polys, next_loops = loop_arrays
+    loop_normals = face_normals[loop_polys]
+    vertex_normals = np.empty((num_verts, 3))
+    for axis in range(3):
+        vertex_normals[:, axis] = np.bincount(loop_verts, weights=loop_normals[:, axis], minlength=num_verts)
+    return normalize_vectors(vertex_normals)
+
+# per-face maximum weight of each group, so a face "has" a group at a threshold if any of its verts do
+def get_face_max_weights_array(vertex_weights, loop_arrays):
+    loop_start, loop_total, loop_verts, loop_polys, next_loops = loop_arrays
+    if len(loop_start) == 0 or vertex_weights.shape[1] == 0:
+        return np.zeros((len(loop_start), vertex_weights.shape[1]), dtype=np.float32)
+    return np.maximum.reduceat(vertex_weights[loop_verts], loop_start, axis=0)
+
+def have_common_vertex_groups_array(vertex_weights, face_max_weights, weight_threshold):
+    if vertex_weights.shape[1] == 0:
+        return np.zeros(len(vertex_weights), dtype=bool)
+    return np.any((vertex_weights >= weight_threshold) & (face_max_weights >= weight_threshold), axis=1)
+
+def get_face_vertex_mask(face_mask, num_verts, loop_arrays):
+    loop_start, loop_total, loop_verts, loop_polys, next_loops = loop_arrays
+    vertex_mask = np.zeros(num_verts, dtype=bool)
+    vertex_mask[loop_verts[face_mask[loop_polys]]] = True
+    return vertex_mask
+
+# Face flip detection and rollback on vertex coordinate arrays.  The triangle index array (a fan per polygon)
+# and the original face normals are computed once, each check is one vectorized cross product per triangle
+# summed per face, and a rollback is a masked copy from the coordinates of the previous iteration.
+class FaceFlipGuard:
+    def __init__(self, coords, loop_arrays):
+        loop_start, loop_total, loop_verts, loop_polys, next_loops = loop_arrays
+        self.num_verts = len(coords)
+        self.loop_arrays = loop_arrays
+        num_triangles = loop_total - 2
+        triangle_polys = np.repeat(np.arange(len(loop_start)), num_triangles)
+        self.triangle_start = np.cumsum(num_triangles) - num_triangles
+        fan_index = np.arange(len(triangle_polys)) - np.repeat(self.triangle_start, num_triangles)
+        first_loops = loop_start[triangle_polys]
+        self.triangles = np.stack([loop_verts[first_loops], loop_verts[first_loops + fan_index + 1],
+                                   loop_verts[first_loops + fan_index + 2]], axis=1)
+        # no per-face sum needed when every face is a triangle
+        self.all_triangles = bool(np.all(num_triangles == 1))
+        self.original_normals = self.get_face_normals(coords)
+
+    # normalized face normals, the sum of the fan triangle normals is the polygon's (Newell) normal
+    def get_face_normals(self, coords):
+        if len(self.triangles) == 0:
+            return np.zeros((0, 3))
+        corners = coords[self.triangles]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        if not self.all_triangles:
+            normals = np.add.reduceat(normals, self.triangle_start, axis=0)
+        return normalize_vectors(normals)
+
+    def get_flipped_faces(self, coords):
+        return np.einsum("ij,ij->i", self.get_face_normals(coords), self.original_normals) < 0
+
+    # copy the vertices of the flipped faces back from previous_coords, returns the mask of restored vertices
+    def rollback(self, coords, previous_coords, flipped):
+        undo_mask = get_face_vertex_mask(flipped, self.num_verts, self.loop_arrays)
+        coords[undo_mask] = previous_coords[undo_mask]
+        return undo_mask
+
+# Batch ray queries against a BVH tree of one mesh state.  update() only rebuilds the tree when the
+# coordinates or topology differ from the ones it was last built from.
+class MeshRayCaster:
+    def __init__(self):
+        self.bvh = None
+        self.coords = None
+        self.loop_start = None
+        self.loop_verts = None
+        self.build_count = 0
+
+    def update(self, coords, loop_arrays):
+        loop_start, loop_total, loop_verts, _, _ = loop_arrays
+        if (self.bvh is not None and np.array_equal(self.coords, coords)
+                and np.array_equal(self.loop_start, loop_start) and np.array_equal(self.loop_verts, loop_verts)):
+            return False
+        loop_verts_list = loop_verts.tolist()
+        polygons = [loop_verts_list[start:start + total] for start, total in zip(loop_start.tolist(), loop_total.tolist())]
+        self.bvh = BVHTree.FromPolygons(coords.tolist(), polygons)
+        self.coords = coords.copy()
+        self.loop_start = loop_start.copy()
+        self.loop_verts = loop_verts.copy()
+        self.build_count += 1
+        return True
+
+    # Returns (hit, locations, normals, face_indices, distances) arrays, one entry per ray.
+    # max_distance may be a single value or one value per ray, None means unlimited.
+    def ray_cast(self, origins, directions, max_distance=None):
+        origins = np.asarray(origins, dtype=np.float64).reshape((-1, 3))
+        directions = np.asarray(directions, dtype=np.float64).reshape((-1, 3))
+        num_rays = len(origins)
+        if max_distance is None:
+            max_distance = np.inf
+        distances = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (num_rays,))
+
+        hit = np.zeros(num_rays, dtype=bool)
+        locations = np.zeros((num_rays, 3))
+        normals = np.zeros((num_rays, 3))
+        face_indices = np.full(num_rays, -1, dtype=np.int64)
+        hit_distances = np.full(num_rays, np.inf)
+
+        # zero-length directions can not hit anything
+        valid_rays = np.flatnonzero(np.any(directions != 0, axis=1))
+        bvh_ray_cast = self.bvh.ray_cast
+        for i, origin, direction, distance in zip(valid_rays.tolist(), origins[valid_rays].tolist(), directions[valid_rays].tolist(), distances[valid_rays].tolist()):
+            location, normal, index, hit_distance = bvh_ray_cast(origin, direction, distance)
+            if location is not None:
+                hit[i] = True
+                locations[i] = location
+                normals[i] = normal
+                face_indices[i] = index
+                hit_distances[i] = hit_distance
+        normals[hit] = normalize_vectors(normals[hit])
+
+        return hit, locations, normals, face_indices, hit_distances
+
+# ray casters by object name, cleared at the start of each conversion (see clear_object_ray_casters())
+object_ray_casters = {}
+
+# free the BVH trees and geometry copies of all cached ray casters
+def clear_object_ray_casters():
+    object_ray_casters.clear()
+
+# cached ray caster for the evaluated geometry of obj (same geometry Object.ray_cast() uses)
+def get_object_ray_caster(obj):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh_eval = obj_eval.to_mesh()
+    coords = get_vertex_coordinates_array(mesh_eval)
+    loop_arrays = get_polygon_loop_arrays(mesh_eval)
+    obj_eval.to_mesh_clear()
+
+    ray_caster = object_ray_casters.get(obj.name)
+    if ray_caster is None:
+        ray_caster = MeshRayCaster()
+        object_ray_casters[obj.name] = ray_caster
+    ray_caster.update(coords, loop_arrays)
+    return ray_caster
+
+
+# NumPy version of autofit_mesh_bmesh(): same passes and thresholds, but vertex state is kept in arrays
+# and boolean masks, offsets are applied in bulk and the mesh is written back when the fit is done (or
+# every writeback_interval iterations).  Pass 1 stops early once it has converged (see AUTOFIT_* settings).
+# Returns a report dictionary: iterations, hits, moved, skipped, ignored and time per pass.
+def autofit_mesh_numpy(source, target, fit_ratio=1.0, distance_cutoff=10.0, pass1_iterations=200, pass2_iterations=5, lock_tagged_verts=True,
+                       moved_fraction_tolerance=None, displacement_tolerance=None, converged_iterations=None, writeback_interval=None):
+    if moved_fraction_tolerance is None:
+        moved_fraction_tolerance = AUTOFIT_MOVED_FRACTION_TOLERANCE
+    if displacement_tolerance is None:
+        displacement_tolerance = AUTOFIT_DISPLACEMENT_TOLERANCE
+    if converged_iterations is None:
+        converged_iterations = AUTOFIT_CONVERGED_ITERATIONS
+    if writeback_interval is None:
+        writeback_interval = AUTOFIT_WRITEBACK_INTERVAL
+
+    weight_threshold = 0.55
+    normal_threshold = 0.01
+
+    weight_threshold_end = 0.20
+    normal_threshold_end = 0.99
+    weight_threshold_step = (weight_threshold_end - weight_threshold) / pass1_iterations
+    normal_threshold_step = (normal_threshold_end - normal_threshold) / pass1_iterations
+
+    ray_cast_direction = 1
+    offset_multiplier = fit_ratio
+    if fit_ratio < 1:
+        ray_cast_direction = -1
+        offset_multiplier = 2 - fit_ratio
+
+    num_converged = 0
+
+    source_mesh = source.data
+    target_mesh = target.data
+    num_verts = len(source_mesh.vertices)
+    num_target_verts = len(target_mesh.vertices)
+
+    source_loops = get_polygon_loop_arrays(source_mesh)
+    target_loops = get_polygon_loop_arrays(target_mesh)
+    source_loop_start, source_loop_total, source_loop_verts, _, _ = source_loops
+
+    coords = get_vertex_coordinates_array(source_mesh)
+    target_coords = get_vertex_coordinates_array(target_mesh)
+    flip_guard = FaceFlipGuard(coords, source_loops)
+
+    # only vertex groups present on both objects can ever be in common
+    target_group_names = set(vg.name for vg in target.vertex_groups)
+    common_group_names = [vg.name for vg in source.vertex_groups if vg.name in target_group_names]
+    source_weights = VertexGroupWeights(source).get_dense_weights(common_group_names)
+    target_weights = VertexGroupWeights(target).get_dense_weights(common_group_names)
+    source_face_weights = get_face_max_weights_array(source_weights, source_loops)
+    target_face_weights = get_face_max_weights_array(target_weights, target_loops)
+
+    tagged = np.zeros(num_verts, dtype=bool)
+
+    report = {"object": source.name, "aborted": None, "writebacks": 0}
+    def new_pass_report(counters):
+        pass_report = {"iterations": 0, "time": 0.0}
+        for counter in counters:
+            pass_report[counter] = []
+        return pass_report
+    report["pass1"] = new_pass_report(["hits", "moved", "skipped", "ignored", "undone", "max_displacement"])
+    report["pass1"]["converged"] = False
+    report["pass2"] = new_pass_report(["hits", "moved", "skipped", "opposite", "same", "not_same", "undone"])
+
+    def write_back(iteration_coords):
+        set_vertex_coordinates_array(source_mesh, iteration_coords)
+        report["writebacks"] += 1
+
+    def finish(aborted=None):
+        report["aborted"] = aborted
+        report["tagged_verts"] = int(np.count_nonzero(tagged))
+        report["time"] = report["pass1"]["time"] + report["pass2"]["time"]
+        return report
+
+    pass_start_time = time.perf_counter()
+    # the target does not change during the fit, so its tree is built once
+    target_ray_caster = get_object_ray_caster(target)
+
+    for iteration in range(pass1_iterations):
+        previous_coords = coords.copy()
+        moved = np.zeros(num_verts, dtype=bool)
+
+        face_normals = flip_guard.get_face_normals(coords)
+        vertex_normals = calculate_vertex_normals_array(num_verts, face_normals, source_loops)
+
+        if lock_tagged_verts:
+            candidates = np.flatnonzero(~tagged)
+        else:
+            candidates = np.arange(num_verts)
+        hit, hit_locations, hit_normals, hit_faces, _ = target_ray_caster.ray_cast(coords[candidates], vertex_normals[candidates] * ray_cast_direction, distance_cutoff)
+        hit_indices = candidates[hit]
+        hit_locations = hit_locations[hit]
+        hit_normals = hit_normals[hit]
+        hit_faces = hit_faces[hit]
+        hits = len(hit_indices)
+
+        common = have_common_vertex_groups_array(source_weights[hit_indices], target_face_weights[hit_faces], weight_threshold)
+        dots = np.einsum("ij,ij->i", hit_normals, vertex_normals[hit_indices])
+        opposite = common & (dots < -1 + 0.9)
+        same = common & ~opposite & (dots > 1 - normal_threshold)
+        ignored = int(np.count_nonzero(opposite))
+        skipped = int(np.count_nonzero(common & ~opposite & ~same))
+
+        move_indices = hit_indices[same]
+        coords[move_indices] += (hit_locations[same] - coords[move_indices]) * offset_multiplier
+        moved[move_indices] = True
+        num_verts_moved = len(move_indices)
+
+        num_undone = 0
+        flipped = flip_guard.get_flipped_faces(coords)
+        if np.any(flipped):
+            num_undone = int(np.count_nonzero(flipped))
+            undo_mask = flip_guard.rollback(coords, previous_coords, flipped)
+            tagged |= undo_mask
+            moved &= ~undo_mask
+        # double check
+        if np.any(flip_guard.get_flipped_faces(coords)):
+            _add_to_log("DEBUG: autofit_mesh(): PASS1: Flipped normals detected. Aborting.")
+            # the mesh keeps the last iteration without flipped faces
+            write_back(previous_coords)
+            report["pass1"]["time"] = time.perf_counter() - pass_start_time
+            return finish("pass1")
+
+        max_displacement = float(np.max(np.linalg.norm(coords[moved] - previous_coords[moved], axis=1))) if np.any(moved) else 0.0
+        pass1_report = report["pass1"]
+        pass1_report["iterations"] = iteration + 1
+        for counter, value in (("hits", hits), ("moved", num_verts_moved), ("skipped", skipped), ("ignored", ignored),
+                               ("undone", num_undone), ("max_displacement", max_displacement)):
+            pass1_report[counter].append(value)
+
+        if writeback_interval > 0 and (iteration + 1) % writeback_interval == 0:
+            write_back(coords)
+
+        weight_threshold += weight_threshold_step
+        normal_threshold += normal_threshold_step
+
+        # converged: (almost) nothing moved, and nothing moved far
+        num_moved = int(np.count_nonzero(moved))
+        if num_moved <= moved_fraction_tolerance * num_verts and max_displacement <= displacement_tolerance:
+            num_converged += 1
+            if num_converged > converged_iterations:
+                pass1_report["converged"] = True
+                break
+        else:
+            num_converged = 0
+
+    report["pass1"]["time"] = time.perf_counter() - pass_start_time
+    pass_start_time = time.perf_counter()
+
+    target_face_normals = calculate_face_normals_array(target_coords, target_loops)
+    target_vertex_normals = calculate_vertex_normals_array(num_target_verts, target_face_normals, target_loops)
+    # the source tree is rebuilt from the current coordinates only when a pass actually moved something
+    source_ray_caster = MeshRayCaster()
+
+    for iteration in range(pass2_iterations):
+        previous_coords = coords.copy()
+
+        source_ray_caster.update(coords, source_loops)
+        hit, hit_locations, hit_normals, hit_faces, _ = source_ray_caster.ray_cast(target_coords, -target_vertex_normals * ray_cast_direction, distance_cutoff)
+        hit_indices = np.flatnonzero(hit)
+        hit_locations = hit_locations[hit]
+        hit_normals = hit_normals[hit]
+        hit_faces = hit_faces[hit]
+        total_skip_no_skip = len(hit_indices)
+
+        common = have_common_vertex_groups_array(target_weights[hit_indices], source_face_weights[hit_faces], 0.55)
+        dots = np.einsum("ij,ij->i", hit_normals, target_vertex_normals[hit_indices])
+        opposite = common & (dots < 0)
+        same = common & ~opposite & (dots > 1 - 0.01)
+        skipped_faces = int(np.count_nonzero(~common))
+        num_opposite = int(np.count_nonzero(opposite))
+        num_not_same = int(np.count_nonzero(common & ~opposite & ~same))
+        num_same = int(np.count_nonzero(same))
+
+        # each source face is moved by the first target vertex that hits it, and each source vertex
+        # only by the first face that reaches it, which is the same order the sequential loop used
+        offsets = target_coords[hit_indices[same]] - hit_locations[same]
+        faces, first_hits = np.unique(hit_faces[same], return_index=True)
+        order = np.argsort(first_hits)
+        faces = faces[order]
+        offsets = offsets[first_hits[order]]
+        num_third_pass_faces = len(faces)
+
+        face_loop_counts = source_loop_total[faces]
+        face_loops = np.repeat(source_loop_start[faces] - np.cumsum(face_loop_counts) + face_loop_counts, face_loop_counts) + np.arange(face_loop_counts.sum())
+        face_verts = source_loop_verts[face_loops]
+        face_offsets = np.repeat(offsets, face_loop_counts, axis=0)
+        untagged = ~tagged[face_verts]
+        face_verts = face_verts[untagged]
+        face_offsets = face_offsets[untagged]
+        move_verts, first_moves = np.unique(face_verts, return_index=True)
+        coords[move_verts] += face_offsets[first_moves] * offset_multiplier
+
+        num_undone = 0
+        flipped = flip_guard.get_flipped_faces(coords)
+        if np.any(flipped):
+            num_undone = int(np.count_nonzero(flipped))
+            tagged |= flip_guard.rollback(coords, previous_coords, flipped)
+        if np.any(flip_guard.get_flipped_faces(coords)):
+            _add_to_log("DEBUG: autofit_mesh(): PASS2: Flipped normals detected. Aborting.")
+            write_back(previous_coords)
+            report["pass2"]["time"] = time.perf_counter() - pass_start_time
+            return finish("pass2")
+
+        pass2_report = report["pass2"]
+        pass2_report["iterations"] = iteration + 1
+        for counter, value in (("hits", total_skip_no_skip), ("moved", num_third_pass_faces), ("skipped", skipped_faces), ("opposite", num_opposite),
+                               ("same", num_same), ("not_same", num_not_same), ("undone", num_undone)):
+            pass2_report[counter].append(value)
+
+    report["pass2"]["time"] = time.perf_counter() - pass_start_time
+    write_back(coords)
+    return finish()
 
 
 # scale object by face normals
 def scale_by_face_normals(obj, scale_factor=1.0):
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-
-    previous_mesh = bmesh.new()
-    previous_mesh.from_mesh(obj.data)
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    loop_arrays = get_polygon_loop_arrays(mesh)
+    coords = get_vertex_coordinates_array(mesh)
 
     # flip normal depending on scale_factor
     normal_direction = 1
     if scale_factor < 1:
         normal_direction = -1
 
-    bm.faces.ensure_lookup_table()
     # Store the original face normals
-    original_normals = [face.normal.copy() for face in bm.faces]
-
-    bm.verts.ensure_lookup_table()
-    # calculate average distance between vertices
-    total_average_distances = 0
-    num_average_distances = 0
-    for vert in bm.verts:
-        # find linked verts
-        total_distances = 0
-        num_distances = 0
-        for neighbor in vert.link_edges:
-            # calculate distance
-            distance = (neighbor.verts[0].co - neighbor.verts[1].co).length
-            total_distances += distance
-            num_distances += 1
-        average_distances = total_distances / num_distances
-        total_average_distances += average_distances
-        num_average_distances += 1
-    average_distance = total_average_distances / num_average_distances
+    flip_guard = FaceFlipGuard(coords, loop_arrays)
+
+    # calculate average distance between vertices: average length of the linked edges of each vertex, averaged over all vertices
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", edge_verts)
+    edge_verts = edge_verts.reshape((-1, 2))
+    edge_lengths = np.linalg.norm(coords[edge_verts[:, 0]] - coords[edge_verts[:, 1]], axis=1)
+    vertex_edge_counts = np.bincount(edge_verts.ravel(), minlength=num_verts)
+    vertex_edge_lengths = np.bincount(edge_verts.ravel(), weights=np.repeat(edge_lengths, 2), minlength=num_verts)
+    linked = vertex_edge_counts > 0
+    average_distance = float(np.mean(vertex_edge_lengths[linked] / vertex_edge_counts[linked])) if np.any(linked) else 0.0
 
     # calculate offset
     offset = average_distance * abs(1 - scale_factor)
-    print(f"DEBUG: scale_by_face_normals(): offset={offset}, average_distance={average_distance}, scale_factor={scale_factor}")
+    _add_to_log(f"DEBUG: scale_by_face_normals(): offset={offset}, average_distance={average_distance}, scale_factor={scale_factor}")
 
     flipped_normals = False
-    locked_verts = []
-    def add_locked_verts(v):
-        if v not in locked_verts:
-            locked_verts.append(v)
+    locked = np.zeros(num_verts, dtype=bool)
 
     num_iterations = 200
     for iteration in range(num_iterations):
-        previous_mesh.from_mesh(obj.data)
-        previous_mesh.faces.ensure_lookup_table()
-        bm.verts.ensure_lookup_table()
+        previous_coords = coords.copy()
+
+        # move every unlocked vertex along its normal
+        face_normals = flip_guard.get_face_normals(coords)
+        vertex_normals = calculate_vertex_normals_array(num_verts, face_normals, loop_arrays) * normal_direction
+        coords[~locked] += vertex_normals[~locked] * (offset/num_iterations)
 
-        # iterate by vertex
-        for vert in bm.verts:
-            if vert in locked_verts:
-                continue
-            normal = Vector((0, 0, 0))
-            for f in vert.link_faces:
-                normal += f.normal
-            normal = normal.normalized() * normal_direction
-            vert.co += normal * (offset/num_iterations)
-        
         # calculate if normals were flipped by the operation
-        result, face_indexes = calculate_if_normals_were_flipped(bm, original_normals)
-        if result:
-            for face_index in face_indexes:
-                current_face = bm.faces[face_index]
-                previous_face = previous_mesh.faces[face_index]
-                for i, current_vert in enumerate(current_face.verts):
-                    print(f"DEBUG: Flip detected, undoing offset for vertex {current_vert.index}")
-                    current_vert.co = previous_face.verts[i].co
-                    add_locked_verts(vert)
-        
+        flipped = flip_guard.get_flipped_faces(coords)
+        if np.any(flipped):
+            _add_to_log(f"DEBUG: Flip detected, undoing offset for {np.count_nonzero(flipped)} faces")
+            locked |= flip_guard.rollback(coords, previous_coords, flipped)
+
         # recheck for flipped normals
-        result, _ = calculate_if_normals_were_flipped(bm, original_normals)
-        if result:
+        if np.any(flip_guard.get_flipped_faces(coords)):
             flipped_normals = True
             break
 
-        if flipped_normals == False:
-            bm.to_mesh(obj.data)
-        else:
-            break
-    print(f"DEBUG: scale_by_face_normals(): iteration={iteration}, flipped_normals={flipped_normals}")
-    obj.data.update()
-    bm.free()
-    previous_mesh.free()
+        set_vertex_coordinates_array(mesh, coords)
+    _add_to_log(f"DEBUG: scale_by_face_normals(): iteration={iteration}, flipped_normals={flipped_normals}")
 
-    print("DEBUG: scale_by_face_normals(): DONE")
+    _add_to_log("DEBUG: scale_by_face_normals(): DONE")
 
 
 def calculate_if_normals_were_flipped(bm, original_normals):
@@ -1544,93 +2745,64 @@ def calculate_if_self_pokethrough(obj, bm):
     bm.faces.ensure_lookup_table()
     bm.verts.ensure_lookup_table()
 
+    ray_caster = get_object_ray_caster(obj)
+
     self_pokethrough = False
     vertex_index_list = []
-    for i, vert in enumerate(bm.verts):
-        ###### DB 2024/8/11, average of linked face normals may not be equivalent to vertex normal ==> USE VERTEX NORMAL
-        # normal = Vector((0, 0, 0))
-        # for f in vert.link_faces:
-        #     normal += f.normal
-        # normal = normal.normalized()
-        #######
-        normal = vert.normal
-        normal = normal.normalized()
-
-        # ray cast against self, get face and face normal
-        hit, loc, face_normal, face_index = obj.ray_cast(vert.co, normal)
-        if hit:
-            # if loc == vert.co:
-            #     # print(f"DEBUG: premature self-pokethrough detection trigger, skipping: hit loc={loc}, vert.co={vert.co}")
-            #     continue
-            linked_face_indexes = [f.index for f in vert.link_faces]
-            if face_index in linked_face_indexes:
-                # print(f"DEBUG: Invalid hit: face_index={face_index}, vert.link_faces={str(linked_face_indexes)}")
-                continue
-            face_normal = face_normal.normalized()
-            # print(f"****** v[{vert.index}] = {vert.co}")
-            if face_normal.dot(normal) < 0:
-                # check if edges intersect with face
-                for edge in vert.link_edges:
-                    if vert.co == edge.verts[0].co:
-                        point_a = edge.verts[0].co
-                        point_b = edge.verts[1].co
-                        vert_b = edge.verts[1]
-                    else:
-                        point_a = edge.verts[1].co
-                        point_b = edge.verts[0].co
-                        vert_b = edge.verts[0]
-                    edge_vector = point_b - point_a
-                    edge_vector.normalize()
-                    # hit_loc = mathutils.geometry.intersect_line_plane(point_a, point_b, loc, face_normal)
-                    hit2, hit_loc, _, _ = obj.ray_cast(point_a, edge_vector)
-                    if hit2 and hit_loc is not None:
-                        if hit_loc == point_a or (hit_loc - point_a).length < 0.0001:
-                            # print(f"DEBUG: Invalid result (condition1): [{i}] hit_loc={hit_loc}, vert.co={vert.co}, skipping")
-                            continue
-                        if hit_loc == point_b or (hit_loc - point_b).length < 0.0001:
-                            # print(f"DEBUG: Invalid result (condition2): [{i}] hit_loc={hit_loc}, neighbor={point_b}, skipping")
-                            continue
-                        # check if hit_loc is on the edge
-                        v1 = hit_loc - point_a
-                        v2 = hit_loc - point_b
-                        v1.normalize()
-                        v2.normalize()
-                        # must be near -1
-                        epsilon = 0.1
-                        dot = v1.dot(v2)
-                        # if abs((-1) - dot) < epsilon:
-                        if dot <= 0:
-                            face_verts = bm.faces[face_index].verts
-                            result = mathutils.geometry.intersect_point_tri(hit_loc, face_verts[0].co, face_verts[1].co, face_verts[2].co)
-                            if result is not None:
-                                print(f"DEBUG: Self poke through detected for vertex {i}: vert_index={vert.index} {vert.co}, hit_loc={hit_loc}, edge=({edge.verts[0].co}, {edge.verts[1].co})")
-                                # print(f"DEBUG2: dot={v1.dot(v2):5f}, v1={v1}, v2={v2}, hit_loc={hit_loc}, loc={loc}")
-
-                                print(f"****** v[{vert.index}] = {vert.co}")
-                                self_pokethrough = True
-                                if i not in vertex_index_list:                                
-                                    vertex_index_list.append(i)
-                                # hit_loc_vert = create_vertex_at_loc(bm, hit_loc)
-                                # vertex_index_list.append(hit_loc_vert.index)
-                                break
-                            # else:
-                            #     print(f"DEBUG: Invalid result (condition4): [{i}] dot={dot:.5f}, hit_loc={hit_loc}, edge.verts[0]={edge.verts[0].co}, edge.verts[1]={edge.verts[1].co}, skipping")
-                            #     self_pokethrough = True
-                            #     if i not in vertex_index_list:
-                            #         vertex_index_list.append(i)
-                            #     if vert_b.index not in vertex_index_list:
-                            #         vertex_index_list.append(vert_b.index)
-                            #     hit_vert = create_vertex_at_loc(bm, hit_loc)
-                            #     bm.verts.index_update()
-                            #     bm.verts.ensure_lookup_table()
-                            #     vertex_index_list.append(hit_vert.index)
-                            #     break
-                        # else:
-                        #     print(f"DEBUG: Invalid result (condition3): [{i}] dot={dot:.5f}, hit_loc={hit_loc}, edge.verts[0]={edge.verts[0].co}, edge.verts[1]={edge.verts[1].co}, skipping")
-                        #     self_pokethrough = True
-                        #     if i not in vertex_index_list:
-                        #         vertex_index_list.append(i)
-                        #         break
+
+    ###### DB 2024/8/11, average of linked face normals may not be equivalent to vertex normal ==> USE VERTEX NORMAL
+    vertex_normals = [vert.normal.normalized() for vert in bm.verts]
+
+    # ray cast against self, get face and face normal
+    hit, _, face_normals, face_indices, _ = ray_caster.ray_cast([vert.co for vert in bm.verts], vertex_normals)
+
+    # gather the edge rays of every vertex that hit a back-facing, non-linked face
+    edge_rays = []
+    for i in np.flatnonzero(hit).tolist():
+        vert = bm.verts[i]
+        face_index = int(face_indices[i])
+        linked_face_indexes = [f.index for f in vert.link_faces]
+        if face_index in linked_face_indexes:
+            continue
+        if Vector(face_normals[i]).dot(vertex_normals[i]) >= 0:
+            continue
+        for edge in vert.link_edges:
+            if vert.co == edge.verts[0].co:
+                point_a = edge.verts[0].co
+                point_b = edge.verts[1].co
+            else:
+                point_a = edge.verts[1].co
+                point_b = edge.verts[0].co
+            edge_rays.append((i, face_index, point_a.copy(), point_b.copy()))
+
+    if len(edge_rays) == 0:
+        return self_pokethrough, vertex_index_list
+
+    # check if edges intersect with face
+    edge_hit, edge_locations, _, _, _ = ray_caster.ray_cast([ray[2] for ray in edge_rays], [(ray[3] - ray[2]).normalized() for ray in edge_rays])
+    for ray_index, (i, face_index, point_a, point_b) in enumerate(edge_rays):
+        if i in vertex_index_list or not edge_hit[ray_index]:
+            continue
+        hit_loc = Vector(edge_locations[ray_index])
+        if hit_loc == point_a or (hit_loc - point_a).length < 0.0001:
+            continue
+        if hit_loc == point_b or (hit_loc - point_b).length < 0.0001:
+            continue
+        # check if hit_loc is on the edge
+        v1 = hit_loc - point_a
+        v2 = hit_loc - point_b
+        v1.normalize()
+        v2.normalize()
+        dot = v1.dot(v2)
+        if dot <= 0:
+            face_verts = bm.faces[face_index].verts
+            result = mathutils.geometry.intersect_point_tri(hit_loc, face_verts[0].co, face_verts[1].co, face_verts[2].co)
+            if result is not None:
+                vert = bm.verts[i]
+                _add_to_log(f"DEBUG: Self poke through detected for vertex {i}: vert_index={vert.index} {vert.co}, hit_loc={hit_loc}, edge=({point_a}, {point_b})")
+                _add_to_log(f"****** v[{vert.index}] = {vert.co}")
+                self_pokethrough = True
+                vertex_index_list.append(i)
 
     return self_pokethrough, vertex_index_list
 
@@ -1647,6 +2819,59 @@ def create_vertex_at_loc(bm, location):
     return new_vert
 
 
+# Returns (face_mask, removal_counts): a boolean mask of the faces of obj.data that are obscured at any
+# of the thresholds, and a {threshold: number of faces first removed at that threshold} dictionary.
+# Each (vertex, linked face) ray is cast once and every threshold is classified from its hit distance.
+def find_obscured_faces(obj, offset=0.001, threshold_list=[0.5, 1.0, 1.5]):
+    mesh = obj.data
+    num_verts = len(mesh.vertices)
+    num_faces = len(mesh.polygons)
+    loop_arrays = get_polygon_loop_arrays(mesh)
+    loop_start, loop_total, loop_verts, loop_polys, _ = loop_arrays
+
+    coords = get_vertex_coordinates_array(mesh)
+    face_normals = np.empty(num_faces * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", face_normals)
+    face_normals = face_normals.reshape((-1, 3)).astype(np.float64)
+
+    face_mask = np.zeros(num_faces, dtype=bool)
+    removal_counts = {}
+    if num_faces == 0:
+        for threshold in threshold_list:
+            removal_counts[threshold] = 0
+        return face_mask, removal_counts
+
+    # one ray per face corner, i.e. per (vertex, linked face) pair
+    ray_directions = face_normals[loop_polys]
+    ray_origins = coords[loop_verts] + ray_directions * offset
+    ray_caster = get_object_ray_caster(obj)
+    hit, _, _, hit_faces, hit_distances = ray_caster.ray_cast(ray_origins, ray_directions)
+
+    num_linked_faces = np.bincount(loop_verts, minlength=num_verts)
+    corner_keys = loop_verts * num_faces + loop_polys
+
+    for threshold in threshold_list:
+        # a direction is obscured if its ray hits something within the threshold...
+        close_hits = hit & (hit_distances <= threshold)
+        close_per_vert = np.bincount(loop_verts, weights=close_hits, minlength=num_verts)
+        # ...that is not the face being tested, so discount hits on the face owning each corner
+        hit_keys, hit_key_counts = np.unique(loop_verts[close_hits] * num_faces + hit_faces[close_hits], return_counts=True)
+        self_hits = np.zeros(len(corner_keys))
+        if len(hit_keys) > 0:
+            lookup = np.minimum(np.searchsorted(hit_keys, corner_keys), len(hit_keys) - 1)
+            found = hit_keys[lookup] == corner_keys
+            self_hits[found] = hit_key_counts[lookup[found]]
+        # a vertex is obscured if all of its linked face directions are, a face if all of its vertices are
+        corner_obscured = (close_per_vert[loop_verts] - self_hits) == num_linked_faces[loop_verts]
+        obscured = np.logical_and.reduceat(corner_obscured, loop_start) & ~face_mask
+        removal_counts[threshold] = int(np.count_nonzero(obscured))
+        face_mask |= obscured
+        _add_to_log(f"DEBUG: threshold = {threshold:.4f}, obscured faces = {removal_counts[threshold]}")
+
+    return face_mask, removal_counts
+
+
+# Returns a {threshold: removed face count} dictionary
 def remove_obscured_faces(obj, offset=0.001, threshold_list=[0.5, 1.0, 1.5]):
     if "StudioPresentationType" in obj:
         asset_type = obj["StudioPresentationType"]
@@ -1657,62 +2882,45 @@ def remove_obscured_faces(obj, offset=0.001, threshold_list=[0.5, 1.0, 1.5]):
             # else:
             #     threshold_list = [threshold_list[0]]
             # print(f"DEBUG: Hair asset deteted: Using reduced settings for : {obj.name}, thresholds={[str(threshold_list)]}")
-            print(f"DEBUG: Hair asset deteted: skipping hidden surface removal : {obj.name}")
+            _add_to_log(f"DEBUG: Hair asset deteted: skipping hidden surface removal : {obj.name}")
 
-    print(f"DEBUG: remove_obscured_faces(): obj={obj.name}, offset={offset}, threshold_list={threshold_list}")
+    _add_to_log(f"DEBUG: remove_obscured_faces(): obj={obj.name}, offset={offset}, threshold_list={threshold_list}")
     # Object Mode
     bpy.ops.object.mode_set(mode='OBJECT')
 
+    face_mask = None
+    cache_key = None
+    if pipeline_cache.is_enabled():
+        cache_key = pipeline_cache.make_key("obscured_faces", [offset, list(threshold_list)], get_mesh_cache_data(obj, evaluated=True))
+        cache_entry = pipeline_cache.load_entry(cache_key, "obscured_faces")
+        if cache_entry is not None:
+            face_mask = pipeline_cache.load_array(cache_entry, "face_mask")
+            removal_counts = {threshold: count for threshold, count in cache_entry["data"]["removal_counts"]}
+            if len(face_mask) != len(obj.data.polygons):
+                face_mask = None
+
+    if face_mask is None:
+        face_mask, removal_counts = find_obscured_faces(obj, offset, threshold_list)
+        # obj loses faces below, its ray caster would be rebuilt on the next use
+        object_ray_casters.pop(obj.name, None)
+        if cache_key is not None:
+            pipeline_cache.store_entry(cache_key, "obscured_faces", {"removal_counts": list(removal_counts.items())},
+                                       arrays={"face_mask": face_mask})
+
+    num_removed = remove_faces(obj, face_mask)
+    _add_to_log(f"Removed {num_removed} obscured faces")
+
+    return removal_counts
+
+# remove the faces of obj where face_mask is True, returns the number of faces removed
+def remove_faces(obj, face_mask):
     # Create a bmesh
     bm = bmesh.new()
     bm.from_mesh(obj.data)
-    
-    # Get the scene for ray_cast
-    scene = bpy.context.scene
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    depsgraph.update()
-    faces_to_remove = []
-
-    # for threshold in [offset*500, offset*1000, offset*2000, offset*3000, offset*4000]:
-    # for threshold in [0.005, 0.010, 0.015]:
-    for threshold in threshold_list:
-        bm.faces.ensure_lookup_table()
-        print(f"DEBUG: threshold = {threshold:.4f}")
+    bm.faces.ensure_lookup_table()
 
-        for face in bm.faces:
-            obscured_verts = []
-            if face in faces_to_remove:
-                continue
-            for v in face.verts:
-                obscured_face_normal = []
-                for f in v.link_faces:
-                    vert_normal = f.normal
-                    ray_origin = v.co + vert_normal * offset
-                    ray_direction = vert_normal                
-
-                    # result, location, normal, index, hit_obj, _ = scene.ray_cast(depsgraph, ray_origin, ray_direction)
-                    result, location, normal, index, = obj.ray_cast(ray_origin, ray_direction)
-                    # If ray hit something and it's not the current face, mark for removal
-                    # if result and (hit_obj != obj or (hit_obj == obj and index != face.index)):
-                    if result and index != face.index:
-                        # if location is far away, it's not an occluder
-                        # print(f"DEBUG: ray_cast:[{v.index}] length = {(location - ray_origin).length:.2f} vs threshold={threshold:.2f}")
-                        if (location - ray_origin).length > threshold:
-                            continue
-                        obscured_face_normal.append(f)
-                    else:
-                        # print(f"DEBUG: ray_cast:[{v.index}] no hit, offset={offset}, threshold={threshold:.2f}")
-                        pass
-                # If all linked face normal directions are obscured, mark vertex for removal
-                # print(f"DEBUG: [{v.index}] obscured_face_normal = {len(obscured_face_normal)} vs link_normals={len(v.link_faces)}")
-                if len(obscured_face_normal) == len(v.link_faces):
-                    obscured_verts.append(v)
-            # If all verts are obscured, mark face for removal
-            # print(f"DEBUG: obscured_verts = {len(obscured_verts)} vs face.verts={len(face.verts)}")
-            if len(obscured_verts) == len(face.verts):
-                faces_to_remove.append(face)               
-    
     # Remove marked faces
+    faces_to_remove = [bm.faces[i] for i in np.flatnonzero(face_mask).tolist()]
     bmesh.ops.delete(bm, geom=faces_to_remove, context='FACES')
     
     # Update mesh
@@ -1721,8 +2929,18 @@ def remove_obscured_faces(obj, offset=0.001, threshold_list=[0.5, 1.0, 1.5]):
     
     # Free bmesh
     bm.free()
+
+    return len(faces_to_remove)
+
+# existing or new DECIMATE (collapse) modifier of obj
+def get_decimate_modifier(obj):
+    # Ensure the object has a Decimate modifier
+    decimate_mod = next((mod for mod in obj.modifiers if mod.type == 'DECIMATE'), None)
+    if not decimate_mod:
+        decimate_mod = obj.modifiers.new(name="Decimate", type='DECIMATE')
     
-    print(f"Removed {len(faces_to_remove)} obscured faces")
+    decimate_mod.decimate_type = 'COLLAPSE'
+    return decimate_mod
 
 def get_triangle_count(obj):
     # Create a derived mesh to evaluate the modifier without applying it
@@ -1730,51 +2948,109 @@ def get_triangle_count(obj):
     obj_eval = obj.evaluated_get(depsgraph)
     mesh_eval = obj_eval.to_mesh()
 
-    # Count the number of triangles in the evaluated mesh
-    triangles_count = sum(len(poly.vertices) - 2 for poly in mesh_eval.polygons)
+    # Each n-gon triangulates into n-2 triangles, so the total is loops - 2 * polygons
+    triangles_count = get_mesh_triangle_count(mesh_eval)
 
     # Clean up the evaluated mesh data to free up memory
     obj_eval.to_mesh_clear()
     
     return triangles_count
 
-def adjust_decimation_to_target(obj, target_triangles, tolerance=0.01):
-    print(f"DEBUG: adjust_decimation_to_target(): obj={obj.name}, target_triangles={target_triangles}, tolerance={tolerance}")
-    # Ensure the object has a Decimate modifier
-    decimate_mod = next((mod for mod in obj.modifiers if mod.type == 'DECIMATE'), None)
-    if not decimate_mod:
-        decimate_mod = obj.modifiers.new(name="Decimate", type='DECIMATE')
-    
-    decimate_mod.decimate_type = 'COLLAPSE'
-    
-    # Initial bounds for binary search
-    low_ratio, high_ratio = 0.0, 1.0
-    
-    max_iterations = 50
-    for iterations in range(max_iterations):
-        # Set the current ratio
-        current_ratio = (low_ratio + high_ratio) / 2
-        decimate_mod.ratio = current_ratio
-
+def get_mesh_triangle_count(mesh):
+    return len(mesh.loops) - 2 * len(mesh.polygons)
+
+# Finds the DECIMATE (collapse) ratio that gives target_triangles.  The first guess is predicted from the
+# undecimated triangle count, then refined by interpolating between the closest evaluations on either
+# side of the target (falling back to bisection when interpolation stalls).  Returns the final ratio.
+def adjust_decimation_to_target(obj, target_triangles, tolerance=0.01, max_evaluations=50):
+    _add_to_log(f"DEBUG: adjust_decimation_to_target(): obj={obj.name}, target_triangles={target_triangles}, tolerance={tolerance}")
+    decimate_mod = get_decimate_modifier(obj)
+
+    cache_key = None
+    if pipeline_cache.is_enabled():
+        modifiers = [(mod.name, mod.type) for mod in obj.modifiers]
+        params = [target_triangles, tolerance, max_evaluations, modifiers, decimate_mod.vertex_group, decimate_mod.use_symmetry]
+        cache_key = pipeline_cache.make_key("decimation_ratio", params, get_mesh_cache_data(obj, include_weights=bool(decimate_mod.vertex_group)))
+        cache_entry = pipeline_cache.load_entry(cache_key, "decimation_ratio")
+        if cache_entry is not None:
+            decimate_mod.ratio = cache_entry["data"]["ratio"]
+            bpy.context.view_layer.update()
+            _add_to_log(f"Final decimation ratio (cached): {decimate_mod.ratio:.4f}, Triangles: {cache_entry['data']['triangles']}")
+            return decimate_mod.ratio
+
+    evaluations = 0
+    def evaluate_ratio(ratio):
+        nonlocal evaluations
+        decimate_mod.ratio = ratio
         # Update the mesh
         bpy.context.view_layer.update()
-        
-        # Get the current triangle count
-        current_triangles = get_triangle_count(obj)
-
-        print(f"DEBUG: Iteration {iterations}, Ratio: {current_ratio:.8f}, Triangles: {current_triangles}, Target: {target_triangles}")
+        evaluations += 1
+        return get_triangle_count(obj)
+
+    def within_tolerance(triangles):
+        return abs(triangles - target_triangles) <= tolerance * target_triangles
+
+    # the collapse ratio is roughly the fraction of triangles kept
+    full_triangles = get_mesh_triangle_count(obj.data)
+    if full_triangles <= 0:
+        _add_to_log(f"DEBUG: adjust_decimation_to_target(): obj={obj.name} has no faces, skipping")
+        return decimate_mod.ratio
+    current_ratio = min(1.0, target_triangles / full_triangles)
+
+    # bracket: (ratio, triangles) below and above the target
+    low_ratio, low_triangles = 0.0, 0
+    high_ratio, high_triangles = 1.0, full_triangles
+    best_ratio, best_triangles, best_error = current_ratio, None, None
+    last_side = None
+    repeated_side = False
+
+    while evaluations < max_evaluations:
+        current_triangles = evaluate_ratio(current_ratio)
+        error = abs(current_triangles - target_triangles)
+        if best_error is None or error < best_error:
+            best_ratio, best_triangles, best_error = current_ratio, current_triangles, error
+
+        _add_to_log(f"DEBUG: Evaluation {evaluations}, Ratio: {current_ratio:.8f}, Triangles: {current_triangles}, Target: {target_triangles}")
 
         # Check if we're within tolerance
-        if abs(current_triangles - target_triangles) <= tolerance * target_triangles:
+        if within_tolerance(current_triangles):
             break
-        
+        if current_ratio >= 1.0 and current_triangles < target_triangles:
+            break
+
         # Adjust the bounds
         if current_triangles > target_triangles:
-            high_ratio = current_ratio
+            high_ratio, high_triangles = current_ratio, current_triangles
+            side = "high"
         else:
-            low_ratio = current_ratio
+            low_ratio, low_triangles = current_ratio, current_triangles
+            side = "low"
+        repeated_side = (side == last_side)
+        last_side = side
+
+        # interpolate between the bounds, bisect if the same bound moved twice in a row
+        next_ratio = (low_ratio + high_ratio) / 2
+        if not repeated_side and high_triangles != low_triangles:
+            interpolated_ratio = low_ratio + (target_triangles - low_triangles) * (high_ratio - low_ratio) / (high_triangles - low_triangles)
+            if low_ratio < interpolated_ratio < high_ratio:
+                next_ratio = interpolated_ratio
+        if next_ratio == current_ratio:
+            break
+        current_ratio = next_ratio
+
+    if current_ratio != best_ratio:
+        current_ratio = best_ratio
+        decimate_mod.ratio = current_ratio
+        bpy.context.view_layer.update()
+    current_triangles = best_triangles
+
+    _add_to_log(f"DEBUG: adjust_decimation_to_target(): {evaluations} evaluations")
+    _add_to_log(f"Final decimation ratio: {current_ratio:.4f}, Triangles: {current_triangles}")
+
+    if cache_key is not None:
+        pipeline_cache.store_entry(cache_key, "decimation_ratio", {"ratio": current_ratio, "triangles": current_triangles})
 
-    print(f"Final decimation ratio: {current_ratio:.4f}, Triangles: {current_triangles}")
+    return current_ratio
 
 def enable_gpu_acceleration():
     # Enable GPU acceleration if available
@@ -1784,7 +3060,7 @@ def enable_gpu_acceleration():
     hip_devices = cycles_prefs.get_devices_for_type('HIP')
     
     if cuda_devices or optix_devices or hip_devices:
-        print("GPU acceleration available. Enabling GPU rendering.")
+        _add_to_log("GPU acceleration available. Enabling GPU rendering.")
         cycles_prefs.compute_device_type = 'CUDA' if cuda_devices else 'OPTIX' if optix_devices else 'HIP'
         bpy.context.scene.cycles.device = 'GPU'
         
@@ -1792,5 +3068,5 @@ def enable_gpu_acceleration():
         for device in cuda_devices + optix_devices + hip_devices:
             device.use = True
     else:
-        print("No GPU acceleration available. Using CPU.")
+        _add_to_log("No GPU acceleration available. Using CPU.")
         bpy.context.scene.cycles.device = 'CPU'
@@ -0,0 +1,53 @@
+""" Image Buffer Tools for Blender
+image_buffer_tools.py
+
+This module moves pixels between Blender images and float32 numpy buffers with pixels.foreach_get/foreach_set,
+so that reading or writing an image never builds a Python list of floats (ex: image.pixels[:]).  Buffers are
+(width * height, channels) float32 arrays, rows start at the bottom of the image like image.pixels.
+
+Requirements:
+    - Python 3.7+
+    - Blender 3.6+
+
+"""
+
+import numpy as np
+
+CHANNEL_NAMES = "RGBA"
+
+def get_buffer_shape(image):
+    return (image.size[0] * image.size[1], image.channels)
+
+# returns an uninitialized buffer for image, or buffer itself if it already has the right shape
+def new_image_buffer(image, buffer=None):
+    shape = get_buffer_shape(image)
+    if buffer is not None and buffer.shape == shape and buffer.dtype == np.float32:
+        return buffer
+    return np.empty(shape, dtype=np.float32)
+
+# read the pixels of image into a float32 buffer, reusing buffer when possible
+def read_image_buffer(image, buffer=None):
+    buffer = new_image_buffer(image, buffer)
+    image.pixels.foreach_get(buffer.ravel())
+    return buffer
+
+# write a float32 buffer back to the pixels of image
+def write_image_buffer(image, buffer):
+    shape = get_buffer_shape(image)
+    if buffer.shape != shape:
+        raise ValueError(f"Buffer shape {buffer.shape} does not match image {image.name}: {shape}")
+    image.pixels.foreach_set(np.ascontiguousarray(buffer, dtype=np.float32).ravel())
+    image.update()
+
+# returns {channel name: (N,) view into buffer} for the requested channels, no pixels are copied
+def unpack_channels(buffer, channel_names=CHANNEL_NAMES):
+    channels = {}
+    for channel_name in channel_names:
+        channels[channel_name] = buffer[:, CHANNEL_NAMES.index(channel_name)]
+    return channels
+
+# write {channel name: (N,) array or scalar} into the matching channels of buffer, returns buffer
+def pack_channels(buffer, channels):
+    for channel_name, values in channels.items():
+        buffer[:, CHANNEL_NAMES.index(channel_name)] = values
+    return buffer
@@ -0,0 +1,126 @@
+""" Log Tools module
+log_tools.py
+
+Buffered, leveled logging shared by the Blender conversion scripts and tool modules.  Every
+_add_to_log() routes here instead of opening and closing its log file for every message.
+
+- Lines are buffered per log file and appended in blocks.  Buffers are flushed when they are
+  full, after flush_interval seconds, on ERROR messages, at exit and on uncaught exceptions.
+- The level of a message comes from its prefix ("DEBUG:", "INFO:", "WARNING:", "ERROR:",
+  "EXCEPTION:"), messages without a prefix are INFO.  Messages below log_level are dropped,
+  ex: DAZTOROBLOX_LOG_LEVEL=INFO turns off all DEBUG output.
+- Structured mode (DAZTOROBLOX_LOG_STRUCTURED=1) writes one JSON record per line with the
+  time, elapsed seconds, level, current stage and object (see set_log_context) and message.
+
+Requirements:
+    - Python 3.7+
+
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+MESSAGE_PREFIXES = [("DEBUG", "DEBUG"), ("INFO", "INFO"), ("WARNING", "WARNING"), ("ERROR", "ERROR"), ("EXCEPTION", "ERROR")]
+
+log_level = LEVELS.get(os.environ.get("DAZTOROBLOX_LOG_LEVEL", "DEBUG").upper(), LEVELS["DEBUG"])
+structured_records = os.environ.get("DAZTOROBLOX_LOG_STRUCTURED", "0") not in ("", "0")
+flush_interval = 2.0
+buffer_max_lines = 500
+
+# log file used by modules without their own (ex: game_readiness_tools)
+default_log_filename = None
+
+log_context = {"stage": None, "object": None}
+start_time = time.perf_counter()
+log_lock = threading.RLock()
+
+
+class BufferedLogFile:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lines = []
+        self.last_flush_time = time.perf_counter()
+
+    def write(self, line, flush_now=False):
+        self.lines.append(line)
+        if (flush_now or len(self.lines) >= buffer_max_lines or
+            time.perf_counter() - self.last_flush_time >= flush_interval):
+            self.flush()
+
+    def flush(self):
+        self.last_flush_time = time.perf_counter()
+        if not self.lines:
+            return
+        try:
+            with open(self.file_path, "a") as file:
+                file.write("\n".join(self.lines) + "\n")
+        except Exception as e:
+            print("ERROR: log_tools: unable to write log file: " + self.file_path + ": " + str(e))
+        self.lines = []
+
+log_files = {}
+
+def get_log_file(log_filename):
+    # resolve now, the working directory can change before the buffer is flushed
+    file_path = os.path.abspath(log_filename)
+    log_file = log_files.get(file_path)
+    if log_file is None:
+        log_file = BufferedLogFile(file_path)
+        log_files[file_path] = log_file
+    return log_file
+
+def get_message_level(message):
+    for prefix, level in MESSAGE_PREFIXES:
+        if message[:len(prefix)].upper() == prefix:
+            return level
+    return "INFO"
+
+def set_log_context(stage=None, object_name=None):
+    log_context["stage"] = stage
+    log_context["object"] = object_name
+
+def log(message, log_filename=None, level=None):
+    message = str(message)
+    if level is None:
+        level = get_message_level(message)
+    if LEVELS[level] < log_level:
+        return
+    if log_filename is None:
+        log_filename = default_log_filename
+    if log_filename is None:
+        print(message)
+        return
+    if structured_records:
+        record = {
+            "time": round(time.time(), 3),
+            "elapsed": round(time.perf_counter() - start_time, 4),
+            "level": level,
+            "stage": log_context["stage"],
+            "object": log_context["object"],
+            "message": message,
+        }
+        line = json.dumps(record)
+    else:
+        line = message
+    with log_lock:
+        print(message)
+        get_log_file(log_filename).write(line, LEVELS[level] >= LEVELS["ERROR"])
+
+def flush_all():
+    with log_lock:
+        for log_file in log_files.values():
+            log_file.flush()
+
+atexit.register(flush_all)
+
+# flush before the traceback of an uncaught exception is printed
+_previous_excepthook = sys.excepthook
+def _flush_excepthook(exc_type, exc_value, exc_traceback):
+    flush_all()
+    _previous_excepthook(exc_type, exc_value, exc_traceback)
+sys.excepthook = _flush_excepthook
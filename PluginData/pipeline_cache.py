@@ -0,0 +1,233 @@
+""" Pipeline Cache module
+pipeline_cache.py
+
+Content-addressed cache for expensive intermediate results of the conversion scripts, so that
+re-exporting a character after a small change does not recompute every stage.
+
+- Keys are sha256 hashes of a stage name, the stage parameters and the input data (mesh arrays,
+  material settings, texture file contents), see make_key().  Different inputs never share a key,
+  so entries never have to be invalidated, only evicted.
+- Each entry is a folder <cache_folder>/<key[:2]>/<key> holding entry.json (small JSON data), numpy
+  arrays (.npy) and copied files (ex: baked atlas images).  Entries are written to a temporary
+  folder and renamed into place, so a crashed run never leaves a partial entry.
+- The cache is limited to max_cache_size bytes, least recently used entries are evicted first.
+
+Settings (environment variables):
+    DAZTOROBLOX_CACHE=0             disable the cache
+    DAZTOROBLOX_CACHE_FOLDER        cache folder, default: set by the conversion scripts
+    DAZTOROBLOX_CACHE_MAX_MB        cache size limit in MB, default: 2048
+
+Requirements:
+    - Python 3.7+
+    - numpy
+
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+import numpy as np
+
+import log_tools
+
+# bump when the format or meaning of cached data changes
+CACHE_VERSION = 1
+ENTRY_FILENAME = "entry.json"
+
+cache_enabled = os.environ.get("DAZTOROBLOX_CACHE", "1") not in ("", "0")
+environment_cache_folder = os.environ.get("DAZTOROBLOX_CACHE_FOLDER") or None
+cache_folder = environment_cache_folder
+max_cache_size = int(os.environ.get("DAZTOROBLOX_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# hits and misses per stage for this run
+cache_stats = {}
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage)
+
+
+def is_enabled():
+    return cache_enabled and cache_folder is not None
+
+# use folder unless a cache folder was set with DAZTOROBLOX_CACHE_FOLDER
+def set_default_cache_folder(folder):
+    global cache_folder
+    if environment_cache_folder is None:
+        cache_folder = folder.replace("\\","/")
+
+def _update_hash(hasher, value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        hasher.update(str((value.dtype.str, value.shape)).encode("utf-8"))
+        hasher.update(value.tobytes())
+    elif isinstance(value, bytes):
+        hasher.update(value)
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"[")
+        for item in value:
+            _update_hash(hasher, item)
+            hasher.update(b",")
+        hasher.update(b"]")
+    elif isinstance(value, dict):
+        hasher.update(b"{")
+        for dict_key in sorted(value, key=str):
+            _update_hash(hasher, str(dict_key))
+            hasher.update(b":")
+            _update_hash(hasher, value[dict_key])
+            hasher.update(b",")
+        hasher.update(b"}")
+    else:
+        hasher.update(repr(value).encode("utf-8"))
+
+# returns the hex key for stage, params (JSON-like) and input data (numpy arrays, bytes, strings, lists)
+def make_key(stage, params=None, *data):
+    hasher = hashlib.sha256()
+    _update_hash(hasher, (CACHE_VERSION, stage, params))
+    for value in data:
+        _update_hash(hasher, value)
+    return hasher.hexdigest()
+
+file_hashes = {}
+
+# sha256 of the contents of a file, memoized per (path, size, mtime) for this run
+def hash_file(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime)
+    file_hash = file_hashes.get(memo_key)
+    if file_hash is None:
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                hasher.update(block)
+        file_hash = hasher.hexdigest()
+        file_hashes[memo_key] = file_hash
+    return file_hash
+
+
+def get_entry_folder(key):
+    return os.path.join(cache_folder, key[:2], key)
+
+def _count(stage, result):
+    stage_stats = cache_stats.setdefault(stage, {"hit": 0, "miss": 0, "store": 0})
+    stage_stats[result] += 1
+
+# returns the entry dictionary for key (its "data" plus "folder"), or None on a miss
+def load_entry(key, stage=None):
+    if not is_enabled():
+        return None
+    entry_folder = get_entry_folder(key)
+    entry_path = os.path.join(entry_folder, ENTRY_FILENAME)
+    try:
+        with open(entry_path, "r") as file:
+            entry = json.load(file)
+        # the modification time of entry.json is the last access time used for eviction
+        os.utime(entry_path, None)
+    except (OSError, ValueError):
+        _count(stage or "unknown", "miss")
+        return None
+    entry["folder"] = entry_folder
+    _count(stage or entry.get("stage", "unknown"), "hit")
+    _add_to_log(f"DEBUG: pipeline_cache: hit for {stage or entry.get('stage')}: {key}")
+    return entry
+
+def load_array(entry, name):
+    return np.load(os.path.join(entry["folder"], name + ".npy"), allow_pickle=False)
+
+# copy the cached file name of entry to destination_path, returns False if it is missing
+def copy_file(entry, name, destination_path):
+    source_path = os.path.join(entry["folder"], name)
+    if not os.path.exists(source_path):
+        return False
+    shutil.copyfile(source_path, destination_path)
+    return True
+
+# store a new entry: data is JSON-like, arrays is {name: numpy array}, files is {name: source file path}
+def store_entry(key, stage, data=None, arrays=None, files=None):
+    if not is_enabled():
+        return False
+    entry_folder = get_entry_folder(key)
+    temp_folder = entry_folder + "." + uuid.uuid4().hex + ".tmp"
+    try:
+        os.makedirs(temp_folder)
+        for name, array in (arrays or {}).items():
+            np.save(os.path.join(temp_folder, name + ".npy"), np.asarray(array), allow_pickle=False)
+        for name, source_path in (files or {}).items():
+            shutil.copyfile(source_path, os.path.join(temp_folder, name))
+        entry = {"stage": stage, "created": time.time(), "data": data}
+        with open(os.path.join(temp_folder, ENTRY_FILENAME), "w") as file:
+            json.dump(entry, file)
+        if os.path.exists(entry_folder):
+            # same key, same content: stored by another process in the meantime
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        else:
+            os.rename(temp_folder, entry_folder)
+    except Exception as e:
+        _add_to_log(f"ERROR: pipeline_cache: unable to store {stage} entry {key}: {e}")
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        return False
+    _count(stage, "store")
+    evict()
+    return True
+
+
+def get_folder_size(folder):
+    size = 0
+    for root, dirs, files in os.walk(folder):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+# returns [(last access time, size, entry folder)] for all complete entries
+def list_entries():
+    entries = []
+    if not is_enabled() or not os.path.isdir(cache_folder):
+        return entries
+    for prefix in os.listdir(cache_folder):
+        prefix_folder = os.path.join(cache_folder, prefix)
+        if not os.path.isdir(prefix_folder):
+            continue
+        for key in os.listdir(prefix_folder):
+            entry_folder = os.path.join(prefix_folder, key)
+            try:
+                last_access = os.path.getmtime(os.path.join(entry_folder, ENTRY_FILENAME))
+            except OSError:
+                continue
+            entries.append((last_access, get_folder_size(entry_folder), entry_folder))
+    return entries
+
+# remove least recently used entries until the cache fits in max_size, returns the number removed
+def evict(max_size=None):
+    if max_size is None:
+        max_size = max_cache_size
+    entries = list_entries()
+    total_size = sum(size for _, size, _ in entries)
+    removed = 0
+    for last_access, size, entry_folder in sorted(entries):
+        if total_size <= max_size:
+            break
+        shutil.rmtree(entry_folder, ignore_errors=True)
+        total_size -= size
+        removed += 1
+    if removed > 0:
+        _add_to_log(f"DEBUG: pipeline_cache: evicted {removed} entries, cache size: {total_size} bytes")
+    return removed
+
+def clear_cache():
+    if cache_folder is not None and os.path.isdir(cache_folder):
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+def get_cache_stats():
+    return {stage: dict(stage_stats) for stage, stage_stats in cache_stats.items()}
+
+def reset_cache_stats():
+    cache_stats.clear()
@@ -16,21 +16,20 @@ REPOSITION_CAGES = True
 ADD_SHRINKWRAP = False
 USE_SHRINKWRAP_TARGET = False
 
-logFilename = "roblox_tools.log"
-
 import os
+import log_tools
 import mathutils
 from mathutils import Matrix
 from mathutils import Vector
 try:
     import bpy
+    import game_readiness_tools
 except:
     print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
 
 def _add_to_log(sMessage):
-    print(str(sMessage))
-    with open(logFilename, "a") as file:
-        file.write(sMessage + "\n")
+    # written to the log file of the running script (log_tools.default_log_filename)
+    log_tools.log(sMessage)
 
 template_file_name = "/Daz_Cage_Att_Template.blend"
 blend_file_path = script_dir + template_file_name
@@ -71,6 +70,39 @@ lookup_table = {
     'RightFoot_Att': 'RightFoot',
 }
 
+# When True (worker mode), template actions stay loaded with a fake user between conversions
+# and each conversion gets its own copy, so the template .blend is only read once per process.
+cache_template_actions = False
+template_action_cache = {}
+
+# returns action_name from animation_template_filename, loaded or copied from the template cache
+def load_template_action(animation_template_filename, action_name):
+    if not cache_template_actions:
+        with bpy.data.libraries.load(animation_template_filename, link=False) as (data_from, data_to):
+            data_to.actions = [name for name in data_from.actions if name == action_name]
+        return bpy.data.actions[action_name]
+
+    cache_key = (animation_template_filename, action_name)
+    template_action = template_action_cache.get(cache_key)
+    try:
+        if template_action is not None:
+            template_action.name
+    except ReferenceError:
+        # removed by a scene reset or file load
+        template_action = None
+    if template_action is None:
+        _add_to_log("DEBUG: load_template_action(): loading " + action_name + " from " + animation_template_filename)
+        with bpy.data.libraries.load(animation_template_filename, link=False) as (data_from, data_to):
+            data_to.actions = [name for name in data_from.actions if name == action_name]
+        template_action = data_to.actions[0]
+        template_action.name = action_name + "_Template"
+        template_action.use_fake_user = True
+        template_action_cache[cache_key] = template_action
+    action = template_action.copy()
+    action.use_fake_user = False
+    action.name = action_name
+    return action
+
 # Function to load objects from a .blend file
 def load_objects_from_blend(file_path, directory):
     return_list = set()
@@ -339,7 +371,7 @@ def bind_attachment_to_bone_inplace(obj):
 def relocalize_attachment(obj):
     if obj.name not in lookup_table:
         return
-    print("DEBUG: relocalizing :" + obj.name)
+    _add_to_log("DEBUG: relocalizing :" + obj.name)
 
     center = calculate_geometric_center(obj)
     # Decompose matrix for object's parent_bone
@@ -420,12 +452,10 @@ def copy_facs50_animations(animation_template_filename, head_geo_name='Head_Geo'
         animation_template_filename = _animation_template_filename
 
     # Load action from template file
-    with bpy.data.libraries.load(animation_template_filename, link=False) as (data_from, data_to):
-        data_to.actions = [name for name in data_from.actions if name == action_name]
+    action = load_template_action(animation_template_filename, action_name)
 
     # Asign loaded action to existing armature
     armature_object = bpy.data.objects[armature_name]
-    action = bpy.data.actions[action_name]
     armature_object.animation_data_create()  # Create animation data if not already present
     armature_object.animation_data.action = action
 
@@ -519,12 +549,10 @@ def copy_facial_animations(animation_template_filename):
         animation_template_filename = _animation_template_filename
 
     # Load action from template file
-    with bpy.data.libraries.load(animation_template_filename, link=False) as (data_from, data_to):
-        data_to.actions = [name for name in data_from.actions if name == action_name]
+    action = load_template_action(animation_template_filename, action_name)
 
     # Asign loaded action to existing armature
     armature_object = bpy.data.objects[armature_name]
-    action = bpy.data.actions[action_name]
     armature_object.animation_data_create()  # Create animation data if not already present
     armature_object.animation_data.action = action
 
@@ -572,7 +600,7 @@ def ugc_validation_fixes():
 
     # fix lowertorso
     bpy.ops.armature.select_all(action='DESELECT')
-    print("DEBUG: FIXING LowerTorso bone...")
+    _add_to_log("DEBUG: FIXING LowerTorso bone...")
     bpy.data.objects["Genesis9"].data.edit_bones["LowerTorso"].select = True
     old_z = bpy.data.objects["Genesis9"].data.edit_bones["LowerTorso"].head.z
     new_z = old_z - 0.1
@@ -580,7 +608,7 @@ def ugc_validation_fixes():
 
     # fix left hip
     bpy.ops.armature.select_all(action='DESELECT')
-    print("DEBUG: FIXING LeftUpperLeg bone...")
+    _add_to_log("DEBUG: FIXING LeftUpperLeg bone...")
     bpy.data.objects["Genesis9"].data.edit_bones["LeftUpperLeg"].select = True
     old_z = bpy.data.objects["Genesis9"].data.edit_bones["LeftUpperLeg"].head.z
     new_z = old_z - 0.05
@@ -590,7 +618,7 @@ def ugc_validation_fixes():
 
     # fix right hip
     bpy.ops.armature.select_all(action='DESELECT')
-    print("DEBUG: FIXING RightUpperLeg bone...")
+    _add_to_log("DEBUG: FIXING RightUpperLeg bone...")
     bpy.data.objects["Genesis9"].data.edit_bones["RightUpperLeg"].select = True
     old_z = bpy.data.objects["Genesis9"].data.edit_bones["RightUpperLeg"].head.z
     new_z = old_z - 0.05
@@ -600,7 +628,7 @@ def ugc_validation_fixes():
 
     # fix head
     bpy.ops.armature.select_all(action='DESELECT')
-    print("DEBUG: FIXING Head bone...")
+    _add_to_log("DEBUG: FIXING Head bone...")
     bpy.data.objects["Genesis9"].data.edit_bones["Head"].select = True
     old_z = bpy.data.objects["Genesis9"].data.edit_bones["Head"].head.z
     tail_z = bpy.data.objects["Genesis9"].data.edit_bones["UpperTorso"].tail.z
@@ -664,11 +692,11 @@ def make_inner_cage(target_obj_name):
             target_obj = obj
             break
     if target_obj is None:
-        print("ERROR: make_inner_cage(): target_obj not found.")
+        _add_to_log("ERROR: make_inner_cage(): target_obj not found.")
         return None
     inner_cage_obj = make_complete_cage()
     if inner_cage_obj is None:
-        print("ERROR: make_inner_cage(): inner_cage not found.")
+        _add_to_log("ERROR: make_inner_cage(): inner_cage not found.")
         return None
     # apply shrinkwrap modifier to inner_cage_obj
     bpy.ops.object.select_all(action='DESELECT')
@@ -686,27 +714,14 @@ def make_inner_cage(target_obj_name):
 
 
 def make_custom_cage(obj):
-    vertex_group_names = []
-    vertex_group_vertices = {}
     inner_cage_obj_list = []
     outer_cage_obj_list = []
     # num_vert_threshold = len(obj.data.vertices) * 0.05
     num_vert_threshold = 4
     weight_threshold = 0.75
     # get list of names of all vertex groups that are not empty
-    for vertex in obj.data.vertices:
-        for group in vertex.groups:
-            if group.weight > weight_threshold:
-                vg_name = obj.vertex_groups[group.group].name
-                if vg_name not in vertex_group_vertices.keys():
-                    vertex_group_vertices[vg_name] = 1
-                else:
-                    vertex_group_vertices[vg_name] += 1
-                if (vertex_group_vertices[vg_name] > num_vert_threshold):
-                    if vg_name not in vertex_group_names:
-                        vertex_group_names.append(vg_name)
-        if len(vertex_group_names) == len(obj.vertex_groups):
-            break
+    vertex_group_weights = game_readiness_tools.VertexGroupWeights(obj)
+    vertex_group_names = vertex_group_weights.get_groups_over_count(num_vert_threshold, weight_threshold, inclusive=False)
 
     for name in vertex_group_names:
         # get cage name
@@ -765,7 +780,7 @@ def duplicate_cage(cage_name):
             cage_obj = obj
             break
     if cage_obj is None:
-        print("ERROR: duplicate_cage(): cage name not found: " + cage_name)
+        _add_to_log("ERROR: duplicate_cage(): cage name not found: " + cage_name)
         return None
     bpy.ops.object.select_all(action='DESELECT')
     cage_obj.select_set(True)
@@ -0,0 +1,342 @@
+""" Texture Tools module
+texture_tools.py
+
+Texture preparation for the conversion scripts: source textures that are larger than the resolution
+the conversion needs are replaced by downscaled variants before they are loaded into Blender, so that
+4K Daz textures are not decoded, baked from and packed at full resolution for a 1024 atlas.
+
+- The needed resolution of each texture map comes from the DTU: the target texture size, divided by
+  the Horizontal/Vertical Tiles of the materials using it (a tiled texture repeats, so each tile gets
+  fewer atlas pixels).  Textures are only ever scaled down, never below min_texture_size.
+- Variants are written to a cache folder as <source content hash>_<width>x<height>.<ext>, so a
+  variant is reused as long as the source file content and the needed size do not change.
+- Resizing uses OpenImageIO (bundled with Blender 3.5+) or PIL in a thread pool, and falls back
+  to bpy (image.scale, one texture at a time in the calling thread) when neither is available.
+
+Texture prefetch (prefetch_textures): all texture files referenced by a DTU are probed once in a thread
+pool (existence, size, PNG/JPEG header dimensions and channels) and read to warm the OS page cache
+before Blender loads them one by one.  The resulting manifest replaces the filesystem checks of
+process_material and the missing image cleanup (see blender_tools.texture_file_exists).
+
+Requirements:
+    - Python 3.7+
+    - OpenImageIO, PIL or bpy
+
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import log_tools
+import pipeline_cache
+
+try:
+    import OpenImageIO as oiio
+except:
+    oiio = None
+try:
+    from PIL import Image
+except:
+    Image = None
+try:
+    import bpy
+except:
+    bpy = None
+
+min_texture_size = 256
+jpeg_quality = 95
+# DTU material properties with a texture map
+texture_property_names = ["Diffuse Color", "Metallic Weight", "Dual Lobe Specular Weight", "Dual Lobe Specular Reflectivity",
+                          "Specular Lobe 1 Roughness", "Glossy Layered Weight", "Glossy Reflectivity", "Glossy Roughness",
+                          "Emission Color", "Normal Map", "Cutout Opacity", "Opacity Strength"]
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage)
+
+
+# returns the texture paths of the texture maps of a DTU material
+def get_material_texture_paths(mat):
+    texture_paths = []
+    for property in mat.get("Properties", []):
+        if property.get("Name") in texture_property_names and property.get("Texture"):
+            texture_paths.append(property["Texture"])
+    return texture_paths
+
+# returns {texture path: needed size in pixels} for all texture maps of the DTU materials
+def get_texture_requirements(dtu_dict, target_size):
+    requirements = {}
+    for mat in dtu_dict.get("Materials", []):
+        tiles = 1.0
+        for property in mat.get("Properties", []):
+            if property.get("Name") in ["Horizontal Tiles", "Vertical Tiles"]:
+                try:
+                    tiles = max(tiles, float(property["Value"]))
+                except (TypeError, ValueError):
+                    pass
+        texture_paths = get_material_texture_paths(mat)
+        needed_size = max(min_texture_size, int(round(target_size / tiles)))
+        for texture_path in texture_paths:
+            requirements[texture_path] = max(requirements.get(texture_path, 0), needed_size)
+    return requirements
+
+# returns (width, height) of an image file without decoding it, or None if no reader is available
+def get_image_size(image_path):
+    if oiio is not None:
+        image_input = oiio.ImageInput.open(image_path)
+        if image_input is not None:
+            spec = image_input.spec()
+            image_input.close()
+            return (spec.width, spec.height)
+    if Image is not None:
+        try:
+            with Image.open(image_path) as image:
+                return image.size
+        except Exception:
+            pass
+    # PNG and JPEG headers can be read without a library
+    record = probe_texture(image_path, warm_page_cache=False)
+    if record["width"] is not None:
+        return (record["width"], record["height"])
+    return None
+
+# size of the variant for a source of source_size that needs needed_size pixels, None if no resize is needed
+def get_variant_size(source_size, needed_size):
+    width, height = source_size
+    if max(width, height) <= needed_size:
+        return None
+    scale = needed_size / max(width, height)
+    return (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+
+def get_variant_extension(image_path):
+    extension = os.path.splitext(image_path)[1].lower()
+    if extension in [".jpg", ".jpeg", ".png"]:
+        return extension
+    return ".png"
+
+def get_variant_path(texture_path, variant_size, cache_folder):
+    file_name = f"{pipeline_cache.hash_file(texture_path)}_{variant_size[0]}x{variant_size[1]}{get_variant_extension(texture_path)}"
+    return os.path.join(cache_folder, file_name).replace("\\","/")
+
+def resize_image_oiio(source_path, destination_path, size):
+    image_buffer = oiio.ImageBuf(source_path)
+    spec = image_buffer.spec()
+    roi = oiio.ROI(0, size[0], 0, size[1], 0, 1, 0, spec.nchannels)
+    resized_buffer = oiio.ImageBufAlgo.resize(image_buffer, roi=roi)
+    if destination_path.lower().endswith((".jpg", ".jpeg")):
+        resized_buffer.specmod().attribute("Compression", f"jpeg:{jpeg_quality}")
+    if not resized_buffer.write(destination_path):
+        raise RuntimeError(resized_buffer.geterror())
+
+def resize_image_pil(source_path, destination_path, size):
+    resampling = getattr(Image, "Resampling", Image)
+    with Image.open(source_path) as image:
+        if image.mode not in ["RGB", "RGBA", "L", "LA"]:
+            # 16 bit and float images
+            raise RuntimeError("unsupported image mode: " + image.mode)
+        resized_image = image.resize(size, resampling.LANCZOS)
+        if destination_path.lower().endswith((".jpg", ".jpeg")):
+            if resized_image.mode in ["RGBA", "LA"]:
+                resized_image = resized_image.convert("RGB")
+            resized_image.save(destination_path, "JPEG", quality=jpeg_quality)
+        else:
+            resized_image.save(destination_path, "PNG")
+
+# not thread safe, only call from the main thread
+def resize_image_bpy(source_path, destination_path, size):
+    image = bpy.data.images.load(source_path)
+    try:
+        image.scale(size[0], size[1])
+        image.filepath_raw = destination_path
+        image.file_format = 'JPEG' if destination_path.lower().endswith((".jpg", ".jpeg")) else 'PNG'
+        image.save()
+    finally:
+        bpy.data.images.remove(image)
+
+# resize source_path into the variant path, written to a temporary file first so that other processes
+# never see a partial variant.  Returns the name of the backend used, None if no backend could resize it.
+def write_variant(source_path, variant_path, size, use_bpy=False):
+    temp_path = os.path.splitext(variant_path)[0] + "." + uuid.uuid4().hex + ".tmp" + get_variant_extension(variant_path)
+    if use_bpy:
+        backends = [("bpy", resize_image_bpy)] if bpy is not None else []
+    else:
+        backends = [(name, function) for name, function, module in [("oiio", resize_image_oiio, oiio), ("pil", resize_image_pil, Image)] if module is not None]
+    for backend_name, resize_function in backends:
+        try:
+            resize_function(source_path, temp_path, size)
+            os.replace(temp_path, variant_path)
+            return backend_name
+        except Exception as e:
+            _add_to_log(f"DEBUG: write_variant(): {backend_name} unable to resize {source_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return None
+
+# returns (texture path, variant path or None) for one texture, runs in a worker thread
+def prepare_texture(texture_path, needed_size, cache_folder):
+    if not os.path.isfile(texture_path):
+        return texture_path, None
+    source_size = get_image_size(texture_path)
+    if source_size is None:
+        # no reader outside of bpy, resized in the calling thread
+        return texture_path, "bpy"
+    variant_size = get_variant_size(source_size, needed_size)
+    if variant_size is None:
+        return texture_path, None
+    variant_path = get_variant_path(texture_path, variant_size, cache_folder)
+    if os.path.exists(variant_path):
+        return texture_path, variant_path
+    backend_name = write_variant(texture_path, variant_path, variant_size)
+    if backend_name is None:
+        return texture_path, "bpy"
+    _add_to_log(f"DEBUG: prepare_texture(): {texture_path} {source_size[0]}x{source_size[1]} -> {variant_size[0]}x{variant_size[1]} ({backend_name})")
+    return texture_path, variant_path
+
+# prepare_texture() for textures without an oiio/PIL reader, in the calling thread with bpy
+def prepare_texture_bpy(texture_path, needed_size, cache_folder):
+    if bpy is None:
+        return None
+    image = bpy.data.images.load(texture_path)
+    source_size = (image.size[0], image.size[1])
+    bpy.data.images.remove(image)
+    variant_size = get_variant_size(source_size, needed_size)
+    if variant_size is None:
+        return None
+    variant_path = get_variant_path(texture_path, variant_size, cache_folder)
+    if not os.path.exists(variant_path) and write_variant(texture_path, variant_path, variant_size, use_bpy=True) is None:
+        return None
+    _add_to_log(f"DEBUG: prepare_texture_bpy(): {texture_path} {source_size[0]}x{source_size[1]} -> {variant_size[0]}x{variant_size[1]}")
+    return variant_path
+
+# Write downscaled variants of the DTU textures that are larger than needed for target_size.
+# Returns {texture path: variant path} for process_dtu(texture_variants=...).
+def prepare_textures(dtu_dict, target_size, cache_folder, max_workers=None):
+    requirements = get_texture_requirements(dtu_dict, target_size)
+    if not requirements:
+        return {}
+    os.makedirs(cache_folder, exist_ok=True)
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    texture_variants = {}
+    bpy_textures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(prepare_texture, texture_path, needed_size, cache_folder) for texture_path, needed_size in requirements.items()]
+        for future in futures:
+            try:
+                texture_path, variant_path = future.result()
+            except Exception as e:
+                _add_to_log(f"ERROR: prepare_textures(): {e}")
+                continue
+            if variant_path == "bpy":
+                bpy_textures.append(texture_path)
+            elif variant_path is not None:
+                texture_variants[texture_path] = variant_path
+    for texture_path in bpy_textures:
+        try:
+            variant_path = prepare_texture_bpy(texture_path, requirements[texture_path], cache_folder)
+        except Exception as e:
+            _add_to_log(f"ERROR: prepare_textures(): unable to resize {texture_path}: {e}")
+            continue
+        if variant_path is not None:
+            texture_variants[texture_path] = variant_path
+    _add_to_log(f"DEBUG: prepare_textures(): {len(texture_variants)} of {len(requirements)} textures replaced by variants for texture size {target_size}")
+    return texture_variants
+
+
+# Texture prefetch
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color type: channels
+png_color_type_channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+prefetch_block_size = 1024 * 1024
+
+# returns (width, height, channels) from the IHDR chunk, or None
+def read_png_header(file):
+    data = file.read(26)
+    if len(data) < 26 or data[:8] != PNG_SIGNATURE or data[12:16] != b"IHDR":
+        return None
+    width = int.from_bytes(data[16:20], "big")
+    height = int.from_bytes(data[20:24], "big")
+    return width, height, png_color_type_channels.get(data[25])
+
+# returns (width, height, channels) from the first SOF segment, or None
+def read_jpeg_header(file):
+    if file.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        byte = file.read(1)
+        while byte and byte != b"\xff":
+            byte = file.read(1)
+        # fill bytes
+        while byte == b"\xff":
+            byte = file.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # markers without a segment
+            continue
+        if marker in [0xD9, 0xDA]:
+            # end of image or start of scan before any frame header
+            return None
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = int.from_bytes(length_bytes, "big")
+        if 0xC0 <= marker <= 0xCF and marker not in [0xC4, 0xC8, 0xCC]:
+            data = file.read(6)
+            if len(data) < 6:
+                return None
+            return int.from_bytes(data[3:5], "big"), int.from_bytes(data[1:3], "big"), data[5]
+        file.seek(length - 2, 1)
+
+def get_manifest_key(file_path):
+    return os.path.normcase(os.path.abspath(file_path))
+
+# manifest record of one texture file, runs in a worker thread
+def probe_texture(texture_path, warm_page_cache=True):
+    record = {"path": texture_path, "exists": False, "file_size": None, "mtime": None,
+              "format": None, "width": None, "height": None, "channels": None}
+    try:
+        stat = os.stat(texture_path)
+    except OSError:
+        return record
+    record.update({"exists": True, "file_size": stat.st_size, "mtime": stat.st_mtime})
+    if not os.path.isfile(texture_path):
+        return record
+    try:
+        with open(texture_path, "rb") as file:
+            header = None
+            signature = file.read(8)
+            file.seek(0)
+            if signature == PNG_SIGNATURE:
+                record["format"] = "PNG"
+                header = read_png_header(file)
+            elif signature[:2] == b"\xff\xd8":
+                record["format"] = "JPEG"
+                header = read_jpeg_header(file)
+            if header is not None:
+                record["width"], record["height"], record["channels"] = header
+            if warm_page_cache:
+                file.seek(0)
+                while file.read(prefetch_block_size):
+                    pass
+    except OSError as e:
+        _add_to_log(f"ERROR: probe_texture(): unable to read {texture_path}: {e}")
+    return record
+
+# Probe all texture_paths concurrently, returns the manifest {get_manifest_key(path): record}
+def prefetch_textures(texture_paths, max_workers=None, warm_page_cache=True):
+    unique_paths = list(dict.fromkeys(texture_paths))
+    if not unique_paths:
+        return {}
+    if max_workers is None:
+        max_workers = min(16, (os.cpu_count() or 1) * 2)
+    manifest = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for record in executor.map(lambda texture_path: probe_texture(texture_path, warm_page_cache), unique_paths):
+            manifest[get_manifest_key(record["path"])] = record
+    num_found = sum(1 for record in manifest.values() if record["exists"])
+    total_bytes = sum(record["file_size"] or 0 for record in manifest.values())
+    _add_to_log(f"DEBUG: prefetch_textures(): {num_found} of {len(manifest)} texture files found, {total_bytes} bytes")
+    return manifest
@@ -0,0 +1,147 @@
+"""
+vertex_index_store.py
+
+This module stores the vertex index lists used by game_readiness_tools.py (ex: game_readiness_roblox_data.py)
+in a compact binary form, so they do not have to be parsed and compiled as Python source on every run.
+
+A store is a pair of files sharing a base path:
+    <base>.bin          all vertex indices, little-endian uint32, one group after another
+    <base>_index.json   {"version": 1, "groups": {name: [offset, count]}, "lists": {name: [strings]}}
+
+The .bin file is memory-mapped on first access and each group is returned as a view into it.
+
+USAGE (convert python data files):
+    python vertex_index_store.py <python data file> [<output base path>]
+
+EXAMPLE:
+    python vertex_index_store.py game_readiness_roblox_data.py
+    python vertex_index_store.py ../InternalAssets/G9_nocrack_roblox_python_data.py
+
+Requirements:
+    - Python 3.7+
+    - Blender 3.6+ (or numpy) for memory-mapped loading
+
+"""
+
+import os
+import sys
+import json
+import ast
+from array import array
+
+try:
+    import numpy as np
+except:
+    np = None
+
+STORE_VERSION = 1
+INDEX_POSTFIX = "_index.json"
+BINARY_EXTENSION = ".bin"
+
+class VertexIndexStore:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.binary_path = base_path + BINARY_EXTENSION
+        with open(base_path + INDEX_POSTFIX, "r") as file:
+            index = json.load(file)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported vertex index store version: {index.get('version')} ({base_path})")
+        self.groups = index["groups"]
+        self.lists = index.get("lists", {})
+        self.buffer = None
+
+    def __contains__(self, group_name):
+        return group_name in self.groups
+
+    def get_group_names(self):
+        return list(self.groups.keys())
+
+    def get_name_list(self, list_name):
+        return list(self.lists[list_name])
+
+    # returns the vertex indices of group_name, as a read-only uint32 array view when numpy is available
+    def get_vertex_indices(self, group_name):
+        offset, count = self.groups[group_name]
+        if np is not None:
+            if self.buffer is None:
+                if os.path.getsize(self.binary_path) == 0:
+                    self.buffer = np.zeros(0, dtype="<u4")
+                else:
+                    self.buffer = np.memmap(self.binary_path, dtype="<u4", mode="r")
+            return self.buffer[offset:offset + count]
+        # fallback without numpy: read only this group from the file
+        vertex_indices = array("I")
+        with open(self.binary_path, "rb") as file:
+            file.seek(offset * 4)
+            vertex_indices.fromfile(file, count)
+        if sys.byteorder != "little":
+            vertex_indices.byteswap()
+        return vertex_indices
+
+    def __getitem__(self, group_name):
+        return self.get_vertex_indices(group_name)
+
+
+loaded_stores = {}
+
+# returns the store at base_path, each store is only opened once per process
+def load_vertex_index_store(base_path):
+    base_path = os.path.abspath(base_path)
+    store = loaded_stores.get(base_path)
+    if store is None:
+        store = VertexIndexStore(base_path)
+        loaded_stores[base_path] = store
+    return store
+
+
+# reads a python data file of "name = [...]" literal assignments without executing it
+def read_python_data_file(python_data_path):
+    with open(python_data_path, "r") as file:
+        tree = ast.parse(file.read(), filename=python_data_path)
+    groups = {}
+    lists = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            continue
+        if not isinstance(node.value, (ast.List, ast.Tuple)):
+            continue
+        try:
+            value = ast.literal_eval(node.value)
+        except ValueError:
+            continue
+        name = node.targets[0].id
+        if all(isinstance(item, int) for item in value):
+            groups[name] = value
+        elif all(isinstance(item, str) for item in value):
+            lists[name] = value
+    return groups, lists
+
+def write_vertex_index_store(base_path, groups, lists=None):
+    index = {"version": STORE_VERSION, "groups": {}, "lists": lists or {}}
+    buffer = array("I")
+    for group_name, vertex_indices in groups.items():
+        index["groups"][group_name] = [len(buffer), len(vertex_indices)]
+        buffer.extend(vertex_indices)
+    if sys.byteorder != "little":
+        buffer.byteswap()
+    with open(base_path + BINARY_EXTENSION, "wb") as file:
+        buffer.tofile(file)
+    with open(base_path + INDEX_POSTFIX, "w") as file:
+        json.dump(index, file)
+    loaded_stores.pop(os.path.abspath(base_path), None)
+
+# converts a python data file to a store, by default next to it with the same base name
+def convert_python_data_file(python_data_path, output_base_path=None):
+    if output_base_path is None:
+        output_base_path = os.path.splitext(python_data_path)[0]
+    groups, lists = read_python_data_file(python_data_path)
+    write_vertex_index_store(output_base_path, groups, lists)
+    print(f"DEBUG: convert_python_data_file(): {python_data_path} => {output_base_path}{BINARY_EXTENSION}, groups={len(groups)}, lists={len(lists)}")
+    return output_base_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("\nUSAGE: python vertex_index_store.py <python data file> [<output base path>]\n")
+        sys.exit(1)
+    convert_python_data_file(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
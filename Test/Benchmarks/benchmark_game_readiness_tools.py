@@ -0,0 +1,423 @@
+"""Benchmark game_readiness_tools
+
+This is a command-line script for Blender that times the game readiness functions used by
+the conversion scripts on procedural meshes, so that speedups and regressions can be
+compared between commits.  It does not need Daz Studio, an export or any asset files.
+
+- Procedural meshes: subdivided body-like capsules (with Head/UpperTorso/LowerTorso vertex
+  groups), shell garments and cages around them, and hair cards.  Mesh density is set by the
+  size presets in mesh_sizes, random parts use a fixed seed.
+- Every run of a benchmark builds fresh meshes, only the call itself is timed.
+- The pipeline cache is turned off, so every run recomputes.
+- Results (per benchmark and size: vertex/face counts, all run times, min and median) are
+  written to a JSON file together with the Blender version and git commit.
+
+USAGE: blender --background --factory-startup --python benchmark_game_readiness_tools.py -- [--sizes small,medium,large]
+           [--benchmarks name,...] [--repeat N] [--output <json file>]
+       python benchmark_game_readiness_tools.py --compare <baseline json> <json>
+
+EXAMPLE:
+
+    blender --background --factory-startup --python Test/Benchmarks/benchmark_game_readiness_tools.py -- --sizes small,medium --output before.json
+    python Test/Benchmarks/benchmark_game_readiness_tools.py --compare before.json after.json
+
+"""
+
+logFilename = "benchmark_game_readiness_tools.log"
+
+## Do not modify below
+def _print_usage():
+    print("\nUSAGE: blender --background --factory-startup --python benchmark_game_readiness_tools.py -- [--sizes small,medium,large] [--benchmarks name,...] [--repeat N] [--output <json file>]")
+    print("       python benchmark_game_readiness_tools.py --compare <baseline json> <json>\n")
+
+from pathlib import Path
+script_dir = str(Path( __file__ ).parent.absolute())
+plugin_data_dir = str(Path( __file__ ).parent.parent.parent.joinpath("PluginData").absolute())
+
+import sys
+import os
+import json
+import time
+import platform
+import tempfile
+import subprocess
+import statistics
+try:
+    import bpy
+    import numpy as np
+except:
+    print("DEBUG: blender python libraries not detected, continuing for pydoc mode.")
+
+sys.path.append(plugin_data_dir)
+import log_tools
+try:
+    import game_readiness_tools
+except:
+    # --compare does not need blender
+    pass
+
+RANDOM_SEED = 1234
+
+# rings and segments of the capsule/shell grids, number of hair cards, atlas size
+mesh_sizes = {
+    "small": {"rings": 24, "segments": 32, "hair_cards": 300, "atlas_size": 512},
+    "medium": {"rings": 64, "segments": 96, "hair_cards": 1500, "atlas_size": 1024},
+    "large": {"rings": 160, "segments": 192, "hair_cards": 6000, "atlas_size": 2048},
+}
+
+BODY_RADIUS = 0.15
+BODY_HEIGHT = 0.9
+# vertex group bands along z: (name, z min, z max)
+body_group_bands = [("LowerTorso", -10.0, -0.15), ("UpperTorso", -0.15, 0.35), ("Head", 0.35, 10.0)]
+
+
+def _add_to_log(sMessage):
+    log_tools.log(sMessage, logFilename)
+
+
+# Procedural meshes
+
+# Mesh object from a (rings, segments, 3) grid of positions closed around each ring.  With cap_poles,
+# the first and last rings are closed with triangle fans.  UVs are the normalized grid coordinates.
+def make_grid_object(name, grid, cap_poles=False):
+    num_rings, num_segments, _ = grid.shape
+    verts = grid.reshape((-1, 3))
+    ring_index = np.arange(num_rings - 1)[:, None]
+    segment_index = np.arange(num_segments)[None, :]
+    next_segment = (segment_index + 1) % num_segments
+    quads = np.stack([ring_index * num_segments + segment_index,
+                      ring_index * num_segments + next_segment,
+                      (ring_index + 1) * num_segments + next_segment,
+                      (ring_index + 1) * num_segments + segment_index], axis=-1).reshape((-1, 4))
+    faces = quads.tolist()
+    vertex_uvs = np.stack(np.meshgrid(np.arange(num_segments) / num_segments,
+                                      np.arange(num_rings) / max(num_rings - 1, 1)), axis=-1).reshape((-1, 2))
+    if cap_poles:
+        bottom_pole = len(verts)
+        top_pole = bottom_pole + 1
+        top_ring = (num_rings - 1) * num_segments
+        segments = np.arange(num_segments)
+        faces += np.stack([np.full(num_segments, bottom_pole), (segments + 1) % num_segments, segments], axis=-1).tolist()
+        faces += np.stack([np.full(num_segments, top_pole), top_ring + segments, top_ring + (segments + 1) % num_segments], axis=-1).tolist()
+        poles = np.array([[0.0, 0.0, grid[0, :, 2].min() - BODY_RADIUS * 0.05], [0.0, 0.0, grid[-1, :, 2].max() + BODY_RADIUS * 0.05]])
+        verts = np.concatenate([verts, poles])
+        vertex_uvs = np.concatenate([vertex_uvs, [[0.5, 0.0], [0.5, 1.0]]])
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(verts.tolist(), [], faces)
+    mesh.update()
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", vertex_uvs[loop_verts].astype(np.float32).ravel())
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+# radius of the body capsule at height z, a little narrower at the neck
+def body_radius_at(z):
+    return BODY_RADIUS * (1.0 - 0.25 * np.exp(-((z - 0.35) / 0.05) ** 2))
+
+def make_body_capsule(name, size):
+    num_rings, num_segments = size["rings"], size["segments"]
+    # hemispherical ends around a cylinder, without the poles
+    phi = np.linspace(-np.pi / 2, np.pi / 2, num_rings + 2)[1:-1]
+    z = np.sin(phi) * BODY_RADIUS + np.sign(phi) * BODY_HEIGHT / 2
+    ring_radius = np.cos(phi) * body_radius_at(z)
+    theta = np.linspace(0, 2 * np.pi, num_segments, endpoint=False)
+    grid = np.stack([ring_radius[:, None] * np.cos(theta)[None, :],
+                     ring_radius[:, None] * np.sin(theta)[None, :] * 0.7,
+                     np.repeat(z[:, None], num_segments, axis=1)], axis=-1)
+    obj = make_grid_object(name, grid, cap_poles=True)
+    add_band_vertex_groups(obj)
+    return obj
+
+# open tube around the torso, offset from the body by radius_scale
+def make_shell(name, size, radius_scale=1.1, noise=0.004):
+    num_rings, num_segments = size["rings"], size["segments"]
+    rng = np.random.default_rng(RANDOM_SEED)
+    z = np.linspace(-BODY_HEIGHT / 2, 0.3, num_rings)
+    theta = np.linspace(0, 2 * np.pi, num_segments, endpoint=False)
+    ring_radius = body_radius_at(z)[:, None] * radius_scale + rng.uniform(-noise, noise, (num_rings, num_segments))
+    grid = np.stack([ring_radius * np.cos(theta)[None, :],
+                     ring_radius * np.sin(theta)[None, :] * 0.7,
+                     np.repeat(z[:, None], num_segments, axis=1)], axis=-1)
+    obj = make_grid_object(name, grid)
+    add_band_vertex_groups(obj)
+    return obj
+
+# hair cards: small quads scattered over the top of the head, facing outwards
+def make_hair_cards(name, size, card_width=0.02, card_length=0.08):
+    num_cards = size["hair_cards"]
+    rng = np.random.default_rng(RANDOM_SEED)
+    head_center = np.array([0.0, 0.0, BODY_HEIGHT / 2])
+    directions = rng.normal(size=(num_cards, 3))
+    directions[:, 2] = np.abs(directions[:, 2])
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    roots = head_center + directions * BODY_RADIUS * rng.uniform(1.0, 1.15, (num_cards, 1))
+    # card plane: along a random tangent, hanging down and outwards
+    tangents = np.cross(directions, rng.normal(size=(num_cards, 3)))
+    tangents /= np.linalg.norm(tangents, axis=1)[:, None]
+    hang = directions * 0.3 + np.array([0.0, 0.0, -1.0])
+    hang /= np.linalg.norm(hang, axis=1)[:, None]
+    corners = np.stack([roots - tangents * card_width / 2, roots + tangents * card_width / 2,
+                        roots + tangents * card_width / 2 + hang * card_length, roots - tangents * card_width / 2 + hang * card_length], axis=1)
+    faces = np.arange(num_cards * 4).reshape((-1, 4))
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(corners.reshape((-1, 3)).tolist(), [], faces.tolist())
+    mesh.update()
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    card_uvs = np.tile(np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32), (num_cards, 1))
+    uv_layer.data.foreach_set("uv", card_uvs.ravel())
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    obj["StudioPresentationType"] = "Hair"
+    return obj
+
+# band vertex groups (Head, UpperTorso, LowerTorso) plus matching _GeoGroup groups for separation
+def add_band_vertex_groups(obj):
+    z = game_readiness_tools.get_vertex_coordinates_array(obj.data)[:, 2]
+    for group_name, z_min, z_max in body_group_bands:
+        indices = np.flatnonzero((z >= z_min) & (z < z_max)).tolist()
+        for vertex_group_name in [group_name, group_name + "_GeoGroup"]:
+            vertex_group = obj.vertex_groups.new(name=vertex_group_name)
+            if indices:
+                vertex_group.add(indices, 1.0, 'REPLACE')
+
+# material with a generated image linked to the Principled BSDF base color
+def add_image_material(obj, name, color, image_size=256):
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    image = bpy.data.images.new(name + "_D", width=image_size, height=image_size)
+    image.generated_type = 'COLOR_GRID'
+    image.generated_color = color
+    image_node = nodes.new(type='ShaderNodeTexImage')
+    image_node.image = image
+    material.node_tree.links.new(image_node.outputs['Color'], nodes["Principled BSDF"].inputs['Base Color'])
+    obj.data.materials.append(material)
+    return material
+
+def join_objects(name, obj_list):
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in obj_list:
+        obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj_list[0]
+    bpy.ops.object.join()
+    joined = bpy.context.view_layer.objects.active
+    joined.name = name
+    return joined
+
+def set_active(obj):
+    bpy.ops.object.select_all(action='DESELECT')
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+
+def reset_scene():
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for data_collection in [bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images]:
+        for data_block in list(data_collection):
+            data_collection.remove(data_block, do_unlink=True)
+    game_readiness_tools.object_ray_casters.clear()
+
+
+# Benchmarks: setup(size) builds the scene and returns the arguments of run(), only run() is timed.
+# run() returns a dictionary of extra results (or None), reported with the timings.
+
+def setup_autofit_mesh(size):
+    body = make_body_capsule("Body", size)
+    cage = make_shell("Cage", size, radius_scale=1.35)
+    return {"source": cage, "target": body}
+
+def run_autofit_mesh(args):
+    report = game_readiness_tools.autofit_mesh(args["source"], args["target"])
+    if not report:
+        return None
+    return {"pass1_iterations": report["pass1"]["iterations"], "pass2_iterations": report["pass2"]["iterations"],
+            "converged": report["pass1"]["converged"], "tagged_verts": report["tagged_verts"]}
+
+def setup_remove_obscured_faces(size):
+    body = make_body_capsule("Body", size)
+    shell = make_shell("Shell", size)
+    obj = join_objects("BodyAndShell", [body, shell])
+    set_active(obj)
+    return {"obj": obj}
+
+def run_remove_obscured_faces(args):
+    removal_counts = game_readiness_tools.remove_obscured_faces(args["obj"])
+    return {"removed_faces": {str(threshold): count for threshold, count in (removal_counts or {}).items()}}
+
+def setup_scale_by_face_normals(size):
+    shell = make_shell("Shell", size)
+    set_active(shell)
+    return {"obj": shell}
+
+def run_scale_by_face_normals(args):
+    game_readiness_tools.scale_by_face_normals(args["obj"], 1.05)
+
+def setup_adjust_decimation_to_target(size):
+    body = make_body_capsule("Body", size)
+    set_active(body)
+    return {"obj": body, "target_triangles": game_readiness_tools.get_mesh_triangle_count(body.data) // 4}
+
+def run_adjust_decimation_to_target(args):
+    ratio = game_readiness_tools.adjust_decimation_to_target(args["obj"], args["target_triangles"])
+    return {"ratio": ratio, "target_triangles": args["target_triangles"]}
+
+def setup_adjust_decimation_hair_cards(size):
+    hair = make_hair_cards("Hair", size)
+    set_active(hair)
+    return {"obj": hair, "target_triangles": game_readiness_tools.get_mesh_triangle_count(hair.data) // 2}
+
+def setup_convert_to_atlas(size):
+    body = make_body_capsule("Body", size)
+    shell = make_shell("Shell", size)
+    add_image_material(body, "BodyMaterial", (0.8, 0.6, 0.5, 1.0))
+    add_image_material(shell, "ShellMaterial", (0.2, 0.3, 0.8, 1.0))
+    return {"obj_list": [body, shell], "atlas_size": size["atlas_size"], "output_folder": tempfile.mkdtemp(prefix="benchmark_atlas_")}
+
+def run_convert_to_atlas(args):
+    atlas, atlas_material, _ = game_readiness_tools.convert_to_atlas(args["obj_list"], args["output_folder"], args["atlas_size"], bake_quality=1)
+    return {"atlas_size": args["atlas_size"], "completed": atlas is not None}
+
+def setup_separate_by_vertexgroup(size):
+    body = make_body_capsule("Body", size)
+    set_active(body)
+    return {"obj": body}
+
+def run_separate_by_vertexgroup(args):
+    new_obj = game_readiness_tools.separate_by_vertexgroup(args["obj"], "Head_GeoGroup")
+    return {"separated_faces": len(new_obj.data.polygons) if new_obj is not None else 0}
+
+# name: (setup, run, object argument whose mesh size is reported)
+benchmarks = {
+    "autofit_mesh": (setup_autofit_mesh, run_autofit_mesh, "source"),
+    "remove_obscured_faces": (setup_remove_obscured_faces, run_remove_obscured_faces, "obj"),
+    "scale_by_face_normals": (setup_scale_by_face_normals, run_scale_by_face_normals, "obj"),
+    "adjust_decimation_to_target": (setup_adjust_decimation_to_target, run_adjust_decimation_to_target, "obj"),
+    "adjust_decimation_hair_cards": (setup_adjust_decimation_hair_cards, run_adjust_decimation_to_target, "obj"),
+    "convert_to_atlas": (setup_convert_to_atlas, run_convert_to_atlas, "obj_list"),
+    "separate_by_vertexgroup": (setup_separate_by_vertexgroup, run_separate_by_vertexgroup, "obj"),
+}
+
+
+def get_mesh_counts(obj_or_list):
+    if not isinstance(obj_or_list, list):
+        obj_or_list = [obj_or_list]
+    return (sum(len(obj.data.vertices) for obj in obj_or_list), sum(len(obj.data.polygons) for obj in obj_or_list))
+
+def run_benchmark(name, size_name, repeat):
+    setup, run, mesh_argument = benchmarks[name]
+    size = mesh_sizes[size_name]
+    result = {"benchmark": name, "size": size_name, "times": []}
+    for run_index in range(repeat):
+        reset_scene()
+        args = setup(size)
+        result["verts"], result["faces"] = get_mesh_counts(args[mesh_argument])
+        start_time = time.perf_counter()
+        try:
+            extra = run(args)
+        except Exception as e:
+            _add_to_log(f"ERROR: run_benchmark(): {name} ({size_name}): {e}")
+            result["error"] = str(e)
+            break
+        result["times"].append(time.perf_counter() - start_time)
+        if extra:
+            result.update(extra)
+    if result["times"]:
+        result["min"] = min(result["times"])
+        result["median"] = statistics.median(result["times"])
+        _add_to_log(f"DEBUG: {name} ({size_name}, {result['verts']} verts): min={result['min']:.4f}s, median={result['median']:.4f}s")
+    reset_scene()
+    return result
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=script_dir,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except Exception:
+        return None
+
+def run_benchmarks(benchmark_names, size_names, repeat):
+    game_readiness_tools.pipeline_cache.cache_enabled = False
+    results = {
+        "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": get_git_commit(),
+        "blender_version": bpy.app.version_string,
+        "numpy_version": np.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": [],
+    }
+    for name in benchmark_names:
+        for size_name in size_names:
+            results["results"].append(run_benchmark(name, size_name, repeat))
+    return results
+
+
+# print the median time of each benchmark in both files and the speedup of the second one
+def compare_results(baseline_path, results_path):
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)
+    with open(results_path, "r") as file:
+        results = json.load(file)
+    baseline_times = {(result["benchmark"], result["size"]): result.get("median") for result in baseline["results"]}
+    print(f"{'benchmark':<32}{'size':<8}{baseline.get('commit') or 'baseline':>12}{results.get('commit') or 'new':>12}{'speedup':>10}")
+    for result in results["results"]:
+        key = (result["benchmark"], result["size"])
+        baseline_time = baseline_times.get(key)
+        new_time = result.get("median")
+        if baseline_time is None or new_time is None:
+            print(f"{key[0]:<32}{key[1]:<8}{'-' if baseline_time is None else f'{baseline_time:.4f}':>12}{'-' if new_time is None else f'{new_time:.4f}':>12}{'-':>10}")
+            continue
+        speedup = baseline_time / new_time if new_time > 0 else float("inf")
+        print(f"{key[0]:<32}{key[1]:<8}{baseline_time:>12.4f}{new_time:>12.4f}{speedup:>9.2f}x")
+
+
+def _main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="benchmark_game_readiness_tools.py")
+    parser.add_argument("--sizes", default="small,medium", help="comma separated: " + ",".join(mesh_sizes))
+    parser.add_argument("--benchmarks", default=None, help="comma separated: " + ",".join(benchmarks))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="results JSON file")
+    parser.add_argument("--compare", nargs=2, default=None, metavar=("BASELINE", "RESULTS"))
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:
+        _print_usage()
+        return 1
+
+    if args.compare:
+        compare_results(*args.compare)
+        return 0
+
+    size_names = [size_name.strip() for size_name in args.sizes.split(",") if size_name.strip()]
+    benchmark_names = list(benchmarks)
+    if args.benchmarks:
+        benchmark_names = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    for name in benchmark_names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark: " + name)
+    for size_name in size_names:
+        if size_name not in mesh_sizes:
+            parser.error("unknown size: " + size_name)
+
+    output_path = args.output or f"benchmark_game_readiness_tools_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    results = run_benchmarks(benchmark_names, size_names, max(1, args.repeat))
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=2)
+    _add_to_log("DEBUG: results written to: " + output_path)
+    return 0
+
+
+# Execute main()
+if __name__=='__main__':
+    if "bpy" in sys.modules:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+        log_tools.default_log_filename = logFilename
+        _add_to_log("Starting script (benchmark)...\nDEBUG: sys.argv=" + str(sys.argv))
+    else:
+        argv = sys.argv[1:]
+    exit(_main(argv))